@@ -3,14 +3,37 @@ Flask 版本的 MQTT 監控應用程式
 替代 Streamlit，解決 Raspberry Pi 相容性問題
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request
 from flask_socketio import SocketIO
 import paho.mqtt.client as mqtt
-from datetime import datetime
-import json
 import threading
-import csv
+import time
 import os
+import hmac
+import math
+import itertools
+import atexit
+import signal
+import sys
+
+from broadcaster import SocketBroadcaster
+from payload_codec import decode_payload
+from pipeline import BoundedQueue, Stage, Pipeline
+from devices import DeviceRegistry, record_with_device
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from response_cache import ResponseCache
+from dedup import create_dedup
+from downsample import bucket_aggregate, lttb_indices
+from exporter import stream_export, EXPORT_FORMATS
+from rolling_stats import StatsRegistry
+from profiler import SamplingProfiler, AllocationTracer
+from snapshot import storage_signature, save_snapshot, load_snapshot
+from ring_buffer import (SensorRingBuffer, format_timestamp, parse_timestamp, to_record,
+                         decode_light, HAS_NUMPY)
+from storage import create_storage
+
+if HAS_NUMPY:
+    import numpy as np
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -18,126 +41,491 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # MQTT 設定
 MQTT_BROKER = "172.20.10.3"
 MQTT_PORT = 1883
-MQTT_TOPIC = "living_room/sensor"
+# 訂閱的主題（可使用 + / # 萬用字元，每個房間一個主題）
+MQTT_TOPICS = ["+/sensor", "+/感測器"]
+# 在程式內啟動 MQTT Broker（mqtt_broker.py，監聽 MQTT_PORT），不需要另外安裝 Mosquitto
+EMBEDDED_BROKER = False
+
+# 執行模式：'threading'（Werkzeug，每個連線一個執行緒）或
+# 'asyncio'（uvicorn + 事件迴圈，適合大量儀表板連線，需要 uvicorn 與 asgiref）
+RUNTIME = 'threading'
+
+# 歷史數據容量（以每秒一筆計算，保留三天）
+HISTORY_CAPACITY = 3 * 24 * 60 * 60
+# /api/history 預設回傳的筆數與上限
+HISTORY_API_ROWS = 100
+HISTORY_API_MAX_ROWS = 10000
+# 降採樣模式：'lttb'（保留原始點）或 'minmax'（時間分桶統計）
+DOWNSAMPLE_MODES = ('lttb', 'minmax')
 
-# 全域數據儲存
-sensor_data = []
-latest_data = {
+# 每台裝置保留的歷史筆數（裝置數量多時請調小）
+DEVICE_HISTORY_CAPACITY = 1000
+
+# 串流統計（/api/stats）：時間窗口秒數、每台裝置窗口內最多保留的筆數、EWMA 權重
+# 窗口滿時每台裝置約 70 KB
+STATS_WINDOW_SECONDS = 300
+STATS_WINDOW_SAMPLES = 300
+STATS_EWMA_ALPHA = 0.1
+# 所有裝置合併的統計窗口內最多保留的筆數
+STATS_OVERALL_WINDOW_SAMPLES = 10000
+# 啟動時以最近幾筆歷史數據建立所有裝置合併的統計
+STATS_SEED_ROWS = 3600
+
+# 全域數據儲存（所有裝置合併的歷史 + 各裝置的狀態索引 + 串流統計）
+sensor_data = SensorRingBuffer(HISTORY_CAPACITY)
+devices = DeviceRegistry(DEVICE_HISTORY_CAPACITY)
+sensor_stats = StatsRegistry(STATS_WINDOW_SECONDS, STATS_WINDOW_SAMPLES, STATS_EWMA_ALPHA,
+                             overall_window_samples=STATS_OVERALL_WINDOW_SAMPLES)
+EMPTY_DATA = {
     'light_status': '未知',
     'temperature': 0,
     'humidity': 0,
     'timestamp': None
 }
 mqtt_connected = False
+# 是否曾經連線成功過（之後的連線計入重新連線次數）
+mqtt_has_connected = False
+
+# 監控指標（/metrics），每個指標只在一個執行緒中更新
+metrics = MetricsRegistry()
+messages_received = metrics.counter(
+    'pico_mqtt_messages_received_total', 'MQTT 收到的訊息數', ['topic'])
+messages_parsed = metrics.counter(
+    'pico_mqtt_messages_parsed_total', '解析成功的訊息數', ['topic'])
+messages_failed = metrics.counter(
+    'pico_mqtt_messages_failed_total', '解析失敗的訊息數', ['topic'])
+messages_duplicate = metrics.counter(
+    'pico_mqtt_messages_duplicate_total', 'QoS 1 重送而丟棄的重複訊息數', ['topic'])
+mqtt_reconnects = metrics.counter(
+    'pico_mqtt_reconnects_total', 'MQTT 重新連線次數')
+mqtt_disconnects = metrics.counter(
+    'pico_mqtt_disconnects_total', 'MQTT 斷線次數')
+parse_seconds = metrics.histogram(
+    'pico_parse_seconds', '解析一則訊息的時間（秒）')
+storage_write_seconds = metrics.histogram(
+    'pico_storage_write_seconds', '儲存引擎寫入一批數據的時間（秒）')
+emit_seconds = metrics.histogram(
+    'pico_socketio_emit_seconds', '一次 WebSocket 推送的時間（秒）')
+ingest_latency_seconds = metrics.histogram(
+    'pico_ingest_latency_seconds', '從收到 MQTT 訊息到交給 WebSocket 推送的時間（秒）')
+
+# WebSocket 推送設定：每秒合併推送 10 次，每個客戶端最多 2 批等待確認
+BROADCAST_HZ = 10
+BROADCAST_MAX_INFLIGHT = 2
+BROADCAST_ACK_TIMEOUT = 5.0
+
+broadcaster = SocketBroadcaster(
+    socketio, 'new_data',
+    hz=BROADCAST_HZ,
+    max_inflight=BROADCAST_MAX_INFLIGHT,
+    ack_timeout=BROADCAST_ACK_TIMEOUT,
+    on_emit=lambda clients, seconds: emit_seconds.observe(seconds)
+)
+
+# 處理流水線的佇列：(容量, 佇列滿時的策略 'block' / 'drop_oldest' / 'spill')
+INGEST_QUEUE = (10000, 'spill')
+PERSIST_QUEUE = (10000, 'block')
+BROADCAST_QUEUE = (1000, 'drop_oldest')
+# 統計跟不上時略過最舊的數據，不拖慢解析與儲存
+STATS_QUEUE = (10000, 'drop_oldest')
+# spill 策略的暫存資料夾
+SPILL_DIR = 'spill'
+
+# QoS 1 重複訊息過濾：'lru'（準確）、'bloom'（固定且較少的記憶體，有誤判率）或 None（不過濾）
+# 依 (裝置, msg_id) 判斷，只有在時間窗口（秒）內重複才丟棄；沒有 msg_id 的訊息不過濾
+# 時間窗口只需要涵蓋 QoS 1 的重送（幾秒內）；裝置的 msg_id 倒退（重新開機、測試腳本重新執行）時重新計算
+DEDUP_MODE = 'lru'
+DEDUP_WINDOW_SECONDS = 10
+# lru 保存的 key 數 / bloom 每一代的 key 數（所有裝置共用）
+DEDUP_MAX_ENTRIES = 20000
+DEDUP_FALSE_POSITIVE = 0.001
+
+message_dedup = create_dedup(DEDUP_MODE, DEDUP_MAX_ENTRIES, DEDUP_WINDOW_SECONDS, DEDUP_FALSE_POSITIVE)
+
+# 回應快取：最多保留幾組查詢的序列化結果、小於多少位元組不壓縮
+RESPONSE_CACHE_ENTRIES = 64
+RESPONSE_COMPRESS_MIN_BYTES = 512
+
+response_cache = ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_COMPRESS_MIN_BYTES)
+
+# 匯出時每批從儲存引擎讀取的筆數
+EXPORT_CHUNK_ROWS = 10000
+
+# 除錯端點 /debug/*（CPU 分析、記憶體快照）的存取權杖，None 表示停用
+DEBUG_TOKEN = None
+# /debug/profile 最長的分析秒數
+PROFILE_MAX_SECONDS = 60
+# 以訊號觸發分析（kill -USR1 為 CPU 分析、kill -USR2 為記憶體快照）的結果資料夾與 CPU 分析秒數
+DEBUG_DIR = 'debug'
+PROFILE_SIGNAL_SECONDS = 30
+
+profiler = SamplingProfiler()
+allocation_tracer = AllocationTracer()
+
+# 本次啟動的識別碼，讓重新啟動前的 cursor 與 ETag 失效
+BOOT_ID = format(int(time.time()), 'x')
+
+# 儲存引擎：'csv'（sensor_data.csv）、'segment'（每天一個 mmap 二進位檔）
+# 'partitioned'（每台裝置每天一個 CSV，自動壓縮與刪除舊檔）或 'sqlite'（WAL 模式資料庫）
+STORAGE_ENGINE = 'csv'
 
 # CSV 檔案路徑
 CSV_FILE = 'sensor_data.csv'
+# segment 資料夾（STORAGE_ENGINE = 'segment' 時使用）
+SEGMENT_DIR = 'segments'
+# 分割檔資料夾（STORAGE_ENGINE = 'partitioned' 時使用）
+PARTITION_DIR = 'partitions'
+# 幾天前的分割檔壓縮、保留幾天（0 表示不壓縮 / 永久保留）、壓縮方式 'gzip' / 'zstd'
+PARTITION_COMPRESS_AFTER_DAYS = 2
+PARTITION_RETENTION_DAYS = 90
+PARTITION_COMPRESSION = 'gzip'
+# SQLite 資料庫檔案（STORAGE_ENGINE = 'sqlite' 時使用）
+SQLITE_FILE = 'sensor_data.db'
+# 批次寫入設定：累積 500 筆或 1 秒提交一次
+CSV_BATCH_ROWS = 500
+CSV_BATCH_SECONDS = 1.0
+# 等待寫入的筆數上限（寫入跟不上或儲存裝置故障時丟棄新的數據，記憶體不會無限增加）
+CSV_MAX_PENDING_ROWS = 100000
+# 每批提交方式：'none' / 'flush' / 'fsync'（使用預寫日誌時套用在日誌上）
+CSV_DURABILITY = 'fsync'
+# CSV 引擎的預寫日誌：每批先寫入日誌並 fsync 一次，斷電後啟動時重做（None 表示不使用）
+CSV_WAL_FILE = 'sensor_data.wal'
+# 啟動時是否完整掃描 CSV（預設只從檔案尾端讀取需要的筆數）
+CSV_FULL_SCAN = False
+# 熱啟動快照：正常關閉時把記憶體中的歷史與裝置狀態存成二進位檔，
+# 下次啟動直接載入（None 表示停用，每次都從儲存引擎載入）
+SNAPSHOT_FILE = 'state.snapshot'
 
-def load_from_csv():
-    """從 CSV 檔案載入歷史數據"""
-    global sensor_data
-    if os.path.exists(CSV_FILE):
+# 儲存引擎與 MQTT 客戶端在 create_app() 中建立
+storage = None
+mqtt_client = None
+
+def load_from_csv(limit=HISTORY_CAPACITY, full_scan=CSV_FULL_SCAN):
+    """
+    從儲存引擎載入歷史數據
+
+    Args:
+        limit: 最多載入的筆數
+        full_scan: True 時完整掃描整個 CSV，否則只從尾端讀取最後 limit 筆
+    """
+    if os.path.exists(storage.path):
         try:
-            with open(CSV_FILE, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                loaded_data = []
-                for row in reader:
-                    data_dict = {
-                        'timestamp': row['時間戳記'],
-                        'light_status': row['電燈狀態'],
-                        'temperature': float(row['溫度']),
-                        'humidity': float(row['濕度'])
-                    }
-                    loaded_data.append(data_dict)
-                
-                # 只保留最近 100 筆
-                sensor_data = loaded_data[-100:]
-                
-                # 更新最新數據
-                if sensor_data:
-                    global latest_data
-                    latest_data = sensor_data[-1].copy()
-                
-                print(f"✅ 已載入 {len(sensor_data)} 筆歷史數據")
+            # 環形緩衝區滿了會自動覆蓋最舊的數據
+            for row in storage.load_recent(limit, full_scan=full_scan):
+                sensor_data.append(*row)
+            
+            print(f"✅ 已載入 {len(sensor_data)} 筆歷史數據")
+            if storage.skipped:
+                print(f"⚠️  略過 {storage.skipped} 筆格式錯誤的數據")
         except Exception as e:
-            print(f"⚠️  載入 CSV 檔案時發生錯誤: {e}")
+            print(f"⚠️  載入歷史數據時發生錯誤: {e}")
 
-def save_to_csv(data):
-    """儲存數據到 CSV 檔案"""
-    file_exists = os.path.exists(CSV_FILE)
-    
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        fieldnames = ['時間戳記', '電燈狀態', '溫度', '濕度']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(data)
+def load_history():
+    """啟動時載入歷史數據：優先使用熱啟動快照，沒有或已過期時從儲存引擎載入"""
+    if SNAPSHOT_FILE:
+        started = time.perf_counter()
+        try:
+            if load_snapshot(SNAPSHOT_FILE, sensor_data, devices, storage_signature(storage.data_paths)):
+                print(f"⚡ 已從熱啟動快照載入 {len(sensor_data)} 筆歷史數據、{len(devices)} 台裝置"
+                      f"（{(time.perf_counter() - started) * 1000:.1f} ms）")
+                return
+        except (OSError, ValueError) as e:
+            print(f"⚠️  熱啟動快照無法使用（{e}），改從儲存引擎載入")
+    load_from_csv()
+
+def seed_stats():
+    """以記憶體中的歷史數據建立串流統計（之後每筆新數據各自更新）"""
+    started = time.perf_counter()
+    ts, temperature, humidity, _ = sensor_data.query_columns()
+    start = max(len(ts) - STATS_SEED_ROWS, 0)
+    sensor_stats.seed(None, (ts[start:], temperature[start:], humidity[start:]))
+    for name, state in list(devices.devices.items()):
+        sensor_stats.seed(name, state.history.query_columns()[:3])
+    print(f"📊 已建立串流統計（{len(ts) - start} 筆、{len(devices)} 台裝置，"
+          f"{(time.perf_counter() - started) * 1000:.1f} ms）")
+
+def save_to_csv(ts, temperature, humidity, light_status, device=None):
+    """儲存一筆數據（交給儲存引擎的背景寫入執行緒）"""
+    storage.append(ts, temperature, humidity, light_status, device)
+
+def disk_boundary(oldest, end):
+    """
+    早於環形緩衝區的部分才需要讀取磁碟
+
+    CSV 與分割檔只保存到整秒，緩衝區則是 time.time() 的小數秒，兩邊無法逐筆對應；
+    因此最舊一筆所在的那一秒整秒交給緩衝區，磁碟只查詢到這一秒之前。
+
+    Returns:
+        float: 磁碟查詢的結束時間（包含）
+    """
+    if end is not None and end < oldest:
+        return end
+    return math.nextafter(math.floor(oldest), -math.inf)
+
+def query_history(start=None, end=None, limit=HISTORY_API_ROWS, ring=None, device=None):
+    """
+    查詢時間範圍內的歷史數據
+
+    記憶體中的環形緩衝區涵蓋最近的數據，更早的部分才向儲存引擎查詢；
+    兩邊都以二分搜尋定位，成本為 O(log n + k)。
+
+    Args:
+        start: 起始 epoch 秒數（None 表示不限）
+        end: 結束 epoch 秒數（None 表示不限）
+        limit: 最多回傳筆數；有 start 時從最舊的開始取，否則取最接近 end 的
+        ring: 記憶體中的數據（預設為所有裝置合併的 sensor_data）
+        device: 只查詢此裝置（ring 為該裝置的歷史，儲存引擎需要支援 device_queries）
+
+    Returns:
+        list: 由舊到新的 dict 列表
+    """
+    ring = sensor_data if ring is None else ring
+    filters = {} if device is None else {'device': device}
+    oldest = ring.oldest_ts()
+    if oldest is None:
+        rows = storage.query(start, end, limit, newest=start is None, **filters)
+        return [to_record(*row) for row in rows]
+
+    disk_end = disk_boundary(oldest, end)
+    def disk_rows(n, newest):
+        rows = storage.query(start, disk_end, n, newest=newest, **filters)
+        return [to_record(*row) for row in rows]
+
+    if start is None:
+        rows = ring.query(None, end, limit)
+        if len(rows) < limit:
+            rows = disk_rows(limit - len(rows), newest=True) + rows
+    else:
+        rows = disk_rows(limit, newest=False) if start < oldest else []
+        if len(rows) < limit:
+            rows += ring.query(start, end, limit - len(rows))
+    return rows
+
+def query_columns(start=None, end=None):
+    """
+    查詢時間範圍內的數據，以欄位形式回傳（不建立 dict，供降採樣使用）
+
+    沒有指定 start 時只使用記憶體中的數據。
+
+    Returns:
+        tuple: (ts, 溫度, 濕度, 電燈代碼)
+    """
+    oldest = sensor_data.oldest_ts()
+    if oldest is None:
+        return storage.query_columns(start, end)
+    columns = sensor_data.query_columns(start, end)
+    if start is not None and start < oldest:
+        disk = storage.query_columns(start, disk_boundary(oldest, end))
+        if HAS_NUMPY:
+            columns = tuple(np.concatenate([d, c]) for d, c in zip(disk, columns))
+        else:
+            columns = tuple(list(d) + list(c) for d, c in zip(disk, columns))
+    return columns
+
+def downsample_history(start=None, end=None, points=500, mode='lttb', ring=None):
+    """
+    把時間範圍內的數據降採樣到最多 points 個點
+
+    Args:
+        mode: 'lttb' 回傳挑選出的原始數據；'minmax' 回傳每個時間桶的
+              平均值與 *_min / *_max
+        ring: 指定時只使用這個環形緩衝區（單一裝置的歷史）
+
+    Returns:
+        list: 由舊到新的 dict 列表
+    """
+    if ring is None:
+        ts, temperature, humidity, light = query_columns(start, end)
+    else:
+        ts, temperature, humidity, light = ring.query_columns(start, end)
+    if mode == 'lttb':
+        return [
+            to_record(float(ts[i]), float(temperature[i]), float(humidity[i]),
+                      decode_light(int(light[i])))
+            for i in lttb_indices(ts, [temperature, humidity], points)
+        ]
+    buckets = bucket_aggregate(ts, {'temperature': temperature, 'humidity': humidity},
+                               points, start, end)
+    for bucket in buckets:
+        bucket['timestamp'] = format_timestamp(bucket.pop('ts'))
+    return buckets
+
+def parse_time_arg(value):
+    """
+    解析查詢參數中的時間
+
+    接受 epoch 秒數或 'YYYY-MM-DD HH:MM:SS' / 'YYYY-MM-DDTHH:MM:SS' 字串
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return parse_timestamp(value.replace('T', ' '))
+
+def make_cursor(total):
+    """增量同步的 cursor：啟動識別碼 + 累計筆數"""
+    return f"{BOOT_ID}-{total}"
+
+def history_since(cursor, ring=sensor_data):
+    """
+    取得 cursor 之後新增的數據
+
+    Returns:
+        dict: cursor（下次使用）、reset（需要重新完整載入）、rows
+    """
+    boot_id, _, seq = cursor.rpartition('-')
+    rows, total = None, ring.total
+    if boot_id == BOOT_ID and seq.isdigit():
+        rows, total = ring.since(int(seq), HISTORY_API_MAX_ROWS)
+    return {
+        'cursor': make_cursor(total),
+        'reset': rows is None,
+        'rows': rows or []
+    }
+
+def conditional(etag, build):
+    """
+    支援 ETag / If-None-Match 與回應快取的 JSON 回應
+
+    數據沒有變化時直接回 304；ETag 相同的請求共用同一份序列化
+    （與 gzip / brotli 壓縮）結果，不會每個客戶端各做一次。
+
+    Args:
+        etag: 數據版本
+        build: 無參數函式，回傳要序列化成 JSON 的數據
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        encoding = request.accept_encodings.best_match(response_cache.encodings,
+                                                       default='identity')
+        body, encoding = response_cache.get(
+            request.full_path, etag,
+            lambda: f"{app.json.dumps(build())}\n".encode('utf-8'), encoding)
+        response = Response(body, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # 要求瀏覽器每次都帶 If-None-Match 回來確認
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def shutdown():
+    """關閉前處理完佇列、寫完所有尚未寫入的數據，並儲存熱啟動快照"""
+    pipeline.stop()
+    storage.close()
+    print("💾 數據已全部寫入")
+    if SNAPSHOT_FILE:
+        try:
+            save_snapshot(SNAPSHOT_FILE, sensor_data, devices, storage_signature(storage.data_paths))
+            print(f"💾 熱啟動快照已儲存: {SNAPSHOT_FILE}")
+        except OSError as e:
+            print(f"⚠️  無法儲存熱啟動快照: {e}")
 
 def on_connect(client, userdata, flags, reason_code, properties):
     """MQTT 連線回調"""
-    global mqtt_connected
+    global mqtt_connected, mqtt_has_connected
     if reason_code.is_failure:
         print(f"❌ MQTT 連線失敗: {reason_code}")
         mqtt_connected = False
     else:
         print(f"✅ MQTT 連線成功")
-        mqtt_connected = True
-        client.subscribe(MQTT_TOPIC, qos=1)
-        print(f"✅ 已訂閱主題: {MQTT_TOPIC}")
+        if mqtt_has_connected:
+            mqtt_reconnects.inc()
+        mqtt_connected = mqtt_has_connected = True
+        client.subscribe([(topic, 1) for topic in MQTT_TOPICS])
+        print(f"✅ 已訂閱主題: {', '.join(MQTT_TOPICS)}")
+
+def on_disconnect(client, userdata, disconnect_flags, reason_code, properties):
+    """MQTT 斷線回調（loop_forever 會自動重新連線）"""
+    global mqtt_connected
+    print(f"⚠️  MQTT 連線中斷: {reason_code}")
+    mqtt_connected = False
+    mqtt_disconnects.inc()
 
 def on_message(client, userdata, message):
-    """MQTT 訊息回調"""
-    global latest_data, sensor_data
-    
+    """MQTT 訊息回調（只放入佇列，不在 MQTT 執行緒處理）"""
+    messages_received.labels(message.topic).inc()
+    ingest_queue.put((message.topic, message.payload, time.time()))
+
+def parse_message(item):
+    """
+    解析階段：解碼訊息（JSON 或二進位）、整理欄位並更新記憶體中的數據
+
+    Returns:
+        tuple: (ts, 溫度, 濕度, 電燈狀態, 裝置名稱, msg_id)；重複訊息回傳 None
+    """
+    topic, payload, ts = item
+    started = time.perf_counter()
     try:
-        payload = message.payload.decode('utf-8')
-        print(f"📨 收到訊息: {payload}")
-        
-        # 解析 JSON
-        data_dict = json.loads(payload)
-        
-        # 提取數據
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        temperature = data_dict.get('temperature', data_dict.get('temp', 0))
-        humidity = data_dict.get('humidity', data_dict.get('humi', 0))
-        light_status = data_dict.get('light_status', data_dict.get('light', '未知'))
-        
-        # 更新最新數據
-        latest_data = {
-            'light_status': light_status,
-            'temperature': temperature,
-            'humidity': humidity,
-            'timestamp': timestamp
-        }
-        
-        # 儲存到列表
-        sensor_data.append(latest_data.copy())
-        
-        # 只保留最近 100 筆
-        if len(sensor_data) > 100:
-            sensor_data.pop(0)
-        
-        # 儲存到 CSV
-        csv_data = {
-            '時間戳記': timestamp,
-            '電燈狀態': light_status,
-            '溫度': temperature,
-            '濕度': humidity
-        }
-        save_to_csv(csv_data)
-        
-        # 透過 WebSocket 推送到前端
-        socketio.emit('new_data', latest_data)
-        
-    except Exception as e:
-        print(f"處理訊息錯誤: {e}")
+        temperature, humidity, light_status, device, msg_id = decode_payload(payload)
+    except Exception:
+        messages_failed.labels(topic).inc()
+        raise
+    # 沒有 device 欄位時以主題區分裝置
+    device = device or topic
+    if message_dedup is not None and msg_id is not None and message_dedup.seen(device, msg_id, ts):
+        messages_duplicate.labels(topic).inc()
+        return None
+    print(f"📨 收到訊息 [{topic}] {device}: 溫度={temperature}, 濕度={humidity}, 電燈={light_status}")
+    
+    # 儲存到環形緩衝區（O(1)，不需要 pop）
+    sensor_data.append(ts, temperature, humidity, light_status)
+    devices.update(device, topic, ts, temperature, humidity, light_status)
+    messages_parsed.labels(topic).inc()
+    parse_seconds.observe(time.perf_counter() - started)
+    return ts, temperature, humidity, light_status, device, msg_id
+
+def persist_record(record):
+    """儲存階段：寫入 CSV / segment / 分割檔"""
+    save_to_csv(*record[:5])
+
+def update_stats(record):
+    """統計階段：更新串流統計（/api/stats）"""
+    ts, temperature, humidity, _, device = record[:5]
+    sensor_stats.update(device, ts, temperature, humidity)
+
+def broadcast_record(record):
+    """推送階段：透過 WebSocket 推送到前端（由 broadcaster 合併後送出）"""
+    broadcaster.publish(record_with_device(*record))
+    ingest_latency_seconds.observe(time.time() - record[0])
 
-# 啟動 MQTT 客戶端
-mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+def queue_of(name, config):
+    """依 (容量, 策略) 設定建立佇列"""
+    maxsize, policy = config
+    return BoundedQueue(name, maxsize, policy, os.path.join(SPILL_DIR, f'{name}.spill'))
+
+ingest_queue = queue_of('ingest', INGEST_QUEUE)
+persist_queue = queue_of('persist', PERSIST_QUEUE)
+broadcast_queue = queue_of('broadcast', BROADCAST_QUEUE)
+stats_queue = queue_of('stats', STATS_QUEUE)
+pipeline = Pipeline([
+    Stage('parse', parse_message, ingest_queue, [persist_queue, broadcast_queue, stats_queue]),
+    Stage('persist', persist_record, persist_queue),
+    Stage('stats', update_stats, stats_queue),
+    Stage('broadcast', broadcast_record, broadcast_queue)
+])
+
+metrics.gauge('pico_queue_depth', '流水線佇列中等待處理的筆數',
+              lambda: {(stage.name,): stage.inbox.qsize() for stage in pipeline.stages},
+              ['stage'])
+metrics.callback_counter('pico_queue_dropped_total', '佇列滿時丟棄的筆數',
+                         lambda: {(stage.name,): stage.inbox.dropped for stage in pipeline.stages},
+                         ['stage'])
+metrics.callback_counter('pico_storage_dropped_total', '儲存引擎因佇列已滿或寫入失敗而丟棄的筆數',
+                         lambda: storage.writer.rows_dropped if storage else 0)
+metrics.callback_counter('pico_storage_errors_total', '儲存引擎寫入失敗次數',
+                         lambda: storage.writer.errors if storage else 0)
+metrics.gauge('pico_websocket_clients', '目前連線的 WebSocket 客戶端數',
+              lambda: len(broadcaster.clients))
+metrics.callback_counter('pico_response_cache_hits_total', '回應快取命中次數',
+                         lambda: response_cache.hits)
+metrics.callback_counter('pico_response_cache_misses_total', '回應快取未命中（重新序列化）次數',
+                         lambda: response_cache.misses)
+metrics.gauge('pico_mqtt_connected', 'MQTT 是否已連線（1 / 0）',
+              lambda: int(bool(mqtt_connected)))
 
 def start_mqtt():
     """在背景執行緒中啟動 MQTT"""
@@ -147,13 +535,82 @@ def start_mqtt():
     except Exception as e:
         print(f"MQTT 錯誤: {e}")
 
-# 啟動前先載入歷史數據
-print("📂 載入歷史數據...")
-load_from_csv()
+_app_lock = threading.Lock()
+_app_ready = False
+
+def create_app(connect_mqtt=True):
+    """
+    初始化應用程式並回傳 Flask app（只在第一次呼叫時初始化）
+
+    匯入本模組不會讀取檔案或建立連線；第一次呼叫時才建立儲存引擎、
+    載入歷史數據、啟動處理流水線，並依 RUNTIME 啟動 MQTT 與 WebSocket 推送。
+
+    Args:
+        connect_mqtt: False 時不連線 MQTT（工具與測試使用）
+    """
+    global storage, mqtt_client, MQTT_BROKER, _app_ready
+    with _app_lock:
+        if _app_ready:
+            return app
+        _app_ready = True
+
+        storage = create_storage(
+            STORAGE_ENGINE, CSV_FILE, SEGMENT_DIR,
+            partition_dir=PARTITION_DIR,
+            partition_options={
+                'compress_after_days': PARTITION_COMPRESS_AFTER_DAYS,
+                'retention_days': PARTITION_RETENTION_DAYS,
+                'compression': PARTITION_COMPRESSION
+            },
+            sqlite_path=SQLITE_FILE,
+            wal_path=CSV_WAL_FILE,
+            batch_rows=CSV_BATCH_ROWS,
+            batch_seconds=CSV_BATCH_SECONDS,
+            durability=CSV_DURABILITY,
+            max_pending=CSV_MAX_PENDING_ROWS,
+            on_batch=lambda rows, seconds: storage_write_seconds.observe(seconds)
+        )
+
+        if getattr(storage, 'recovered', 0):
+            print(f"🔁 已從預寫日誌重做 {storage.recovered} 筆數據")
 
-# 在背景執行緒中啟動 MQTT
-mqtt_thread = threading.Thread(target=start_mqtt, daemon=True)
-mqtt_thread.start()
+        # 啟動前先載入歷史數據
+        print("📂 載入歷史數據...")
+        load_history()
+        seed_stats()
+        storage.start()
+        pipeline.start()
+        atexit.register(shutdown)
+
+        mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        mqtt_client.on_connect = on_connect
+        mqtt_client.on_disconnect = on_disconnect
+        mqtt_client.on_message = on_message
+
+        if EMBEDDED_BROKER and connect_mqtt:
+            from mqtt_broker import start_broker_thread
+            start_broker_thread('0.0.0.0', MQTT_PORT)
+            MQTT_BROKER = '127.0.0.1'
+            print(f"✅ 內建 MQTT Broker 已啟動: 0.0.0.0:{MQTT_PORT}")
+
+        if RUNTIME == 'threading':
+            # 在背景執行緒中啟動 MQTT
+            if connect_mqtt:
+                threading.Thread(target=start_mqtt, daemon=True).start()
+
+            # 啟動 WebSocket 合併推送
+            broadcaster.start()
+    return app
+
+@socketio.on('connect')
+def on_socket_connect():
+    """WebSocket 客戶端連線"""
+    broadcaster.add_client(request.sid)
+
+@socketio.on('disconnect')
+def on_socket_disconnect():
+    """WebSocket 客戶端斷線"""
+    broadcaster.remove_client(request.sid)
 
 @app.route('/')
 def index():
@@ -162,27 +619,236 @@ def index():
 
 @app.route('/api/latest')
 def get_latest():
-    """取得最新數據 API"""
-    return jsonify({
-        **latest_data,
+    """
+    取得最新數據 API
+
+    查詢參數:
+        device: 指定裝置（省略時為所有裝置中最新的一筆）
+    """
+    name = request.args.get('device')
+    if name is None:
+        ring, latest = sensor_data, sensor_data.latest()
+    else:
+        state = devices.get(name)
+        if state is None:
+            return jsonify({'error': f'找不到裝置: {name}'}), 404
+        ring, latest = state.history, devices.latest(name)
+    etag = f"{make_cursor(ring.total)}-{int(mqtt_connected)}"
+    return conditional(etag, lambda: {
+        **(latest or EMPTY_DATA),
         'mqtt_connected': mqtt_connected,
-        'total_records': len(sensor_data)
+        'total_records': len(ring)
     })
 
+@app.route('/api/devices')
+def get_devices():
+    """
+    取得裝置列表 API
+
+    查詢參數:
+        topic: 只列出此主題的裝置
+    """
+    return jsonify(devices.summaries(request.args.get('topic')))
+
+@app.route('/api/stats')
+def get_stats():
+    """
+    取得串流統計 API（平均值、標準差、EWMA、時間窗口最小 / 最大值、分位數）
+
+    統計在收到數據時就已更新，查詢不需要掃描歷史數據。
+
+    查詢參數:
+        device: 指定裝置（省略時回傳所有裝置合併與各裝置的統計）
+    """
+    name = request.args.get('device')
+    if name is not None and sensor_stats.devices.get(name) is None:
+        return jsonify({'error': f'找不到裝置: {name}'}), 404
+    etag = make_cursor(sensor_stats.updates)
+    if name is not None:
+        return conditional(etag, lambda: {'device': name, **sensor_stats.get(name)})
+    return conditional(etag, lambda: {
+        'overall': sensor_stats.overall.summary(),
+        'devices': sensor_stats.summaries()
+    })
+
+@app.route('/api/pipeline')
+def get_pipeline():
+    """處理流水線、WebSocket 推送、回應快取與重複訊息過濾的統計 API"""
+    return jsonify({
+        'stages': pipeline.stats(),
+        'broadcast': broadcaster.stats(),
+        'response_cache': response_cache.stats(),
+        'dedup': message_dedup.stats() if message_dedup is not None else None
+    })
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 格式的監控指標"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/history')
 def get_history():
-    """取得歷史數據 API"""
-    return jsonify(sensor_data)
+    """
+    取得歷史數據 API
+
+    查詢參數:
+        start / end: 時間範圍（epoch 秒數或 'YYYY-MM-DD HH:MM:SS'）
+        limit: 最多回傳筆數（預設 HISTORY_API_ROWS，上限 HISTORY_API_MAX_ROWS）
+        points: 降採樣到最多幾個點（指定時忽略 limit）
+        mode: 降採樣模式 'lttb'（預設）或 'minmax'
+        since: 只回傳此 cursor 之後新增的數據（回應為 {cursor, reset, rows}）
+        device: 只查詢此裝置（儲存引擎支援 device_queries 時，超出該裝置記憶體中歷史的部分
+                向儲存引擎查詢，否則只使用記憶體中的歷史）
+
+    一般查詢的回應標頭 X-History-Cursor 為下次增量同步使用的 cursor；
+    數據沒有變化時回 304。
+    """
+    name = request.args.get('device')
+    ring = sensor_data
+    if name is not None:
+        state = devices.get(name)
+        if state is None:
+            return jsonify({'error': f'找不到裝置: {name}'}), 404
+        ring = state.history
+
+    cursor = make_cursor(ring.total)
+    since = request.args.get('since')
+    if since is not None:
+        return conditional(cursor, lambda: history_since(since, ring))
+
+    try:
+        start = parse_time_arg(request.args.get('start'))
+        end = parse_time_arg(request.args.get('end'))
+        limit = int(request.args.get('limit', HISTORY_API_ROWS))
+        points = request.args.get('points')
+        points = None if points is None else int(points)
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數格式錯誤: {e}'}), 400
+
+    if points is not None:
+        mode = request.args.get('mode', 'lttb')
+        if mode not in DOWNSAMPLE_MODES:
+            return jsonify({'error': f'未知的降採樣模式: {mode}'}), 400
+        points = max(0, min(points, HISTORY_API_MAX_ROWS))
+        build = lambda: downsample_history(
+            start, end, points, mode, None if name is None else ring)
+    elif name is not None and not storage.device_queries:
+        limit = max(0, min(limit, HISTORY_API_MAX_ROWS))
+        build = lambda: ring.query(start, end, limit)
+    else:
+        limit = max(0, min(limit, HISTORY_API_MAX_ROWS))
+        build = lambda: query_history(start, end, limit, ring, name)
+
+    response = conditional(cursor, build)
+    response.headers['X-History-Cursor'] = cursor
+    return response
+
+@app.route('/api/export')
+def export_data():
+    """
+    匯出已寫入儲存引擎的數據（串流下載；CSV / Parquet 不限筆數，XLSX 最多 XLSX_MAX_ROWS 筆）
+
+    查詢參數:
+        format: 'csv'（預設）/ 'xlsx' / 'parquet'
+        start / end: 時間範圍（epoch 秒數或 'YYYY-MM-DD HH:MM:SS'）
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'未知的匯出格式: {fmt}'}), 400
+    try:
+        start = parse_time_arg(request.args.get('start'))
+        end = parse_time_arg(request.args.get('end'))
+        body = stream_export(fmt, storage.iter_chunks(start, end, EXPORT_CHUNK_ROWS))
+        # 先取出第一段內容：XLSX 超過筆數上限時在送出回應之前就能回報錯誤
+        first = next(body, b'')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    body = itertools.chain((first,), body)
+
+    content_type, extension = EXPORT_FORMATS[fmt]
+    response = Response(body, content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename=sensor_data.{extension}'
+    return response
+
+def debug_allowed():
+    """除錯端點需要設定 DEBUG_TOKEN，請求以 X-Debug-Token 標頭或 token 參數提供"""
+    token = request.headers.get('X-Debug-Token') or request.args.get('token')
+    return DEBUG_TOKEN is not None and token is not None and hmac.compare_digest(token, DEBUG_TOKEN)
+
+@app.route('/debug/profile')
+def debug_profile():
+    """
+    取樣式 CPU 分析（MQTT、流水線與網頁的所有執行緒）
+
+    查詢參數:
+        seconds: 分析秒數（預設 10，上限 PROFILE_MAX_SECONDS）
+        interval: 取樣間隔秒數（預設 0.005）
+
+    回傳 collapsed stack 檔案，可用 flamegraph.pl 或 speedscope 開啟
+    """
+    if not debug_allowed():
+        return jsonify({'error': 'Not Found'}), 404
+    try:
+        seconds = min(float(request.args.get('seconds', 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(request.args.get('interval', 0.005)), 0.001)
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數格式錯誤: {e}'}), 400
+    try:
+        result = profiler.profile(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    response = Response(result, content_type='text/plain; charset=utf-8')
+    response.headers['Content-Disposition'] = 'attachment; filename=profile.folded'
+    return response
+
+@app.route('/debug/tracemalloc')
+def debug_tracemalloc():
+    """
+    記憶體配置快照
+
+    查詢參數:
+        action: 'snapshot'（預設，第一次呼叫時開始追蹤，之後回傳與上次的差異）
+                或 'stop'（停止追蹤，恢復原本的速度）
+        top: 回傳差異最大的前幾項（預設 20）
+    """
+    if not debug_allowed():
+        return jsonify({'error': 'Not Found'}), 404
+    action = request.args.get('action', 'snapshot')
+    if action == 'stop':
+        allocation_tracer.stop()
+        return jsonify({'tracing': False})
+    if action != 'snapshot':
+        return jsonify({'error': f'未知的動作: {action}'}), 400
+    try:
+        top = int(request.args.get('top', 20))
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數格式錯誤: {e}'}), 400
+    return jsonify(allocation_tracer.snapshot(top))
 
 if __name__ == '__main__':
+    create_app()
     print("=" * 60)
     print(" Flask MQTT 監控應用程式")
     print("=" * 60)
     print(f" 啟動中...")
     print(f" MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
-    print(f" MQTT Topic: {MQTT_TOPIC}")
-    print(f" CSV 檔案: {CSV_FILE}")
+    print(f" MQTT Topics: {', '.join(MQTT_TOPICS)}")
+    print(f" 儲存引擎: {STORAGE_ENGINE} ({storage.path})")
+    print(f" 執行模式: {RUNTIME}")
     print("=" * 60)
     
-    socketio.run(app, host='0.0.0.0', port=8080, debug=False, allow_unsafe_werkzeug=True)
+    # systemd 停止服務時送出 SIGTERM，轉成正常結束以觸發 atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # kill -USR1 <pid>：CPU 分析 PROFILE_SIGNAL_SECONDS 秒；kill -USR2 <pid>：記憶體快照比較
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame:
+                      profiler.profile_to_file(PROFILE_SIGNAL_SECONDS, DEBUG_DIR))
+        signal.signal(signal.SIGUSR2, lambda signum, frame:
+                      allocation_tracer.snapshot_to_file(DEBUG_DIR))
+    
+    if RUNTIME == 'asyncio':
+        import asgi_runtime
+        asgi_runtime.run(app, broadcaster, mqtt_client, MQTT_BROKER, MQTT_PORT)
+    else:
+        socketio.run(app, host='0.0.0.0', port=8080, debug=False, allow_unsafe_werkzeug=True)
 
@@ -0,0 +1,198 @@
+"""
+asyncio 執行模式（ASGI）
+MQTT 由事件迴圈透過 socket 回調驅動，WebSocket 由 python-socketio 的
+AsyncServer 處理，所有連線共用同一個事件迴圈，不需要每個連線一個執行緒；
+HTTP API 仍由原本的 Flask 路由處理（透過 asgiref 在執行緒池中執行）
+
+需要額外安裝: uv pip install uvicorn asgiref
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+# 嘗試導入 ASGI 相關套件
+try:
+    import socketio
+    import uvicorn
+    from asgiref.wsgi import WsgiToAsgi
+    HAS_ASGI = True
+except ImportError:
+    HAS_ASGI = False
+
+# 重新連線的等待時間（秒），每次失敗加倍
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+
+class AsyncioMqttLoop:
+    """
+    以 asyncio 事件迴圈驅動 paho 客戶端（取代 loop_forever 執行緒）
+
+    socket 可讀時呼叫 loop_read、有待送數據時呼叫 loop_write，
+    每秒呼叫一次 loop_misc 處理 keepalive 與重送。
+
+    Args:
+        client: paho.mqtt.client.Client
+        host, port, keepalive: 連線設定
+    """
+
+    def __init__(self, client, host, port, keepalive=60):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.loop = None
+        self._loop_thread = None
+        self._disconnected = None
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_register_write
+        client.on_socket_unregister_write = self._on_unregister_write
+
+    # connect 在執行緒池中執行，socket 回調可能不在事件迴圈的執行緒；
+    # 其他執行緒的呼叫以 call_soon_threadsafe 交回事件迴圈（依呼叫順序執行），
+    # 事件迴圈中的呼叫則立即執行，避免 socket 關閉後才移除
+
+    def _call(self, func, *args):
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+        self._call(self.loop.add_reader, sock.fileno(), client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        # 在回調中先取得 fd，交回事件迴圈時 socket 可能已經關閉（fileno() 變成 -1）
+        self._call(self._closed, sock.fileno())
+
+    def _closed(self, fd):
+        self._remove(fd)
+        self._disconnected.set()
+
+    def _remove(self, fd, writer_only=False):
+        try:
+            if not writer_only:
+                self.loop.remove_reader(fd)
+            self.loop.remove_writer(fd)
+        except (OSError, ValueError):
+            # socket 已經關閉
+            pass
+
+    def _on_register_write(self, client, userdata, sock):
+        self._call(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self._call(self._remove, sock.fileno(), True)
+
+    async def run(self):
+        """連線並持續處理，斷線後以指數退避重新連線"""
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._disconnected = asyncio.Event()
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            self._disconnected.clear()
+            try:
+                # connect 會做 DNS 查詢與 TCP 連線，放到執行緒池避免卡住事件迴圈
+                await self.loop.run_in_executor(
+                    None, self.client.connect, self.host, self.port, self.keepalive)
+            except Exception as e:
+                print(f"MQTT 錯誤: {e}")
+            else:
+                delay = RECONNECT_MIN_DELAY
+                while not self._disconnected.is_set():
+                    if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                        break
+                    try:
+                        await asyncio.wait_for(self._disconnected.wait(), 1)
+                    except asyncio.TimeoutError:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+class AsyncSocketAdapter:
+    """
+    讓 SocketBroadcaster 使用 AsyncServer
+
+    提供 broadcaster 需要的 start_background_task / sleep / emit；
+    合併推送在一個背景執行緒中進行，emit 交給事件迴圈送出。
+    """
+
+    def __init__(self, sio, loop):
+        self.sio = sio
+        self.loop = loop
+
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name='broadcaster', daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def emit(self, event, data, to=None, callback=None):
+        asyncio.run_coroutine_threadsafe(
+            self.sio.emit(event, data, to=to, callback=callback), self.loop)
+
+
+def create_asgi_app(flask_app, broadcaster):
+    """
+    組合 ASGI 應用程式：/socket.io 由 AsyncServer 處理，其餘交給 Flask
+
+    Returns:
+        tuple: (ASGI 應用程式, AsyncServer)
+    """
+    sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+    @sio.event
+    async def connect(sid, environ):
+        """WebSocket 客戶端連線"""
+        broadcaster.add_client(sid)
+
+    @sio.event
+    async def disconnect(sid, *args):
+        """WebSocket 客戶端斷線"""
+        broadcaster.remove_client(sid)
+
+    return socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(flask_app)), sio
+
+
+def run(flask_app, broadcaster, mqtt_client, broker, port, host='0.0.0.0', http_port=8080):
+    """
+    以 asyncio 模式啟動（uvicorn + 事件迴圈驅動的 MQTT）
+
+    Args:
+        flask_app: 提供 HTTP API 的 Flask 應用程式
+        broadcaster: SocketBroadcaster（改用 AsyncServer 推送）
+        mqtt_client: 已設定好回調的 paho 客戶端
+        broker, port: MQTT Broker 位址
+        host, http_port: HTTP 服務的位址
+    """
+    if not HAS_ASGI:
+        print("❌ asyncio 模式需要 uvicorn 與 asgiref：uv pip install uvicorn asgiref")
+        return
+
+    asgi_app, sio = create_asgi_app(flask_app, broadcaster)
+    mqtt_loop = AsyncioMqttLoop(mqtt_client, broker, port)
+
+    async def main():
+        broadcaster.socketio = AsyncSocketAdapter(sio, asyncio.get_running_loop())
+        broadcaster.start()
+        mqtt_task = asyncio.create_task(mqtt_loop.run())
+        server = uvicorn.Server(uvicorn.Config(asgi_app, host=host, port=http_port,
+                                               log_level='warning'))
+        try:
+            await server.serve()
+        finally:
+            broadcaster.stop()
+            mqtt_task.cancel()
+            mqtt_client.disconnect()
+
+    asyncio.run(main())
@@ -0,0 +1,358 @@
+"""
+效能基準測試
+以固定亂數種子產生的數據量測各熱點路徑，結果輸出成 JSON，
+之後可以用 --compare 與先前的結果比較（回歸追蹤）
+
+項目:
+    - parse: parse_message 每秒處理筆數（JSON / 二進位訊息的解碼與整理）
+    - save: save_to_csv 每筆成本（放入佇列 + 背景執行緒寫完）
+    - load: load_from_csv 在 1e3 ~ 1e7 筆數據的載入時間（尾端讀取 / 完整掃描）
+    - history: /api/history 的序列化時間與回應大小
+    - generate: generate_test_data 每秒產生筆數
+
+使用方式:
+    uv run python benchmark.py --json bench.json
+    uv run python benchmark.py --only load --sizes 1000,10000000
+    uv run python benchmark.py --json new.json --compare bench.json
+"""
+
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from csv_reader import CSV_FIELDNAMES
+from payload_codec import encode_binary
+from ring_buffer import SensorRingBuffer, format_timestamp, parse_timestamp, HAS_NUMPY
+
+# 固定的亂數種子與起始時間，每次產生相同的數據
+SEED = 20251026
+START_TIME = '2025-10-26 00:00:00'
+# load 項目預設的數據筆數（1e7 筆的 CSV 約 400 MB，需要時以 --sizes 指定）
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+# history 項目使用的數據筆數上限（取 --sizes 中不超過此值的最大者）
+HISTORY_MAX_ROWS = 100000
+# load 項目的尾端讀取筆數佔檔案的比例（不超過 HISTORY_CAPACITY，必須小於檔案筆數才量得到尾端讀取）
+TAIL_FRACTION = 0.1
+# 測試數據的存放資料夾（產生一次後重複使用）
+DATA_DIR = 'bench_data'
+BENCHMARKS = ('parse', 'save', 'load', 'history', 'generate')
+
+
+def dataset_path(data_dir, rows):
+    """
+    取得固定內容的 CSV 測試數據（不存在時產生）
+
+    每秒一筆，溫濕度以固定種子的隨機漫步產生
+    """
+    path = os.path.join(data_dir, f'dataset_{rows}.csv')
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(SEED)
+    ts = parse_timestamp(START_TIME)
+    temperature, humidity = 25.0, 60.0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        for i in range(rows):
+            temperature = min(max(temperature + rng.uniform(-0.2, 0.2), 10), 40)
+            humidity = min(max(humidity + rng.uniform(-0.5, 0.5), 20), 95)
+            writer.writerow((format_timestamp(ts + i), '開' if rng.random() < 0.4 else '關',
+                             round(temperature, 2), round(humidity, 2)))
+    os.replace(tmp_path, path)
+    return path
+
+
+def make_payloads(count, fmt):
+    """固定內容的 MQTT 訊息（與 Pico 程式相同格式）"""
+    rng = random.Random(SEED)
+    payloads = []
+    for i in range(count):
+        temperature = round(rng.uniform(15, 35), 2)
+        humidity = round(rng.uniform(40, 80), 2)
+        light_status = '開' if rng.random() < 0.5 else '關'
+        device = f'pico{i % 20:02d}'
+        if fmt == 'binary':
+            payloads.append(encode_binary(temperature, humidity, light_status, device, i))
+        else:
+            payloads.append(json.dumps({
+                'temperature': temperature,
+                'humidity': humidity,
+                'light_status': light_status,
+                'device': device,
+                'msg_id': i
+            }, ensure_ascii=False).encode('utf-8'))
+    return payloads
+
+
+def timed(func, repeat, setup=None):
+    """
+    重複執行並記錄時間
+
+    Args:
+        func: 要量測的函式（有 setup 時以 setup 的回傳值呼叫）
+        repeat: 執行次數
+        setup: 每次執行前呼叫（不計入時間）
+
+    Returns:
+        dict: min_seconds / median_seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is None:
+            started = time.perf_counter()
+            func()
+        else:
+            arg = setup()
+            started = time.perf_counter()
+            func(arg)
+        times.append(time.perf_counter() - started)
+    return {'min_seconds': min(times), 'median_seconds': statistics.median(times)}
+
+
+@contextlib.contextmanager
+def quiet():
+    """暫時丟棄 print 輸出（每筆訊息都會印出一行）"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def load_app(workdir):
+    """
+    在暫存資料夾中初始化 app_flask（它的檔案路徑都是相對路徑）
+
+    不連線 MQTT，避免真實的訊息混入量測；也不儲存熱啟動快照
+    """
+    os.chdir(workdir)
+    import app_flask
+    app_flask.SNAPSHOT_FILE = None
+    with quiet():
+        app_flask.create_app(connect_mqtt=False)
+    return app_flask
+
+
+def bench_parse(app, args):
+    """parse_message：解碼 + 整理欄位 + 寫入環形緩衝區與裝置索引"""
+    results = {}
+    for fmt in ('json', 'binary'):
+        payloads = make_payloads(args.messages, fmt)
+        now = time.time()
+        items = [(f'pico{i % 20:02d}/sensor', payload, now) for i, payload in enumerate(payloads)]
+
+        def run(_):
+            for item in items:
+                app.parse_message(item)
+
+        def reset():
+            # 每次重複都是相同的 msg_id，清空重複訊息過濾避免之後全部被當成重複
+            if app.message_dedup is not None:
+                app.message_dedup.clear()
+
+        with quiet():
+            result = timed(run, args.repeat, setup=reset)
+        result['messages'] = len(items)
+        result['msgs_per_second'] = len(items) / result['min_seconds']
+        result['payload_bytes'] = sum(len(p) for p in payloads) / len(payloads)
+        results[fmt] = result
+    return results
+
+
+def bench_save(app, args, workdir):
+    """save_to_csv：呼叫端的成本（放入佇列）與背景執行緒寫完所有數據的時間"""
+    rows = args.messages
+    now = time.time()
+    enqueue, total = [], []
+    for k in range(args.repeat):
+        app.storage = app.create_storage(
+            'csv', os.path.join(workdir, f'save_{k}.csv'), None,
+            wal_path=os.path.join(workdir, f'save_{k}.wal') if app.CSV_WAL_FILE else None,
+            batch_rows=app.CSV_BATCH_ROWS, batch_seconds=app.CSV_BATCH_SECONDS,
+            durability=app.CSV_DURABILITY).start()
+        started = time.perf_counter()
+        for i in range(rows):
+            app.save_to_csv(now + i, 25.0, 60.0, '開', 'pico01')
+        enqueued = time.perf_counter()
+        app.storage.close()
+        finished = time.perf_counter()
+        enqueue.append(enqueued - started)
+        total.append(finished - started)
+    return {
+        'rows': rows,
+        'durability': app.CSV_DURABILITY,
+        'wal': bool(app.CSV_WAL_FILE),
+        'enqueue_us_per_row': min(enqueue) / rows * 1e6,
+        'total_us_per_row': min(total) / rows * 1e6,
+        'rows_per_second': rows / min(total)
+    }
+
+
+def use_dataset(app, path):
+    """讓 app 改用指定的 CSV 與新的環形緩衝區"""
+    app.storage = app.create_storage('csv', path, None)
+    app.sensor_data = SensorRingBuffer(app.HISTORY_CAPACITY)
+
+
+def bench_load(app, args):
+    """
+    load_from_csv：尾端讀取（預設）與完整掃描
+
+    兩種模式載入相同的最後 tail_rows 筆，差別只在讀取整個檔案與否
+    """
+    results = {}
+    for rows in args.sizes:
+        path = dataset_path(args.data_dir, rows)
+        tail_rows = max(min(app.HISTORY_CAPACITY, int(rows * TAIL_FRACTION)), 1)
+        result = {'rows': rows, 'tail_rows': tail_rows, 'file_bytes': os.path.getsize(path)}
+        for mode, full_scan in (('tail', False), ('full_scan', True)):
+            with quiet():
+                timing = timed(lambda _: app.load_from_csv(tail_rows, full_scan=full_scan),
+                               args.repeat, setup=lambda: use_dataset(app, path))
+            timing['loaded'] = len(app.sensor_data)
+            result[mode] = timing
+        results[str(rows)] = result
+    return results
+
+
+def bench_history(app, args):
+    """/api/history：每次都重新序列化（清空回應快取），記錄回應大小"""
+    rows = max([size for size in args.sizes if size <= HISTORY_MAX_ROWS] or [HISTORY_MAX_ROWS])
+    with quiet():
+        use_dataset(app, dataset_path(args.data_dir, rows))
+        app.load_from_csv()
+    client = app.app.test_client()
+    queries = {
+        'default': '/api/history',
+        'limit_10000': '/api/history?limit=10000',
+        'lttb_500': f'/api/history?points=500&start={parse_timestamp(START_TIME)}',
+        'minmax_500': f'/api/history?points=500&mode=minmax&start={parse_timestamp(START_TIME)}'
+    }
+    results = {'rows': rows}
+    for name, url in queries.items():
+        def run():
+            app.response_cache = app.ResponseCache(app.RESPONSE_CACHE_ENTRIES,
+                                                   app.RESPONSE_COMPRESS_MIN_BYTES)
+            return client.get(url)
+
+        result = timed(run, args.repeat)
+        body = run().get_data()
+        result['bytes'] = len(body)
+        result['gzip_bytes'] = len(gzip.compress(body, compresslevel=6))
+        result['records'] = len(json.loads(body))
+        results[name] = result
+    return results
+
+
+def bench_generate(args):
+    """generate_test_data：每秒產生筆數"""
+    from generate_test_data import generate_test_data
+    count = args.messages
+    random.seed(SEED)
+    result = timed(lambda: generate_test_data(count), args.repeat)
+    result['rows'] = count
+    result['rows_per_second'] = count / result['min_seconds']
+    return result
+
+
+def flatten(results, prefix=''):
+    """巢狀結果 → {'load.1000.tail.min_seconds': 值}"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline_path):
+    """與先前的結果比較時間與速率（時間越短、速率越高越好）"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = flatten(json.load(f)['results'])
+    print(f"\n📊 與 {baseline_path} 比較:")
+    for name, value in flatten(results).items():
+        old = baseline.get(name)
+        if not old or not name.endswith(('seconds', 'per_second', 'per_row')):
+            continue
+        change = (value - old) / old * 100
+        better = change > 0 if name.endswith('per_second') else change < 0
+        mark = '✅' if better else '⚠️ '
+        print(f"   {mark} {name}: {old:.6g} → {value:.6g} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app_flask 熱點路徑的效能基準測試')
+    parser.add_argument('--only', help=f'只執行指定項目（以逗號分隔: {",".join(BENCHMARKS)}）')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='load 項目的數據筆數（以逗號分隔）')
+    parser.add_argument('--messages', type=int, default=20000,
+                        help='parse / save / generate 項目的筆數')
+    parser.add_argument('--repeat', type=int, default=3, help='每個項目重複次數（取最小值）')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='測試數據的存放資料夾')
+    parser.add_argument('--json', dest='json_path', help='把結果另存成 JSON 檔')
+    parser.add_argument('--compare', help='與先前的 JSON 結果比較')
+    args = parser.parse_args()
+    args.sizes = [int(float(size)) for size in args.sizes.split(',')]
+    args.data_dir = os.path.abspath(args.data_dir)
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    for name in selected:
+        if name not in BENCHMARKS:
+            parser.error(f"未知的項目: {name}")
+
+    print("=" * 60)
+    print(f" 效能基準測試: {', '.join(selected)}")
+    print("=" * 60)
+
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        app = load_app(workdir)
+        try:
+            for name in selected:
+                print(f"⏱️  {name}...")
+                if name == 'parse':
+                    results[name] = bench_parse(app, args)
+                elif name == 'save':
+                    results[name] = bench_save(app, args, workdir)
+                elif name == 'load':
+                    results[name] = bench_load(app, args)
+                elif name == 'history':
+                    results[name] = bench_history(app, args)
+                elif name == 'generate':
+                    results[name] = bench_generate(args)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'meta': {
+            'time': format_timestamp(time.time()),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'numpy': HAS_NUMPY,
+            'seed': SEED,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已儲存: {args.json_path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
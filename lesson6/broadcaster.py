@@ -0,0 +1,144 @@
+"""
+合併與限速的 Socket.IO 推送
+MQTT 執行緒只把數據放進待送列表，由背景工作依固定頻率合併成一批推送，
+每個客戶端有各自的發送額度，慢的客戶端只收到最新的一批
+"""
+
+import threading
+import time
+from functools import partial
+
+
+class ClientState:
+    """單一客戶端的發送狀態"""
+
+    def __init__(self):
+        self.inflight = 0      # 已送出但尚未確認（ack）的批次數
+        self.sent_at = 0.0
+        self.pending = None    # 等待送出的批次（只保留最新的一批）
+        self.sent = 0
+        self.dropped = 0
+
+
+class SocketBroadcaster:
+    """
+    依固定頻率合併推送 'new_data' 事件
+
+    每個 tick 把這段時間收到的數據合併成一批；客戶端收到後回傳 ack。
+    尚未確認的批次達到 max_inflight 時，新的批次會取代還沒送出的舊批次
+    （latest-value-wins），被取代的批次計入 dropped；
+    一個 tick 內超過 max_rows 的較舊數據不會附帶在批次中，計入 rows_dropped。
+
+    Args:
+        socketio: Flask-SocketIO 實例
+        event: 推送的事件名稱
+        hz: 每秒推送次數
+        max_inflight: 每個客戶端最多同時等待確認的批次數
+        ack_timeout: 超過幾秒沒收到 ack 就視為遺失
+        max_rows: 每批最多附帶的數據筆數
+        on_emit: 每次送出後呼叫 on_emit(客戶端數, 秒數)，用於監控推送時間
+    """
+
+    def __init__(self, socketio, event='new_data', hz=10, max_inflight=2,
+                 ack_timeout=5.0, max_rows=100, on_emit=None):
+        self.socketio = socketio
+        self.event = event
+        self.interval = 1.0 / hz
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self.max_rows = max_rows
+        self.on_emit = on_emit
+        self.clients = {}
+        self.frames = 0
+        self.dropped = 0
+        self.rows_dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """啟動背景推送工作"""
+        self._running = True
+        self.socketio.start_background_task(self._run)
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def publish(self, data):
+        """放入一筆新數據（O(1)，不會等待任何客戶端）"""
+        with self._lock:
+            self._pending.append(data)
+
+    def add_client(self, sid):
+        with self._lock:
+            self.clients[sid] = ClientState()
+
+    def remove_client(self, sid):
+        with self._lock:
+            self.clients.pop(sid, None)
+
+    def _ack(self, sid, *args):
+        """客戶端確認收到一批"""
+        with self._lock:
+            client = self.clients.get(sid)
+            if client is not None and client.inflight > 0:
+                client.inflight -= 1
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"推送數據錯誤: {e}")
+
+    def flush(self):
+        """合併待送數據，依各客戶端的額度送出"""
+        sends = []
+        now = time.monotonic()
+        with self._lock:
+            rows, self._pending = self._pending, []
+            frame = None
+            if rows:
+                frame = {**rows[-1], 'count': len(rows), 'rows': rows[-self.max_rows:]}
+                self.frames += 1
+                self.rows_dropped += max(len(rows) - self.max_rows, 0)
+
+            for sid, client in self.clients.items():
+                if frame is not None:
+                    if client.pending is not None:
+                        client.dropped += 1
+                        self.dropped += 1
+                    client.pending = frame
+                if client.pending is None:
+                    continue
+                if client.inflight >= self.max_inflight:
+                    if now - client.sent_at < self.ack_timeout:
+                        continue
+                    # 太久沒有 ack，視為遺失
+                    client.inflight = 0
+                client.inflight += 1
+                client.sent_at = now
+                client.sent += 1
+                sends.append((sid, client.pending))
+                client.pending = None
+
+        if not sends:
+            return
+        started = time.perf_counter()
+        for sid, pending in sends:
+            self.socketio.emit(self.event, pending, to=sid, callback=partial(self._ack, sid))
+        if self.on_emit is not None:
+            self.on_emit(len(sends), time.perf_counter() - started)
+
+    def stats(self):
+        """推送統計"""
+        with self._lock:
+            return {
+                'clients': len(self.clients),
+                'frames': self.frames,
+                'dropped': self.dropped,
+                'rows_dropped': self.rows_dropped,
+                'pending_clients': sum(1 for c in self.clients.values() if c.pending is not None)
+            }
@@ -0,0 +1,236 @@
+"""
+CSV 快速讀取
+從檔案結尾往回搜尋只解析最後 N 筆，或依時間二分搜尋只讀取需要的範圍，
+讀取時間不隨檔案大小增加
+"""
+
+import csv
+import os
+
+from ring_buffer import parse_timestamp
+
+BLOCK_SIZE = 64 * 1024
+
+# sensor_data.csv 的標題列
+CSV_FIELDNAMES = ['時間戳記', '電燈狀態', '溫度', '濕度']
+
+
+def _decode_line(line):
+    """
+    解碼一行數據
+
+    斷電可能留下只寫一半的 UTF-8 字元或整段 NUL，這些內容會被取代或移除，
+    讓該行在解析時被略過，而不會中斷整個讀取
+    """
+    return line.replace(b'\0', b'').decode('utf-8', errors='replace')
+
+
+def check_header(header_line, fieldnames):
+    """
+    檢查 CSV 標題列是否與預期欄位一致
+
+    Raises:
+        ValueError: 標題列不符
+    """
+    text = header_line.decode('utf-8-sig').strip()
+    header = next(csv.reader([text]), [])
+    if header != list(fieldnames):
+        raise ValueError(f"CSV 標題列不符: {header}，預期為 {list(fieldnames)}")
+
+
+def _complete_end(f, lo, block_size=BLOCK_SIZE):
+    """
+    只取到目前檔案大小之前最後一個換行字元
+
+    寫入執行緒可能正在附加數據，檔尾沒有換行的內容是還沒寫完的半行
+    （例如濕度 59.09 只寫到 5），解析後看起來仍是正確的數據，因此不能讀取。
+
+    Returns:
+        int: 最後一個換行字元之後的位置（沒有完整的行時回傳 lo）
+    """
+    pos = f.seek(0, os.SEEK_END)
+    while pos > lo:
+        size = min(block_size, pos - lo)
+        f.seek(pos - size)
+        newline = f.read(size).rfind(b'\n')
+        if newline >= 0:
+            return pos - size + newline + 1
+        pos -= size
+    return lo
+
+
+def _read_lines_backward(f, n, lo, hi, block_size=BLOCK_SIZE):
+    """
+    從位置 hi 往回讀，取得 [lo, hi) 之間最後 n 行
+
+    以固定大小的區塊往回讀，直到找到足夠的換行字元，
+    只有這段內容會被解碼。
+
+    Returns:
+        list: 由舊到新的文字行
+    """
+    if n <= 0:
+        return []
+    pos = hi
+    chunks = []
+    newlines = 0
+    while pos > lo and newlines <= n:
+        size = min(block_size, pos - lo)
+        pos -= size
+        f.seek(pos)
+        chunk = f.read(size)
+        newlines += chunk.count(b'\n')
+        chunks.append(chunk)
+
+    lines = b''.join(reversed(chunks)).splitlines()
+    if pos > lo:
+        # 第一行可能只讀到一半
+        lines = lines[1:]
+    return [_decode_line(line) for line in lines if line.strip(b'\0 \t\r\n')][-n:]
+
+
+def _line_ts(line):
+    """取出一行數據的時間戳記（epoch 秒數），格式錯誤時回傳 None"""
+    try:
+        return parse_timestamp(line.split(b',', 1)[0].decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _bisect_offset(f, ts, lo, hi, right=False):
+    """
+    依時間戳記在檔案中二分搜尋（CSV 需依時間排序）
+
+    Args:
+        lo, hi: 搜尋範圍，必須是行首位置（hi 可以是檔尾）
+        right: False 時找第一筆時間 >= ts 的行，True 時找第一筆時間 > ts 的行
+
+    Returns:
+        int: 該行的行首位置，找不到時回傳 hi
+    """
+    def before(line_ts):
+        # 格式錯誤的行（例如斷電造成的半行）視為在目標之前
+        return line_ts is None or line_ts < ts or (right and line_ts == ts)
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        if mid > lo:
+            f.readline()   # 跳到下一個行首
+        pos = f.tell()
+        if pos >= hi:
+            break
+        if before(_line_ts(f.readline())):
+            lo = f.tell()
+        else:
+            hi = pos
+
+    # 剩下的範圍最多只有兩三行，直接依序檢查
+    f.seek(lo)
+    while f.tell() < hi:
+        pos = f.tell()
+        if not before(_line_ts(f.readline())):
+            return pos
+    return hi
+
+
+def read_csv_tail(path, n, fieldnames, block_size=BLOCK_SIZE):
+    """
+    讀取 CSV 檔案最後 n 筆數據
+
+    Args:
+        path: CSV 檔案路徑
+        n: 要讀取的筆數
+        fieldnames: 預期的標題列欄位
+        block_size: 每次往回讀取的位元組數
+
+    Returns:
+        list: 由舊到新的欄位列表（list of list of str）
+    """
+    with open(path, 'rb') as f:
+        check_header(f.readline(), fieldnames)
+        data_start = f.tell()
+        file_end = _complete_end(f, data_start, block_size)
+        lines = _read_lines_backward(f, n, data_start, file_end, block_size)
+    return list(csv.reader(lines))
+
+
+def _range_offsets(f, fieldnames, start, end):
+    """檢查標題列並以二分搜尋找出 [start, end] 的位元組範圍（只到最後一行完整的數據）"""
+    check_header(f.readline(), fieldnames)
+    data_start = f.tell()
+    file_end = _complete_end(f, data_start)
+    lo = data_start if start is None else _bisect_offset(f, start, data_start, file_end)
+    hi = file_end if end is None else _bisect_offset(f, end, lo, file_end, right=True)
+    return lo, hi
+
+
+def read_csv_range(path, fieldnames, start=None, end=None, limit=None, newest=False):
+    """
+    讀取 [start, end] 時間範圍內的數據
+
+    以位元組位置二分搜尋找到範圍的起點與終點，成本為 O(log n + k)，
+    不需要掃描整個檔案。
+
+    Args:
+        path: CSV 檔案路徑
+        fieldnames: 預期的標題列欄位
+        start: 起始 epoch 秒數（None 表示不限）
+        end: 結束 epoch 秒數（None 表示不限）
+        limit: 最多回傳筆數
+        newest: True 時取範圍內最新的 limit 筆，否則取最舊的
+
+    Returns:
+        list: 由舊到新的欄位列表（list of list of str）
+    """
+    with open(path, 'rb') as f:
+        lo, hi = _range_offsets(f, fieldnames, start, end)
+        if newest and limit is not None:
+            lines = _read_lines_backward(f, limit, lo, hi)
+        else:
+            f.seek(lo)
+            lines = []
+            while f.tell() < hi and (limit is None or len(lines) < limit):
+                line = f.readline()
+                if line.strip(b'\0 \t\r\n'):
+                    lines.append(_decode_line(line))
+    return list(csv.reader(lines))
+
+
+def iter_csv_range(path, fieldnames, start=None, end=None, chunk_rows=10000):
+    """
+    分批讀取 [start, end] 時間範圍內的數據（用於大量匯出，記憶體用量固定）
+
+    Yields:
+        list: 每批最多 chunk_rows 筆的欄位列表
+    """
+    with open(path, 'rb') as f:
+        lo, hi = _range_offsets(f, fieldnames, start, end)
+        f.seek(lo)
+        lines = []
+        while f.tell() < hi:
+            line = f.readline()
+            if line.strip(b'\0 \t\r\n'):
+                lines.append(_decode_line(line))
+            if len(lines) >= chunk_rows:
+                yield list(csv.reader(lines))
+                lines = []
+        if lines:
+            yield list(csv.reader(lines))
+
+
+def read_csv_all(path, fieldnames):
+    """
+    完整掃描整個 CSV 檔案（逐筆產生，不會一次載入記憶體）
+
+    Yields:
+        list: 每一筆數據的欄位列表
+    """
+    with open(path, 'r', newline='', encoding='utf-8-sig', errors='replace') as f:
+        reader = csv.reader(line.replace('\0', '') for line in f)
+        header = next(reader, [])
+        if header != list(fieldnames):
+            raise ValueError(f"CSV 標題列不符: {header}，預期為 {list(fieldnames)}")
+        for row in reader:
+            if row:
+                yield row
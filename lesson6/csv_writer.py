@@ -0,0 +1,317 @@
+"""
+背景批次 CSV 寫入器（Group Commit）
+由專用執行緒保持檔案開啟，依筆數或時間批次寫入，避免阻塞 MQTT 執行緒
+"""
+
+import csv
+import io
+import os
+import queue
+import threading
+import time
+
+from wal import WriteAheadLog
+
+# 持久化模式
+DURABILITY_NONE = 'none'     # 交給 Python / 作業系統緩衝
+DURABILITY_FLUSH = 'flush'   # 每批 flush 到作業系統
+DURABILITY_FSYNC = 'fsync'   # 每批 fsync 到儲存裝置（SD 卡）
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC)
+
+_STOP = object()
+
+# 使用預寫日誌時，CSV 每隔幾秒或日誌超過多少位元組就 checkpoint（fsync CSV 並清空日誌）
+CHECKPOINT_SECONDS = 60
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+
+def sync_file(f, durability):
+    """依 durability 模式把檔案內容推到作業系統或儲存裝置"""
+    if durability != DURABILITY_NONE:
+        f.flush()
+    if durability == DURABILITY_FSYNC:
+        os.fsync(f.fileno())
+
+
+class BatchWriter:
+    """
+    以佇列餵入的批次寫入執行緒
+
+    子類別實作 _open / _write_batch / _commit / _close，
+    本類別負責排隊、依筆數或時間分批以及關閉時寫完剩餘數據。
+
+    寫入或提交失敗（SD 卡寫滿、I/O 錯誤）時只丟棄該批數據並印出警告，執行緒繼續執行；
+    開啟檔案失敗時標記為 failed，之後的數據直接丟棄。佇列有上限，寫入跟不上時丟棄新的數據，
+    記憶體不會無限增加。
+
+    Args:
+        batch_rows: 累積多少筆就提交一次
+        batch_seconds: 最多等待幾秒就提交一次
+        durability: 'none' / 'flush' / 'fsync'
+        on_batch: 每批寫入後呼叫 on_batch(筆數, 秒數)，用於監控寫入時間
+        max_pending: 佇列中最多等待寫入的筆數
+    """
+
+    thread_name = 'batch-writer'
+
+    def __init__(self, batch_rows=500, batch_seconds=1.0, durability=DURABILITY_FLUSH,
+                 on_batch=None, max_pending=100000):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"未知的 durability 模式: {durability}")
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.durability = durability
+        self.on_batch = on_batch
+        self.queue = queue.Queue(max_pending)
+        self.rows_written = 0
+        self.batches = 0
+        # 因佇列已滿或寫入失敗而丟棄的筆數、失敗次數
+        self.rows_dropped = 0
+        self.errors = 0
+        self.failed = False
+        self._dropping = False
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._closed = False
+
+    def start(self):
+        """啟動寫入執行緒"""
+        self._thread.start()
+        return self
+
+    def write(self, row):
+        """放入一筆數據（不會碰到磁碟，立即返回；佇列已滿或寫入執行緒失敗時丟棄）"""
+        if self.failed:
+            self.rows_dropped += 1
+            return
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.rows_dropped += 1
+            if not self._dropping:
+                self._dropping = True
+                print(f"⚠️  {self.thread_name} 佇列已滿（{self.queue.maxsize} 筆），丟棄新的數據")
+
+    def close(self, timeout=10):
+        """寫完佇列中剩餘的數據後關閉檔案"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                print(f"⚠️  {self.thread_name} 佇列一直是滿的，無法正常關閉")
+                return
+            self._thread.join(timeout)
+
+    def _open(self):
+        """在寫入執行緒中開啟檔案"""
+
+    def _write_batch(self, batch):
+        """寫入一批數據（尚未提交）"""
+        raise NotImplementedError
+
+    def _commit(self):
+        """依 durability 模式提交已寫入的數據"""
+        raise NotImplementedError
+
+    def _close(self):
+        """在寫入執行緒中關閉檔案"""
+
+    def _error(self, action, rows, error):
+        """記錄一次寫入失敗（該批數據丟棄，執行緒繼續執行）"""
+        self.errors += 1
+        self.rows_dropped += rows
+        print(f"⚠️  {self.thread_name} {action}失敗，丟棄 {rows} 筆數據: {error}")
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as e:
+            self.failed = True
+            self.errors += 1
+            print(f"❌ {self.thread_name} 無法開啟檔案，之後的數據不會寫入: {e}")
+            return
+        try:
+            pending = 0
+            deadline = None
+            stopping = False
+            while not stopping:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                # 一次取出佇列中所有已到達的數據
+                batch = []
+                while item is not None:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        item = None
+
+                started = time.perf_counter()
+                if batch:
+                    self._dropping = False
+                    try:
+                        self._write_batch(batch)
+                    except Exception as e:
+                        self._error('寫入', len(batch), e)
+                    else:
+                        self.rows_written += len(batch)
+                        if pending == 0:
+                            deadline = time.monotonic() + self.batch_seconds
+                        pending += len(batch)
+
+                if pending and (stopping or pending >= self.batch_rows
+                                or time.monotonic() >= deadline):
+                    try:
+                        self._commit()
+                        self.batches += 1
+                    except Exception as e:
+                        # 已寫入但沒有提交成功的數據可能遺失
+                        self._error('提交', 0, e)
+                    pending = 0
+                    deadline = None
+
+                if batch and self.on_batch is not None:
+                    self.on_batch(len(batch), time.perf_counter() - started)
+        finally:
+            try:
+                self._close()
+            except Exception as e:
+                self._error('關閉', 0, e)
+
+
+class CsvBatchWriter(BatchWriter):
+    """
+    以佇列餵入的 CSV 寫入執行緒
+
+    指定 wal_path 時每批先寫入預寫日誌，durability 改為套用在日誌上，
+    CSV 只 flush 到作業系統，每 CHECKPOINT_SECONDS 秒才 fsync 一次；
+    斷電後以 recover() 把 CSV 還原到最後一次 checkpoint 並重做日誌。
+
+    Args:
+        path: CSV 檔案路徑
+        fieldnames: 欄位名稱（新檔案會先寫入標題列）
+        wal_path: 預寫日誌檔案路徑（None 表示不使用）
+        其餘參數同 BatchWriter
+    """
+
+    thread_name = 'csv-writer'
+
+    def __init__(self, path, fieldnames, wal_path=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.fieldnames = fieldnames
+        self.wal = WriteAheadLog(wal_path) if wal_path else None
+        self.checkpoints = 0
+        self._recovered = False
+        self._file = None
+        self._writer = None
+        # 使用日誌時先把一批編碼成文字，同一份內容寫入日誌與 CSV
+        self._buffer = io.StringIO()
+        self._buffer_writer = csv.DictWriter(self._buffer, fieldnames=fieldnames)
+        self._last_checkpoint = time.monotonic()
+
+    def _encode(self, rows=None):
+        """把數據（沒有指定時為標題列）編碼成 CSV 文字"""
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if rows is None:
+            self._buffer_writer.writeheader()
+        else:
+            self._buffer_writer.writerows(rows)
+        return self._buffer.getvalue().encode('utf-8')
+
+    def recover(self):
+        """
+        依預寫日誌修復 CSV（必須在 start 之前、讀取 CSV 之前呼叫）
+
+        CSV 截斷到最後一次 checkpoint 的位置（去掉沒有同步完成、可能只寫一半的內容），
+        再依序寫入日誌中所有完整的紀錄，然後 checkpoint。
+        上次正常關閉時不會改動 CSV。
+
+        Returns:
+            int: 重做的筆數
+        """
+        self._recovered = True
+        if self.wal is None:
+            return 0
+        checkpoint, records = self.wal.recover()
+        with open(self.path, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            changed = False
+            if checkpoint is not None and checkpoint < size:
+                f.truncate(checkpoint)
+                size = checkpoint
+                changed = True
+            if size == 0:
+                f.write(self._encode())
+                changed = True
+            elif checkpoint is None:
+                # 第一次使用日誌，之前沒有日誌保護時斷電可能留下沒有換行的半行
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\r\n')
+                    changed = True
+            for record in records:
+                f.write(record)
+                changed = True
+            if changed:
+                f.flush()
+                os.fsync(f.fileno())
+            size = f.tell()
+        if changed or checkpoint is None:
+            self.wal.checkpoint(size)
+        return sum(record.count(b'\n') for record in records)
+
+    def _open(self):
+        if self.wal is not None:
+            if not self._recovered:
+                self.recover()
+            # 日誌模式直接寫入編碼好的內容
+            self._file = open(self.path, 'ab')
+            return
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        if self._file.tell() == 0:
+            self._writer.writeheader()
+
+    def _write_batch(self, batch):
+        if self.wal is None:
+            self._writer.writerows(batch)
+            return
+        data = self._encode(batch)
+        self.wal.append(data)
+        self._file.write(data)
+
+    def _commit(self):
+        if self.wal is None:
+            sync_file(self._file, self.durability)
+            return
+        # 一批只同步一次日誌；CSV 的內容在 checkpoint 之前都可以由日誌重做
+        self.wal.sync(self.durability == DURABILITY_FSYNC)
+        self._file.flush()
+        if (time.monotonic() - self._last_checkpoint >= CHECKPOINT_SECONDS
+                or self.wal.size >= CHECKPOINT_BYTES):
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """fsync CSV 後清空日誌"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.wal.checkpoint(os.fstat(self._file.fileno()).st_size)
+        self._last_checkpoint = time.monotonic()
+        self.checkpoints += 1
+
+    def _close(self):
+        if self.wal is not None:
+            self._checkpoint()
+            self.wal.close()
+        self._file.close()
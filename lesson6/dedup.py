@@ -0,0 +1,237 @@
+"""
+QoS 1 重複訊息過濾
+QoS 1 保證「至少一次」送達，Broker 或發布端重送時同一則訊息可能收到兩次；
+依 (裝置, msg_id) 判斷是否在時間窗口內出現過，使用的記憶體有固定上限，
+不會隨裝置數量或執行時間增加
+
+兩種實作:
+    lru:   OrderedDict 保存最近的 key，準確但每筆約 200 bytes
+    bloom: 兩代輪替的 Bloom filter，每筆只需要約 1.8 bytes（誤判率 0.1%），
+           誤判時會把一筆新數據當成重複而丟棄
+
+QoS 1 的重送發生在幾秒內，時間窗口只需要涵蓋這段時間。
+重送的訊息可能比更新的訊息晚到（msg_id 稍微倒退），因此一律先比對目前的 key；
+Pico 重新開機時 msg_id 會從頭開始（二進位格式超過 65535 也會歸零），
+沒有出現過的 msg_id 大幅倒退時才視為重新開始，該裝置之前的 key 全部作廢。
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+DEDUP_MODES = ('lru', 'bloom')
+
+
+class _Sequences:
+    """
+    每台裝置目前的世代與最大的 msg_id
+
+    沒有出現過的 msg_id 小於最大值的一半（從 0 / 1 重新開始、16 位元編號歸零）時換下一代，
+    key 包含世代，舊世代的 key 不會再被比對到，之後隨時間窗口或數量上限自然淘汰。
+    最多記錄 max_devices 台裝置（最久沒有訊息的先移除）。
+    """
+
+    def __init__(self, max_devices):
+        self.max_devices = max_devices
+        self.resets = 0
+        self._devices = OrderedDict()  # 裝置 -> (世代, 最大的 msg_id)
+
+    @staticmethod
+    def _key(device, epoch, msg_id):
+        return f"{device}\0{epoch}\0{msg_id}"
+
+    def key(self, device, msg_id):
+        """目前世代的 key（用來比對是否重複，不會改變狀態）"""
+        epoch = self._devices.get(device, (0, None))[0]
+        return self._key(device, epoch, msg_id)
+
+    def advance(self, device, msg_id):
+        """
+        登記一則沒有出現過的訊息
+
+        Returns:
+            str: 要記錄的 key（重新開始時為新世代的 key）
+        """
+        epoch, last = self._devices.pop(device, (0, None))
+        if isinstance(msg_id, int) and isinstance(last, int):
+            if msg_id < last // 2:
+                epoch += 1
+                self.resets += 1
+                last = msg_id
+            else:
+                last = max(last, msg_id)
+        else:
+            last = msg_id
+        self._devices[device] = (epoch, last)
+        if len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+        return self._key(device, epoch, msg_id)
+
+    def clear(self):
+        self._devices.clear()
+
+
+class LruDedup:
+    """
+    保存最近 max_entries 個 key 與第一次出現的時間
+
+    Args:
+        max_entries: 最多保存的 key 數（所有裝置共用）
+        window: 時間窗口（秒）
+    """
+
+    def __init__(self, max_entries, window):
+        self.max_entries = max_entries
+        self.window = window
+        self.duplicates = 0
+        self._seen = OrderedDict()
+        self._sequences = _Sequences(max_entries)
+        self._lock = threading.Lock()
+
+    def seen(self, device, msg_id, ts):
+        """
+        檢查並記錄一則訊息
+
+        Returns:
+            bool: 時間窗口內已經出現過（重複訊息）
+        """
+        with self._lock:
+            first = self._seen.get(self._sequences.key(device, msg_id))
+            if first is not None and ts - first <= self.window:
+                self.duplicates += 1
+                return True
+            key = self._sequences.advance(device, msg_id)
+            self._seen[key] = ts
+            self._seen.move_to_end(key)
+            # 最舊的 key 在最前面：移除超過數量上限或已過期的
+            while self._seen:
+                oldest = next(iter(self._seen.values()))
+                if len(self._seen) <= self.max_entries and ts - oldest <= self.window:
+                    break
+                self._seen.popitem(last=False)
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+            self._sequences.clear()
+
+    def stats(self):
+        return {'mode': 'lru', 'entries': len(self._seen), 'max_entries': self.max_entries,
+                'window_seconds': self.window, 'duplicates': self.duplicates,
+                'resets': self._sequences.resets}
+
+
+class BloomDedup:
+    """
+    兩代輪替的 Bloom filter
+
+    查詢時檢查目前與上一代，只寫入目前這一代；目前這一代寫滿 capacity 個 key
+    或超過半個時間窗口時，丟棄上一代並換上新的一代。
+    每個 key 至少保留 min(window / 2, capacity 筆) 的時間，記憶體固定為兩代的位元陣列。
+
+    Args:
+        capacity: 每一代的 key 數
+        window: 時間窗口（秒）
+        false_positive: 每一代寫滿時的誤判率
+    """
+
+    def __init__(self, capacity, window, false_positive=0.001):
+        self.capacity = capacity
+        self.window = window
+        self.false_positive = false_positive
+        # 最佳位元數與雜湊次數: m = -n ln p / (ln 2)^2, k = m / n * ln 2
+        self.bits = max(8, int(math.ceil(-capacity * math.log(false_positive) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.duplicates = 0
+        self.rotations = 0
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._started = None
+        self._sequences = _Sequences(capacity)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # 以一次 blake2b 的兩個 64 位元值做雙重雜湊（Kirsch–Mitzenmacher）
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _rotate(self):
+        self._previous = self._current
+        self._current = bytearray(len(self._previous))
+        self._count = 0
+        self.rotations += 1
+
+    def seen(self, device, msg_id, ts):
+        """
+        檢查並記錄一則訊息
+
+        Returns:
+            bool: 時間窗口內可能已經出現過（重複訊息或誤判）
+        """
+        with self._lock:
+            key = self._sequences.key(device, msg_id)
+            positions = self._positions(key)
+            if self._started is None:
+                self._started = ts
+            elif self._count >= self.capacity or ts - self._started > self.window / 2:
+                self._rotate()
+                if ts - self._started > self.window:
+                    # 超過一整個窗口沒有訊息，上一代也已經過期
+                    self._rotate()
+                self._started = ts
+            if self._contains(self._current, positions) or self._contains(self._previous, positions):
+                self.duplicates += 1
+                return True
+            new_key = self._sequences.advance(device, msg_id)
+            if new_key != key:
+                positions = self._positions(new_key)
+            for p in positions:
+                self._current[p >> 3] |= 1 << (p & 7)
+            self._count += 1
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._current = bytearray(len(self._current))
+            self._previous = bytearray(len(self._current))
+            self._count = 0
+            self._started = None
+            self._sequences.clear()
+
+    def stats(self):
+        return {'mode': 'bloom', 'entries': self._count, 'capacity': self.capacity,
+                'window_seconds': self.window, 'false_positive': self.false_positive,
+                'memory_bytes': 2 * len(self._current), 'hashes': self.hashes,
+                'rotations': self.rotations, 'duplicates': self.duplicates,
+                'resets': self._sequences.resets}
+
+
+def create_dedup(mode, max_entries, window, false_positive=0.001):
+    """
+    依模式建立重複訊息過濾器
+
+    Args:
+        mode: 'lru' / 'bloom'，None 表示不過濾
+        max_entries: lru 保存的 key 數 / bloom 每一代的 key 數
+        window: 時間窗口（秒）
+        false_positive: bloom 的誤判率
+
+    Returns:
+        LruDedup / BloomDedup，mode 為 None 時回傳 None
+    """
+    if mode is None:
+        return None
+    if mode == 'lru':
+        return LruDedup(max_entries, window)
+    if mode == 'bloom':
+        return BloomDedup(max_entries, window, false_positive)
+    raise ValueError(f"不支援的去重模式: {mode}（可用: {', '.join(DEDUP_MODES)}）")
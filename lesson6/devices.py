@@ -0,0 +1,115 @@
+"""
+多裝置狀態索引
+依裝置名稱（或 MQTT 主題）保存每台 Pico 的最新狀態與歷史緩衝區，
+以 dict 直接查找，不需要掃描所有裝置
+"""
+
+import threading
+
+from ring_buffer import SensorRingBuffer, to_record
+
+
+class DeviceState:
+    """單一裝置的狀態"""
+
+    def __init__(self, name, topic, capacity):
+        self.name = name
+        self.topic = topic
+        self.history = SensorRingBuffer(capacity)
+        self.messages = 0
+
+    def summary(self):
+        """裝置摘要（最新數據 + 統計）"""
+        return {
+            'device': self.name,
+            'topic': self.topic,
+            'messages': self.messages,
+            'latest': self.history.latest()
+        }
+
+
+class DeviceRegistry:
+    """
+    裝置索引
+
+    Args:
+        capacity: 每台裝置保留的歷史筆數
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.devices = {}
+        self.by_topic = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, name):
+        """依名稱取得裝置，不存在時回傳 None"""
+        return self.devices.get(name)
+
+    def update(self, name, topic, ts, temperature, humidity, light_status):
+        """
+        記錄一筆裝置數據，第一次出現的裝置會自動建立
+
+        Returns:
+            DeviceState: 該裝置的狀態
+        """
+        state = self.devices.get(name)
+        if state is None:
+            with self._lock:
+                state = self.devices.get(name)
+                if state is None:
+                    state = DeviceState(name, topic, self.capacity)
+                    self.devices[name] = state
+                    self.by_topic.setdefault(topic, set()).add(name)
+        elif state.topic != topic:
+            with self._lock:
+                self.by_topic.get(state.topic, set()).discard(name)
+                self.by_topic.setdefault(topic, set()).add(name)
+                state.topic = topic
+        state.history.append(ts, temperature, humidity, light_status)
+        state.messages += 1
+        return state
+
+    def restore(self, name, topic, messages):
+        """
+        重建一台裝置（從快照載入時使用，歷史數據由呼叫端填入）
+
+        Returns:
+            DeviceState: 新建立的裝置狀態
+        """
+        state = DeviceState(name, topic, self.capacity)
+        state.messages = messages
+        with self._lock:
+            self.devices[name] = state
+            self.by_topic.setdefault(topic, set()).add(name)
+        return state
+
+    def names(self, topic=None):
+        """裝置名稱列表，可依主題篩選"""
+        with self._lock:
+            if topic is None:
+                return sorted(self.devices)
+            return sorted(self.by_topic.get(topic, ()))
+
+    def latest(self, name):
+        """裝置的最新數據（含裝置名稱），不存在時回傳 None"""
+        state = self.devices.get(name)
+        if state is None:
+            return None
+        latest = state.history.latest()
+        return latest and {**latest, 'device': name}
+
+    def summaries(self, topic=None):
+        """所有（或指定主題）裝置的摘要列表"""
+        return [self.devices[name].summary() for name in self.names(topic)]
+
+
+def record_with_device(ts, temperature, humidity, light_status, device, msg_id=None):
+    """組成含裝置名稱（與訊息編號）的 API dict"""
+    record = {**to_record(ts, temperature, humidity, light_status), 'device': device}
+    if msg_id is not None:
+        record['msg_id'] = msg_id
+    return record
@@ -0,0 +1,163 @@
+"""
+圖表用的降採樣
+把任意長度的時間序列壓縮到最多 N 個點：
+- 時間分桶的 min / max / mean 統計
+- Largest-Triangle-Three-Buckets（LTTB）挑選最能保留形狀的原始點
+"""
+
+# 嘗試導入 NumPy（用於向量化運算）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+def bucket_aggregate(ts, columns, n, t0=None, t1=None):
+    """
+    依時間把數據分成 n 個等寬的桶，計算每桶的 min / max / mean
+
+    Args:
+        ts: 時間戳記（epoch 秒數）
+        columns: {名稱: 數值序列}
+        n: 桶數（即最多回傳的點數）
+        t0, t1: 時間範圍，預設為數據本身的最早與最晚時間
+
+    Returns:
+        list: 每個非空的桶一個 dict，含 ts（桶的中心時間）、count、
+              以及每個欄位的 名稱 / 名稱_min / 名稱_max
+    """
+    if len(ts) == 0 or n <= 0:
+        return []
+    if not HAS_NUMPY:
+        return _bucket_aggregate_python(ts, columns, n, t0, t1)
+
+    ts = np.asarray(ts, dtype=float)
+    order = None
+    if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+        order = np.argsort(ts, kind='stable')
+        ts = ts[order]
+    t0 = ts[0] if t0 is None else t0
+    t1 = ts[-1] if t1 is None else t1
+    width = (t1 - t0) / n or 1.0
+
+    index = np.clip(((ts - t0) / width).astype(np.int64), 0, n - 1)
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    counts = np.diff(np.r_[starts, len(ts)])
+
+    result = {
+        'ts': (t0 + (index[starts] + 0.5) * width).tolist(),
+        'count': counts.tolist()
+    }
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=float)
+        if order is not None:
+            values = values[order]
+        result[name] = (np.add.reduceat(values, starts) / counts).tolist()
+        result[f'{name}_min'] = np.minimum.reduceat(values, starts).tolist()
+        result[f'{name}_max'] = np.maximum.reduceat(values, starts).tolist()
+    return [dict(zip(result, row)) for row in zip(*result.values())]
+
+
+def _bucket_aggregate_python(ts, columns, n, t0, t1):
+    """沒有 NumPy 時的逐筆版本"""
+    pairs = sorted(range(len(ts)), key=ts.__getitem__)
+    t0 = ts[pairs[0]] if t0 is None else t0
+    t1 = ts[pairs[-1]] if t1 is None else t1
+    width = (t1 - t0) / n or 1.0
+
+    buckets = {}
+    for i in pairs:
+        b = min(max(int((ts[i] - t0) / width), 0), n - 1)
+        buckets.setdefault(b, []).append(i)
+
+    rows = []
+    for b in sorted(buckets):
+        members = buckets[b]
+        row = {'ts': t0 + (b + 0.5) * width, 'count': len(members)}
+        for name, values in columns.items():
+            picked = [float(values[i]) for i in members]
+            row[name] = sum(picked) / len(picked)
+            row[f'{name}_min'] = min(picked)
+            row[f'{name}_max'] = max(picked)
+        rows.append(row)
+    return rows
+
+
+def lttb_indices(ts, series, n):
+    """
+    Largest-Triangle-Three-Buckets 降採樣
+
+    第一與最後一點固定保留，中間分成 n - 2 個桶，每桶挑出與
+    「前一個選中點」和「下一桶平均點」構成最大三角形的點。
+    多條數列共用同一組 x 時，先把各數列正規化到 0~1 再加總面積，
+    讓圖表的所有數列使用同一組時間點。
+
+    Args:
+        ts: 時間戳記（x 軸，需依時間排序）
+        series: 數值序列的列表（y 軸）
+        n: 最多保留的點數
+
+    Returns:
+        list: 被選中的原始索引（遞增）
+    """
+    length = len(ts)
+    if n >= length:
+        return list(range(length))
+    if n < 3:
+        return [0, length - 1][:max(n, 0)]
+    if not HAS_NUMPY:
+        return _lttb_python(ts, series, n)
+
+    x = np.asarray(ts, dtype=float)
+    y = np.vstack([np.asarray(values, dtype=float) for values in series])
+    low = y.min(axis=1, keepdims=True)
+    span = y.max(axis=1, keepdims=True) - low
+    y = (y - low) / np.where(span > 0, span, 1.0)
+
+    edges = np.linspace(1, length - 1, n - 1).astype(np.int64)
+    selected = [0]
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else length
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[:, hi:next_hi].mean(axis=1, keepdims=True)
+        # 每個候選點的三角形面積（省略 1/2），各數列相加
+        area = np.abs((x[a] - avg_x) * (y[:, lo:hi] - y[:, a:a + 1])
+                      - (x[a] - x[lo:hi]) * (avg_y - y[:, a:a + 1])).sum(axis=0)
+        a = lo + int(np.argmax(area))
+        selected.append(a)
+    selected.append(length - 1)
+    return selected
+
+
+def _lttb_python(ts, series, n):
+    """沒有 NumPy 時的逐筆版本"""
+    length = len(ts)
+    x = [float(v) for v in ts]
+    y = []
+    for values in series:
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        y.append([(float(v) - low) / span for v in values])
+
+    step = (length - 2) / (n - 2)
+    edges = [int(1 + step * i) for i in range(n - 2)] + [length - 1]
+    selected = [0]
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else length
+        avg_x = sum(x[hi:next_hi]) / (next_hi - hi)
+        avg_y = [sum(col[hi:next_hi]) / (next_hi - hi) for col in y]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = sum(abs((x[a] - avg_x) * (col[j] - col[a]) - (x[a] - x[j]) * (avg - col[a]))
+                       for col, avg in zip(y, avg_y))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(length - 1)
+    return selected
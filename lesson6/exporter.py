@@ -0,0 +1,198 @@
+"""
+串流匯出 CSV / XLSX / Parquet
+數據由儲存引擎分批讀出、分批編碼後送出，記憶體用量不隨匯出筆數增加
+"""
+
+import csv
+import io
+import tempfile
+
+from csv_reader import CSV_FIELDNAMES
+from ring_buffer import format_timestamp
+
+# 嘗試導入 openpyxl（用於 Excel）
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+# 嘗試導入 pyarrow（用於 Parquet）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# 格式: (Content-Type, 副檔名)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+# XLSX 最多匯出的筆數：XLSX 是 zip 格式，必須整份寫完才能送出第一個位元組，
+# 筆數越多等待越久，更大的匯出請改用 CSV / Parquet（邊讀邊送出）
+XLSX_MAX_ROWS = 100000
+# 暫存檔讀出時每次送出的位元組數
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _csv_rows(chunk):
+    return [(format_timestamp(ts), light_status, temperature, humidity)
+            for ts, temperature, humidity, light_status in chunk]
+
+
+def export_csv(chunks):
+    """
+    CSV 匯出（與 sensor_data.csv 相同的欄位）
+
+    Args:
+        chunks: 產生 (ts, 溫度, 濕度, 電燈狀態) 列表的迭代器
+
+    Yields:
+        bytes: 每批編碼後的內容
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDNAMES)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_csv_rows(chunk))
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _xlsx_header(ws):
+    """標題列（樣式同 generate_test_data.py 的 save_to_excel）"""
+    cells = []
+    for name in CSV_FIELDNAMES:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(color="FFFFFF", bold=True)
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cells.append(cell)
+    return cells
+
+
+def export_xlsx(chunks, max_rows=XLSX_MAX_ROWS):
+    """
+    XLSX 匯出（openpyxl write-only 模式，最多 max_rows 筆）
+
+    write-only 模式逐列寫入暫存檔，不會在記憶體中保留整個活頁簿；
+    但 XLSX 是 zip 格式，必須整份寫完才能送出第一個位元組，因此限制筆數。
+
+    Yields:
+        bytes: 檔案內容
+
+    Raises:
+        ValueError: 超過 max_rows 筆（在送出第一個位元組之前）
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("感測器數據")
+    ws.column_dimensions['A'].width = 20
+    ws.column_dimensions['B'].width = 12
+    ws.append(_xlsx_header(ws))
+    written = 0
+    for chunk in chunks:
+        written += len(chunk)
+        if written > max_rows:
+            # 先關閉工作表的暫存檔，避免未寫完的工作表被回收時報錯
+            ws.close()
+            raise ValueError(f"XLSX 匯出最多 {max_rows} 筆，請縮小時間範圍或改用 CSV / Parquet 匯出")
+        for row in _csv_rows(chunk):
+            ws.append(row)
+
+    with tempfile.TemporaryFile() as f:
+        wb.save(f)
+        f.seek(0)
+        while True:
+            data = f.read(FILE_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+
+class _ChunkSink(io.RawIOBase):
+    """收集寫入內容的檔案物件，由產生器取走後清空"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def export_parquet(chunks, row_group_rows=65536):
+    """
+    Parquet 匯出（每累積 row_group_rows 筆寫成一個 row group 並送出）
+
+    Yields:
+        bytes: 檔案內容
+    """
+    schema = pa.schema([
+        (CSV_FIELDNAMES[0], pa.string()),
+        (CSV_FIELDNAMES[1], pa.dictionary(pa.int8(), pa.string())),
+        (CSV_FIELDNAMES[2], pa.float64()),
+        (CSV_FIELDNAMES[3], pa.float64())
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    def write_group(rows):
+        columns = list(zip(*rows))
+        writer.write_table(pa.table([
+            pa.array(columns[0], pa.string()),
+            pa.array(columns[1], pa.string()).dictionary_encode().cast(schema.field(1).type),
+            pa.array(columns[2], pa.float64()),
+            pa.array(columns[3], pa.float64())
+        ], schema=schema), row_group_size=row_group_rows)
+
+    pending = []
+    for chunk in chunks:
+        pending.extend(_csv_rows(chunk))
+        while len(pending) >= row_group_rows:
+            write_group(pending[:row_group_rows])
+            del pending[:row_group_rows]
+            yield sink.take()
+    if pending:
+        write_group(pending)
+    writer.close()
+    yield sink.take()
+
+
+def stream_export(fmt, chunks):
+    """
+    依格式產生匯出內容
+
+    Raises:
+        ValueError: 未知的格式或缺少需要的套件
+    """
+    if fmt == 'csv':
+        return export_csv(chunks)
+    if fmt == 'xlsx':
+        if not HAS_OPENPYXL:
+            raise ValueError("XLSX 匯出需要 openpyxl")
+        return export_xlsx(chunks)
+    if fmt == 'parquet':
+        if not HAS_PYARROW:
+            raise ValueError("Parquet 匯出需要 pyarrow")
+        return export_parquet(chunks)
+    raise ValueError(f"未知的匯出格式: {fmt}")
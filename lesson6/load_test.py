@@ -0,0 +1,281 @@
+"""
+壓力測試工具：模擬 N 台虛擬 Pico
+每台虛擬裝置以固定頻率發布與 Pico 相同格式的訊息（JSON 或二進位），
+同時以 WebSocket 客戶端接收 new_data，計算發布到推送的延遲
+
+統計項目:
+    - 實際發布速率（msgs/s）與發布失敗筆數
+    - 伺服器收到 / 解析 / 丟棄的筆數（讀取 /metrics）
+    - 發布到 new_data 的延遲百分位數（new_data 每批只附帶最新的部分數據，
+      因此延遲是抽樣統計）
+
+使用方式:
+    uv run python load_test.py --devices 1000 --rate 1 --duration 60
+    uv run python load_test.py --devices 5000 --processes 4 --format binary --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+
+import paho.mqtt.client as mqtt
+
+from asgi_runtime import AsyncioMqttLoop
+from mqtt_broker import start_broker_thread
+from payload_codec import encode_binary
+
+# 嘗試導入 Socket.IO 客戶端（用於量測推送延遲）
+try:
+    import socketio
+    import requests  # noqa: F401  python-socketio 客戶端需要
+    HAS_SOCKETIO_CLIENT = True
+except ImportError:
+    HAS_SOCKETIO_CLIENT = False
+
+# 預設設定
+BROKER = "localhost"
+PORT = 1883
+APP_URL = "http://localhost:8080"
+# 等待所有連線建立的最長秒數
+CONNECT_TIMEOUT = 60
+
+
+def device_name(index):
+    """虛擬裝置名稱（同時作為主題的第一層）"""
+    return f"load{index:05d}"
+
+
+def make_payload(fmt, name, msg_id, sent_at):
+    """依 Pico 程式的格式產生訊息"""
+    temperature = round(20 + random.uniform(-5, 10), 2)
+    humidity = round(50 + random.uniform(-10, 20), 2)
+    light_on = random.random() < 0.5
+    if fmt == 'binary':
+        return encode_binary(temperature, humidity, '開' if light_on else '關', name, msg_id)
+    return json.dumps({
+        "temperature": temperature,
+        "humidity": humidity,
+        "light_status": "開" if light_on else "關",
+        "device": name,
+        "msg_id": msg_id,
+        "sent_at": sent_at
+    }, ensure_ascii=False)
+
+
+async def run_device(client, index, args, start, stats):
+    """單一虛擬裝置：依 rate 發布到測試結束"""
+    name = device_name(index)
+    topic = f"{name}/sensor"
+    interval = 1.0 / args.rate
+    # 錯開各裝置的發布時間，避免同時送出
+    next_at = start + random.uniform(0, interval)
+    end = start + args.duration
+    msg_id = 0
+    while next_at < end:
+        await asyncio.sleep(max(next_at - time.time(), 0))
+        sent_at = time.time()
+        # 二進位格式的 msg_id 只有 16 位元
+        key_id = msg_id & 0xFFFF if args.format == 'binary' else msg_id
+        result = client.publish(topic, make_payload(args.format, name, msg_id, sent_at), qos=args.qos)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            stats['sent'] += 1
+            stats['send_times'][(name, key_id)] = sent_at
+        else:
+            stats['failed'] += 1
+        msg_id += 1
+        next_at += interval
+
+
+async def run_devices(args, indexes, connections):
+    """在一個事件迴圈中執行一組虛擬裝置"""
+    stats = {'sent': 0, 'failed': 0, 'send_times': {}}
+    groups = [indexes[i::connections] for i in range(connections)]
+    clients, tasks = [], []
+    for k, group in enumerate(groups):
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                             client_id=f"load-{os.getpid()}-{k}")
+        client.max_inflight_messages_set(1000)
+        tasks.append(asyncio.create_task(AsyncioMqttLoop(client, args.broker, args.port).run()))
+        clients.append((client, group))
+
+    deadline = time.time() + CONNECT_TIMEOUT
+    while not all(client.is_connected() for client, _ in clients) and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    connected = sum(client.is_connected() for client, _ in clients)
+
+    start = time.time()
+    await asyncio.gather(*(run_device(client, index, args, start, stats)
+                           for client, group in clients for index in group))
+    stats['elapsed'] = time.time() - start
+    # 等待 QoS 1 的確認送完
+    await asyncio.sleep(1)
+    for task in tasks:
+        task.cancel()
+    for client, _ in clients:
+        client.disconnect()
+    stats['connected'] = connected
+    return stats
+
+
+def worker(args, indexes, connections):
+    """子程序進入點"""
+    return asyncio.run(run_devices(args, indexes, connections))
+
+
+class LatencyProbe:
+    """以 WebSocket 接收 new_data，記錄每筆 (裝置, msg_id) 第一次出現的時間"""
+
+    def __init__(self, url):
+        self.url = url
+        self.received = {}
+        self.frames = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        self.client = socketio.Client()
+        self.client.on('new_data', self._on_data)
+
+    def _on_data(self, data):
+        now = time.time()
+        with self._lock:
+            self.frames += 1
+            for row in data.get('rows', [data]):
+                self.rows += 1
+                self.received.setdefault((row.get('device'), row.get('msg_id')), now)
+        # 回傳值作為 ack，讓伺服器繼續推送
+        return True
+
+    def start(self):
+        self.client.connect(self.url)
+        return self
+
+    def stop(self):
+        self.client.disconnect()
+
+
+def read_metrics(url):
+    """
+    讀取伺服器 /metrics 的訊息計數（各主題加總）
+
+    Returns:
+        dict: 讀取失敗時為 None
+    """
+    try:
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            text = response.read().decode('utf-8')
+    except OSError:
+        return None
+    totals = {}
+    for name in ('pico_mqtt_messages_received_total', 'pico_mqtt_messages_parsed_total',
+                 'pico_mqtt_messages_failed_total', 'pico_queue_dropped_total'):
+        values = re.findall(rf'^{name}(?:{{[^}}]*}})? (\S+)$', text, re.M)
+        totals[name] = sum(float(value) for value in values)
+    return totals
+
+
+def percentile(values, q):
+    """已排序列表的百分位數（最近的排名）"""
+    if not values:
+        return None
+    return values[min(int(q / 100 * len(values)), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模擬 N 台虛擬 Pico 的壓力測試')
+    parser.add_argument('--devices', type=int, default=100, help='虛擬裝置數')
+    parser.add_argument('--rate', type=float, default=1.0, help='每台裝置每秒發布幾筆')
+    parser.add_argument('--duration', type=float, default=30, help='測試秒數')
+    parser.add_argument('--connections', type=int, default=0,
+                        help='MQTT 連線數（0 表示每台裝置一條連線）')
+    parser.add_argument('--processes', type=int, default=1, help='發布端的程序數')
+    parser.add_argument('--format', choices=['json', 'binary'], default='json', help='訊息格式')
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=1)
+    parser.add_argument('--broker', default=BROKER)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--embedded-broker', action='store_true',
+                        help='在本程式內啟動 MQTT Broker（監聽 --port，app_flask 需連到同一個埠）')
+    parser.add_argument('--app', default=APP_URL, help='app_flask 的網址（讀取 /metrics 與 WebSocket）')
+    parser.add_argument('--json', dest='json_path', help='把結果另存成 JSON 檔')
+    args = parser.parse_args()
+
+    if args.embedded_broker:
+        broker = start_broker_thread('0.0.0.0', args.port)
+        args.broker = '127.0.0.1'
+        print(f"✅ 內建 MQTT Broker 已啟動: 0.0.0.0:{broker.port}")
+
+    connections = args.connections or args.devices
+    processes = max(1, min(args.processes, connections))
+    print("=" * 60)
+    print(f" 壓力測試: {args.devices} 台裝置 x {args.rate} 筆/秒，{args.duration} 秒")
+    print(f" MQTT: {args.broker}:{args.port}，{connections} 條連線，{processes} 個程序")
+    print("=" * 60)
+
+    probe = None
+    if HAS_SOCKETIO_CLIENT:
+        try:
+            probe = LatencyProbe(args.app).start()
+        except Exception as e:
+            print(f"⚠️  無法連線 WebSocket（{e}），略過延遲量測")
+    else:
+        print("⚠️  未安裝 python-socketio 客戶端（requests / websocket-client），略過延遲量測")
+    before = read_metrics(args.app)
+
+    indexes = list(range(args.devices))
+    jobs = [(args, indexes[p::processes], len(range(p, connections, processes)))
+            for p in range(processes)]
+    if processes == 1:
+        results = [worker(*jobs[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(worker, jobs)
+
+    # 等待伺服器處理完佇列
+    time.sleep(2)
+    after = read_metrics(args.app)
+    if probe is not None:
+        probe.stop()
+
+    sent = sum(r['sent'] for r in results)
+    elapsed = max(r['elapsed'] for r in results)
+    report = {
+        'devices': args.devices,
+        'connections': connections,
+        'connected': sum(r['connected'] for r in results),
+        'target_rate': args.devices * args.rate,
+        'sent': sent,
+        'failed': sum(r['failed'] for r in results),
+        'achieved_rate': sent / elapsed if elapsed else 0
+    }
+    if before is not None and after is not None:
+        report['server'] = {name: after[name] - before[name] for name in after}
+        report['server']['missing'] = sent - report['server']['pico_mqtt_messages_received_total']
+
+    if probe is not None:
+        send_times = {}
+        for r in results:
+            send_times.update(r['send_times'])
+        latencies = sorted((received - send_times[key]) * 1000
+                           for key, received in probe.received.items() if key in send_times)
+        report['websocket'] = {
+            'frames': probe.frames,
+            'rows': probe.rows,
+            'sampled': len(latencies),
+            'latency_ms': {f'p{q}': percentile(latencies, q) for q in (50, 90, 99)}
+        }
+        report['websocket']['latency_ms']['max'] = latencies[-1] if latencies else None
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已儲存: {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Prometheus 格式的監控指標
+計數器與直方圖都是預先配置好的數值欄位，記錄時不取鎖，
+由 /metrics 讀取時才組成文字格式（text exposition format 0.0.4）
+
+每個指標應只由一個執行緒更新（例如解析指標只在解析階段更新），
+在 GIL 之下不需要鎖也不會遺失計數；讀取端可能看到稍舊的數值。
+"""
+
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 預設的延遲區間（秒）：50µs ~ 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """有標籤的指標：每組標籤值對應一個子指標"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """取得（或建立）這組標籤值的子指標"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要標籤: {', '.join(self.labelnames)}")
+            # setdefault 是單一操作，兩個執行緒同時建立時只會保留一個
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self, values, child):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只會增加的計數器"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        """沒有標籤時直接增加"""
+        self._default.value += amount
+
+    def _samples(self, values, child):
+        labels = _format_labels(self.labelnames, values)
+        return [f'{self.name}{labels} {_format_value(child.value)}']
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # 最後一格是 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """
+    固定區間的直方圖
+
+    Args:
+        buckets: 由小到大的區間上界（不含 +Inf）
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        """沒有標籤時直接記錄"""
+        self._default.observe(value)
+
+    def _samples(self, values, child):
+        counts = list(child.counts)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    讀取時才計算的量測值（佇列深度、連線數等）
+
+    Args:
+        collect: 無參數函式；沒有標籤時回傳數值，有標籤時回傳 {標籤值 tuple: 數值}
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.collect = collect
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        values = self.collect()
+        if not self.labelnames:
+            values = {(): values}
+        for labels, value in values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} '
+                         f'{_format_value(value)}')
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """
+    讀取時才取得數值的計數器（來源本身就是只增加的累計值，例如佇列的丟棄筆數）
+
+    與 Gauge 相同以 collect 取得數值，但輸出為 counter，rate() 與重新啟動歸零的處理才正確；
+    名稱必須以 _total 結尾。
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        if not name.endswith('_total'):
+            raise ValueError(f"計數器名稱必須以 _total 結尾: {name}")
+        super().__init__(name, documentation, collect, labelnames)
+
+
+class MetricsRegistry:
+    """指標的集合，依註冊順序輸出"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"指標名稱重複: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._register(Gauge(name, documentation, collect, labelnames))
+
+    def callback_counter(self, name, documentation, collect, labelnames=()):
+        return self._register(CallbackCounter(name, documentation, collect, labelnames))
+
+    def render(self):
+        """組成 Prometheus 文字格式"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} 讀取失敗: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,425 @@
+"""
+內建 MQTT 3.1.1 Broker（asyncio）
+不需要安裝 Mosquitto 就能執行 app_flask.py、測試程式與壓力測試；
+可以在程式內的背景執行緒啟動，或單獨執行監聽一個埠
+
+支援:
+    - QoS 0 / 1（QoS 2 的發布以 QoS 1 轉送）
+    - + / # 萬用字元訂閱
+    - 保留訊息（retained）與遺囑訊息（will）
+    - keepalive 逾時、相同 client_id 重複連線時中斷舊連線
+
+不支援: 持久 session（clean_session=False 視同 True）、帳號驗證、TLS
+
+使用方式:
+    uv run python mqtt_broker.py --port 1883
+"""
+
+import argparse
+import asyncio
+import itertools
+import struct
+import threading
+
+# 封包類型
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# CONNACK 回應碼
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+
+# 單一封包的最大長度（位元組）
+MAX_PACKET_SIZE = 256 * 1024
+# 客戶端的傳送緩衝超過此位元組數時，丟棄送給它的 QoS 0 訊息
+MAX_CLIENT_BUFFER = 1024 * 1024
+# CONNECT 必須在連線後幾秒內送達
+CONNECT_TIMEOUT = 10
+
+
+def topic_matches(topic_filter, topic):
+    """
+    主題是否符合訂閱的過濾條件
+
+    + 比對單一層，# 比對剩下的所有層（包含零層）；
+    以 $ 開頭的主題不會被第一層的萬用字元比對到
+
+    Args:
+        topic_filter: 訂閱的主題，例如 '+/sensor' 或 'room1/#'
+        topic: 發布的主題
+    """
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        return False
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length):
+    """剩餘長度（每位元組 7 位元的可變長度編碼）"""
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | 0x80 if length else digit)
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(packet_type, flags, body=b''):
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _string(value):
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def publish_packet(topic, payload, qos=0, retain=False, packet_id=None):
+    """編碼 PUBLISH 封包"""
+    body = _string(topic)
+    if qos:
+        body += struct.pack('!H', packet_id)
+    return _packet(PUBLISH, qos << 1 | int(retain), body + payload)
+
+
+class _Reader:
+    """依序讀取封包內容的欄位"""
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def uint16(self):
+        value, = struct.unpack_from('!H', self.data, self.position)
+        self.position += 2
+        return value
+
+    def byte(self):
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def binary(self):
+        length = self.uint16()
+        value = self.data[self.position:self.position + length]
+        if len(value) != length:
+            raise ValueError("封包長度不足")
+        self.position += length
+        return value
+
+    def string(self):
+        return self.binary().decode('utf-8')
+
+    def rest(self):
+        return self.data[self.position:]
+
+    def remaining(self):
+        return len(self.data) - self.position
+
+
+class Session:
+    """一條客戶端連線"""
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.keepalive = 0
+        self.will = None
+        self.subscriptions = {}
+        self.closed = False
+        self.dropped = 0
+        self._packet_ids = itertools.cycle(range(1, 65536))
+
+    def send(self, data):
+        if not self.closed:
+            self.writer.write(data)
+
+    def deliver(self, topic, payload, qos, retain=False):
+        """把訊息送給這個客戶端（傳送緩衝過大時丟棄 QoS 0 訊息）"""
+        if self.closed:
+            return
+        if qos == 0 and self.writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            self.dropped += 1
+            return
+        packet_id = next(self._packet_ids) if qos else None
+        self.writer.write(publish_packet(topic, payload, qos, retain, packet_id))
+
+    async def read_packet(self):
+        """
+        讀取一個封包
+
+        Returns:
+            tuple: (類型, 旗標, 內容)
+        """
+        header = await self.reader.readexactly(1)
+        length = 0
+        for shift in range(0, 28, 7):
+            digit = (await self.reader.readexactly(1))[0]
+            length |= (digit & 0x7F) << shift
+            if not digit & 0x80:
+                break
+        else:
+            raise ValueError("剩餘長度編碼錯誤")
+        if length > MAX_PACKET_SIZE:
+            raise ValueError(f"封包過大: {length}")
+        body = await self.reader.readexactly(length) if length else b''
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    async def run(self):
+        """處理連線直到斷線"""
+        clean_exit = False
+        try:
+            packet_type, flags, body = await asyncio.wait_for(self.read_packet(), CONNECT_TIMEOUT)
+            if packet_type != CONNECT or not self._connect(_Reader(body)):
+                return
+            # keepalive 的 1.5 倍時間內沒有收到任何封包即視為斷線
+            timeout = self.keepalive * 1.5 if self.keepalive else None
+            while True:
+                packet_type, flags, body = await asyncio.wait_for(self.read_packet(), timeout)
+                if packet_type == DISCONNECT:
+                    clean_exit = True
+                    return
+                self._handle(packet_type, flags, _Reader(body))
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError) as e:
+            print(f"⚠️  MQTT 封包格式錯誤（{self.client_id}）: {e}")
+        finally:
+            self.closed = True
+            self.broker.remove_session(self)
+            if self.will and not clean_exit:
+                self.broker.publish(*self.will)
+            self.writer.close()
+
+    def _connect(self, packet):
+        protocol = packet.string()
+        level = packet.byte()
+        if (protocol, level) not in (('MQTT', 4), ('MQIsdp', 3)):
+            self.writer.write(_packet(CONNACK, 0, bytes([0, CONNACK_BAD_PROTOCOL])))
+            return False
+        flags = packet.byte()
+        self.keepalive = packet.uint16()
+        self.client_id = packet.string() or f"auto-{id(self):x}"
+        if flags & 0x04:
+            will_topic = packet.string()
+            will_payload = packet.binary()
+            self.will = (will_topic, will_payload, min((flags >> 3) & 0x03, 1), bool(flags & 0x20))
+        # 帳號密碼（flags & 0x80 / 0x40）不檢查
+        self.broker.add_session(self)
+        self.send(_packet(CONNACK, 0, bytes([0, CONNACK_ACCEPTED])))
+        return True
+
+    def _handle(self, packet_type, flags, packet):
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic = packet.string()
+            packet_id = packet.uint16() if qos else None
+            self.broker.publish(topic, packet.rest(), min(qos, 1), bool(flags & 0x01))
+            if qos == 1:
+                self.send(_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+            elif qos == 2:
+                # 收到時即轉送，PUBREL 只需要回應 PUBCOMP
+                self.send(_packet(PUBREC, 0, struct.pack('!H', packet_id)))
+        elif packet_type == PUBREL:
+            self.send(_packet(PUBCOMP, 0, struct.pack('!H', packet.uint16())))
+        elif packet_type == SUBSCRIBE:
+            packet_id = packet.uint16()
+            granted = []
+            new_filters = []
+            while packet.remaining():
+                topic_filter = packet.string()
+                qos = min(packet.byte() & 0x03, 1)
+                self.subscriptions[topic_filter] = qos
+                new_filters.append(topic_filter)
+                granted.append(qos)
+            self.broker.subscriptions_changed()
+            self.send(_packet(SUBACK, 0, struct.pack('!H', packet_id) + bytes(granted)))
+            for topic_filter in new_filters:
+                self.broker.send_retained(self, topic_filter)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = packet.uint16()
+            while packet.remaining():
+                self.subscriptions.pop(packet.string(), None)
+            self.broker.subscriptions_changed()
+            self.send(_packet(UNSUBACK, 0, struct.pack('!H', packet_id)))
+        elif packet_type == PINGREQ:
+            self.send(_packet(PINGRESP, 0))
+        # PUBACK / PUBREC / PUBCOMP：送出的 QoS 1 訊息不重送，收到確認即可
+
+
+class MqttBroker:
+    """
+    asyncio MQTT Broker
+
+    Args:
+        host: 監聽的位址（'127.0.0.1' 只接受本機連線，'0.0.0.0' 接受 Pico 連線）
+        port: 監聽的埠（0 表示由系統選擇，啟動後可讀取 self.port）
+    """
+
+    def __init__(self, host='127.0.0.1', port=1883):
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        self.retained = {}
+        self.messages = 0
+        self._server = None
+        # 主題 -> [(session, qos)]，訂閱改變時清空
+        self._routes = {}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._on_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        for session in list(self.sessions.values()):
+            session.writer.close()
+
+    async def _on_client(self, reader, writer):
+        await Session(self, reader, writer).run()
+
+    def add_session(self, session):
+        # 相同 client_id 的舊連線必須中斷（MQTT 3.1.1 規定）
+        old = self.sessions.get(session.client_id)
+        if old is not None:
+            old.closed = True
+            old.will = None
+            old.writer.close()
+        self.sessions[session.client_id] = session
+        self.subscriptions_changed()
+
+    def remove_session(self, session):
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+            self.subscriptions_changed()
+
+    def subscriptions_changed(self):
+        self._routes.clear()
+
+    def _route(self, topic):
+        """符合主題的 (session, qos)，同一個客戶端多個訂閱相符時取最高 QoS"""
+        route = self._routes.get(topic)
+        if route is None:
+            route = []
+            for session in self.sessions.values():
+                qos = max((qos for topic_filter, qos in session.subscriptions.items()
+                           if topic_matches(topic_filter, topic)), default=None)
+                if qos is not None:
+                    route.append((session, qos))
+            self._routes[topic] = route
+        return route
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """
+        發布訊息給所有符合的訂閱者（必須在事件迴圈中呼叫）
+
+        Args:
+            topic: 主題
+            payload: bytes
+            qos: 0 或 1（送出時取與訂閱 QoS 較小者）
+            retain: 是否保留（空內容表示刪除保留訊息）
+        """
+        self.messages += 1
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        for session, sub_qos in self._route(topic):
+            session.deliver(topic, payload, min(qos, sub_qos))
+
+    def send_retained(self, session, topic_filter):
+        qos = session.subscriptions.get(topic_filter, 0)
+        for topic, (payload, retained_qos) in self.retained.items():
+            if topic_matches(topic_filter, topic):
+                session.deliver(topic, payload, min(qos, retained_qos), retain=True)
+
+    def stats(self):
+        return {
+            'clients': len(self.sessions),
+            'messages': self.messages,
+            'retained': len(self.retained),
+            'dropped': sum(session.dropped for session in self.sessions.values())
+        }
+
+
+def start_broker_thread(host='127.0.0.1', port=1883):
+    """
+    在背景執行緒的事件迴圈中啟動 Broker（供同步程式使用）
+
+    Returns:
+        MqttBroker: 已開始監聽（port=0 時可從 .port 取得實際的埠）
+
+    Raises:
+        OSError: 埠已被使用
+    """
+    broker = MqttBroker(host, port)
+    ready = threading.Event()
+    error = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(broker.start())
+        except OSError as e:
+            error.append(e)
+            return
+        finally:
+            ready.set()
+        loop.run_until_complete(broker.serve_forever())
+
+    threading.Thread(target=run, name='mqtt-broker', daemon=True).start()
+    ready.wait()
+    if error:
+        raise error[0]
+    return broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='內建 MQTT 3.1.1 Broker')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+
+    async def serve():
+        broker = await MqttBroker(args.host, args.port).start()
+        print(f"✅ MQTT Broker 監聽中: {args.host}:{broker.port}")
+        await broker.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 Broker 已停止")
+
+
+if __name__ == '__main__':
+    main()
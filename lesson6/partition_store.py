@@ -0,0 +1,551 @@
+"""
+依日期與裝置分割的 CSV 儲存
+每台裝置每天一個 CSV 分割檔，_manifest/ 依日期記錄每個分割檔的時間範圍，
+查詢時只開啟時間重疊的分割檔；超過一定天數的分割檔會壓縮（gzip / zstd），
+超過保留期限的分割檔會刪除，避免 SD 卡被寫滿
+
+資料夾結構:
+    partitions/
+        _manifest/20251026.json
+        <裝置名稱（URL 編碼）>/20251026.csv
+        <裝置名稱（URL 編碼）>/20251019.csv.gz
+"""
+
+import csv
+import gzip
+import heapq
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from operator import itemgetter
+from urllib.parse import quote, unquote
+
+from csv_reader import read_csv_range, CSV_FIELDNAMES
+from csv_writer import BatchWriter, sync_file
+from ring_buffer import format_timestamp, parse_timestamp
+
+# 嘗試導入 zstandard（沒有時只能使用 gzip）
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# 依日期分檔的索引資料夾；舊版的單一索引檔載入後會轉換並刪除
+MANIFEST_DIR = '_manifest'
+LEGACY_MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+# 批次寫入時索引最多每幾秒儲存一次（當機時以分割檔大小找出需要重新掃描的檔案）
+MANIFEST_SAVE_SECONDS = 30
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+SUFFIXES = {
+    COMPRESSION_NONE: '.csv',
+    COMPRESSION_GZIP: '.csv.gz',
+    COMPRESSION_ZSTD: '.csv.zst'
+}
+
+# 沒有裝置名稱的數據
+DEFAULT_DEVICE = '_default'
+
+
+def partition_date(ts):
+    """數據所屬的分割日期（YYYYMMDD）"""
+    return datetime.fromtimestamp(ts).strftime('%Y%m%d')
+
+
+def days_ago(days, now=None):
+    """幾天前的日期（YYYYMMDD），早於此日期的分割檔視為過期"""
+    now = datetime.now() if now is None else datetime.fromtimestamp(now)
+    return (now - timedelta(days=days)).strftime('%Y%m%d')
+
+
+def _date_bound(ts):
+    """查詢範圍邊界所在的日期，超出可表示的範圍時為 None（不限）"""
+    if ts is None:
+        return None
+    try:
+        return partition_date(ts)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _open_text(path, compression, mode='r'):
+    """以文字模式開啟（可能壓縮的）分割檔，mode 為 'r' 或 'a'"""
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    if compression == COMPRESSION_ZSTD:
+        if mode == 'r':
+            # 補寫的數據是另一個 frame，需要跨 frame 讀取
+            raw = zstandard.ZstdDecompressor().stream_reader(
+                open(path, 'rb'), read_across_frames=True, closefd=True)
+        else:
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, 'ab'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _compress_file(src, dst, compression):
+    """把未壓縮的分割檔壓縮成 dst（先寫暫存檔再改名）"""
+    tmp = dst + '.tmp'
+    with open(src, 'rb') as fin, open(tmp, 'wb') as raw:
+        if compression == COMPRESSION_GZIP:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as fout:
+                shutil.copyfileobj(fin, fout)
+        else:
+            with zstandard.ZstdCompressor().stream_writer(raw, closefd=False) as fout:
+                shutil.copyfileobj(fin, fout)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, dst)
+
+
+class Manifest:
+    """
+    分割檔索引（_manifest/<日期>.json）
+
+    每個分割檔一筆：裝置、日期、檔名、最早 / 最晚時間、筆數、壓縮方式、
+    是否依時間排序，以及登記時的檔案大小。寫入執行緒更新，查詢執行緒讀取快照。
+
+    索引依日期分檔，只改寫有變動的日期；一般的批次寫入最多每 save_interval 秒存一次，
+    中間當機時，啟動時以檔案大小找出 manifest 之後又寫入過的分割檔重新掃描。
+    查詢時依日期範圍二分搜尋，不需要走訪所有分割檔。
+
+    Args:
+        directory: 分割檔所在資料夾
+        save_interval: 批次寫入時兩次儲存之間至少間隔幾秒
+    """
+
+    def __init__(self, directory, save_interval=MANIFEST_SAVE_SECONDS):
+        self.directory = directory
+        self.manifest_dir = os.path.join(directory, MANIFEST_DIR)
+        self.save_interval = save_interval
+        self.partitions = {}
+        self.days = {}      # 日期 -> {key: 索引}
+        self._dates = []    # 排序好的日期
+        self._dirty = set()
+        self._saved_at = time.monotonic()
+        self.lock = threading.Lock()
+        if os.path.isdir(directory):
+            self._load()
+
+    @staticmethod
+    def key(device, date):
+        return f"{quote(device, safe='')}/{date}"
+
+    def _add(self, key, entry):
+        """加入索引（需要在 lock 中或還沒有其他執行緒使用時呼叫）"""
+        date = entry['date']
+        day = self.days.get(date)
+        if day is None:
+            day = self.days[date] = {}
+            insort(self._dates, date)
+        day[key] = entry
+        self.partitions[key] = entry
+        self._dirty.add(date)
+
+    def _discard(self, key):
+        entry = self.partitions.pop(key, None)
+        if entry is None:
+            return
+        date = entry['date']
+        day = self.days[date]
+        del day[key]
+        if not day:
+            del self.days[date]
+            self._dates.remove(date)
+        self._dirty.add(date)
+
+    def _read_saved(self):
+        """讀取已儲存的索引（相容舊版的單一 manifest.json）"""
+        saved = {}
+        legacy = os.path.join(self.directory, LEGACY_MANIFEST_NAME)
+        if os.path.exists(legacy):
+            with open(legacy, encoding='utf-8') as f:
+                saved.update(json.load(f).get('partitions', {}))
+        if os.path.isdir(self.manifest_dir):
+            for name in os.listdir(self.manifest_dir):
+                if name.endswith('.json'):
+                    with open(os.path.join(self.manifest_dir, name), encoding='utf-8') as f:
+                        saved.update(json.load(f).get('partitions', {}))
+        return saved
+
+    def _load(self):
+        """
+        讀取 manifest，並以磁碟上的檔案為準校正（當機時 manifest 可能落後）
+
+        只有大小與 manifest 記錄的不同（或沒有記錄）的分割檔才重新掃描
+        """
+        saved = self._read_saved()
+
+        found = {}
+        for folder in os.listdir(self.directory):
+            folder_path = os.path.join(self.directory, folder)
+            if folder == MANIFEST_DIR or not os.path.isdir(folder_path):
+                continue
+            for name in os.listdir(folder_path):
+                for compression, suffix in SUFFIXES.items():
+                    key = f"{folder}/{name[:-len(suffix)]}"
+                    if not (name.endswith(suffix) and name[:-len(suffix)].isdigit()):
+                        continue
+                    # 壓縮到一半當機時兩個檔案都在，以未壓縮的為準（之後會重新壓縮）
+                    if key not in found or compression == COMPRESSION_NONE:
+                        found[key] = (f"{folder}/{name}", compression)
+
+        changed = set()
+        for key, (file, compression) in found.items():
+            entry = saved.get(key)
+            if not (entry is not None and entry['file'] == file and entry.get('bytes')
+                    == os.path.getsize(os.path.join(self.directory, file))):
+                folder, date = key.split('/')
+                entry = self._scan(unquote(folder), date, file, compression)
+                changed.add(date)
+            self._add(key, entry)
+        # manifest 中有、磁碟上已經沒有的分割檔所在的日期也要改寫
+        changed.update(entry['date'] for key, entry in saved.items() if key not in found)
+        legacy = os.path.join(self.directory, LEGACY_MANIFEST_NAME)
+        if os.path.exists(legacy):
+            changed.update(self.days)
+        self._dirty = changed
+        self.save(force=True)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+    def _scan(self, device, date, file, compression):
+        """掃描分割檔內容重建索引"""
+        path = os.path.join(self.directory, file)
+        entry = {'device': device, 'date': date, 'file': file, 'ts_min': None,
+                 'ts_max': None, 'rows': 0, 'compression': compression, 'sorted': True,
+                 'bytes': os.path.getsize(path)}
+        with _open_text(path, compression) as f:
+            for row in csv.reader(f):
+                try:
+                    ts = parse_timestamp(row[0])
+                except (ValueError, IndexError):
+                    continue
+                self._record(entry, ts)
+        return entry
+
+    @staticmethod
+    def _record(entry, ts):
+        if entry['rows'] and ts < entry['ts_max']:
+            entry['sorted'] = False
+        entry['rows'] += 1
+        entry['ts_min'] = ts if entry['ts_min'] is None else min(entry['ts_min'], ts)
+        entry['ts_max'] = ts if entry['ts_max'] is None else max(entry['ts_max'], ts)
+
+    def record(self, entry, ts):
+        """登記一筆寫入分割檔的數據"""
+        self._record(entry, ts)
+        self._dirty.add(entry['date'])
+
+    def record_size(self, entry, f=None):
+        """
+        登記分割檔目前的大小，下次啟動時大小相同就不需要重新掃描
+
+        Args:
+            f: 開啟中的未壓縮分割檔（先把緩衝區寫入作業系統，大小才會與登記的筆數一致），
+               None 表示檔案已經關閉
+        """
+        if f is None:
+            size = os.path.getsize(os.path.join(self.directory, entry['file']))
+        else:
+            f.flush()
+            size = os.fstat(f.fileno()).st_size
+        if entry.get('bytes') != size:
+            entry['bytes'] = size
+            self._dirty.add(entry['date'])
+
+    def entry(self, device, date):
+        """取得（或建立）分割檔的索引"""
+        key = self.key(device, date)
+        entry = self.partitions.get(key)
+        if entry is None:
+            entry = {'device': device, 'date': date,
+                     'file': f"{quote(device, safe='')}/{date}{SUFFIXES[COMPRESSION_NONE]}",
+                     'ts_min': None, 'ts_max': None, 'rows': 0,
+                     'compression': COMPRESSION_NONE, 'sorted': True}
+            with self.lock:
+                self._add(key, entry)
+        return entry
+
+    def snapshot(self, start=None, end=None, device=None):
+        """
+        時間範圍與 [start, end] 重疊的分割檔（只檢查範圍內的日期）
+
+        Returns:
+            list: 索引的複本，依日期排序
+        """
+        first, last = _date_bound(start), _date_bound(end)
+        with self.lock:
+            lo = 0 if first is None else bisect_left(self._dates, first)
+            hi = len(self._dates) if last is None else bisect_right(self._dates, last)
+            entries = []
+            for date in self._dates[lo:hi]:
+                day = self.days[date]
+                if device is None:
+                    candidates = day.values()
+                else:
+                    candidates = [day[key] for key in (self.key(device, date),) if key in day]
+                entries.extend(dict(entry) for entry in candidates
+                               if entry['rows']
+                               and (start is None or entry['ts_max'] >= start)
+                               and (end is None or entry['ts_min'] <= end))
+        return entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.partitions.get(key)
+            return None if entry is None else dict(entry)
+
+    def update(self, key, **fields):
+        with self.lock:
+            entry = self.partitions[key]
+            entry.update(fields)
+            self._dirty.add(entry['date'])
+
+    def remove(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def save(self, force=False):
+        """
+        改寫有變動的日期（先寫暫存檔再改名，不會留下寫到一半的檔案）
+
+        Args:
+            force: 立即儲存；否則距離上次儲存不到 save_interval 秒時略過
+        """
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < self.save_interval):
+            return
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            days = {date: json.dumps({'version': MANIFEST_VERSION, 'partitions': self.days[date]},
+                                     ensure_ascii=False, indent=1) if date in self.days else None
+                    for date in dirty}
+        self._saved_at = time.monotonic()
+        for date, data in days.items():
+            path = os.path.join(self.manifest_dir, f"{date}.json")
+            if data is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+
+class PartitionWriter(BatchWriter):
+    """
+    分割檔背景寫入執行緒
+
+    每台裝置每天的檔案在第一次寫入時開啟，換日時關閉前一天的檔案；
+    每隔 maintenance_interval 秒壓縮過期的分割檔並刪除超過保留期限的分割檔。
+
+    Args:
+        manifest: Manifest
+        compress_after_days: 幾天前的分割檔要壓縮（0 表示不壓縮）
+        retention_days: 保留幾天（0 表示永久保留）
+        compression: 'gzip' 或 'zstd'
+        maintenance_interval: 整理分割檔的間隔秒數
+        其餘參數同 BatchWriter
+    """
+
+    thread_name = 'partition-writer'
+
+    def __init__(self, manifest, compress_after_days=2, retention_days=90,
+                 compression=COMPRESSION_GZIP, maintenance_interval=3600, **kwargs):
+        if compression not in (COMPRESSION_GZIP, COMPRESSION_ZSTD):
+            raise ValueError(f"未知的壓縮方式: {compression}")
+        if compression == COMPRESSION_ZSTD and not HAS_ZSTD:
+            raise ValueError("zstd 壓縮需要 zstandard 套件")
+        super().__init__(**kwargs)
+        self.manifest = manifest
+        self.compress_after_days = compress_after_days
+        self.retention_days = retention_days
+        self.compression = compression
+        self.maintenance_interval = maintenance_interval
+        self.compressed = 0
+        self.deleted = 0
+        self._files = {}
+        self._date = None
+        self._next_maintenance = 0
+
+    def write(self, row):
+        """放入一筆數據 (ts, 溫度, 濕度, 電燈狀態, 裝置名稱)"""
+        super().write(row)
+
+    def _open(self):
+        os.makedirs(self.manifest.directory, exist_ok=True)
+
+    def _file(self, device, date):
+        """取得分割檔的 (檔案, csv writer, 索引)，需要時開啟"""
+        handle = self._files.get((device, date))
+        if handle is not None:
+            return handle
+        entry = self.manifest.entry(device, date)
+        path = os.path.join(self.manifest.directory, entry['file'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 已壓縮的分割檔收到補寫數據時，以新的壓縮區塊附加在檔尾
+        f = _open_text(path, entry['compression'], 'a')
+        writer = csv.writer(f)
+        if entry['compression'] == COMPRESSION_NONE and f.tell() == 0:
+            writer.writerow(CSV_FIELDNAMES)
+        handle = self._files[(device, date)] = (f, writer, entry)
+        return handle
+
+    def _rotate(self, date):
+        """換日：關閉前一天（含更早）的分割檔"""
+        self._date = date
+        for key in [key for key in self._files if key[1] < date]:
+            f, writer, entry = self._files.pop(key)
+            self._sync(f, entry)
+            f.close()
+
+    def _write_batch(self, batch):
+        for ts, temperature, humidity, light_status, device in batch:
+            date = partition_date(ts)
+            if self._date is None or date > self._date:
+                self._rotate(date)
+            f, writer, entry = self._file(device or DEFAULT_DEVICE, date)
+            writer.writerow([format_timestamp(ts), light_status, temperature, humidity])
+            self.manifest.record(entry, ts)
+        # 補寫到已壓縮分割檔的數據要立即關閉，才會寫完壓縮區塊
+        for key in [key for key, handle in self._files.items()
+                    if handle[2]['compression'] != COMPRESSION_NONE]:
+            f, writer, entry = self._files.pop(key)
+            f.close()
+            self.manifest.record_size(entry)
+
+    def _sync(self, f, entry):
+        """寫入分割檔並登記大小，下次啟動時不需要重新掃描"""
+        sync_file(f, self.durability)
+        if entry['compression'] == COMPRESSION_NONE:
+            self.manifest.record_size(entry, f)
+
+    def _commit(self):
+        for f, writer, entry in self._files.values():
+            self._sync(f, entry)
+        self.manifest.save()
+        if time.time() >= self._next_maintenance:
+            self._next_maintenance = time.time() + self.maintenance_interval
+            self.maintain()
+
+    def _close(self):
+        for f, writer, entry in self._files.values():
+            self._sync(f, entry)
+            f.close()
+        self._files = {}
+        self.manifest.save(force=True)
+
+    def maintain(self, now=None):
+        """壓縮過期的分割檔、刪除超過保留期限的分割檔"""
+        expire = days_ago(self.retention_days, now) if self.retention_days else None
+        cold = days_ago(self.compress_after_days, now) if self.compress_after_days else None
+        for entry in self.manifest.snapshot():
+            key = Manifest.key(entry['device'], entry['date'])
+            path = os.path.join(self.manifest.directory, entry['file'])
+            try:
+                if expire is not None and entry['date'] < expire:
+                    self.manifest.remove(key)
+                    self.manifest.save(force=True)
+                    os.remove(path)
+                    self.deleted += 1
+                elif (cold is not None and entry['date'] < cold
+                      and entry['compression'] == COMPRESSION_NONE
+                      and (entry['device'], entry['date']) not in self._files):
+                    file = entry['file'][:-len(SUFFIXES[COMPRESSION_NONE])] + SUFFIXES[self.compression]
+                    _compress_file(path, os.path.join(self.manifest.directory, file),
+                                   self.compression)
+                    self.manifest.update(key, file=file, compression=self.compression,
+                                         bytes=os.path.getsize(os.path.join(self.manifest.directory, file)))
+                    self.manifest.save(force=True)
+                    os.remove(path)
+                    self.compressed += 1
+            except OSError as e:
+                print(f"⚠️  整理分割檔 {entry['file']} 時發生錯誤: {e}")
+
+
+class PartitionStore:
+    """
+    分割檔的讀取
+
+    Args:
+        manifest: Manifest
+    """
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.skipped = 0
+
+    def _parse(self, rows, start, end):
+        for row in rows:
+            try:
+                timestamp, light_status, temperature, humidity = row
+                ts = parse_timestamp(timestamp)
+            except ValueError:
+                # 標題列或格式錯誤的數據
+                if row != CSV_FIELDNAMES:
+                    self.skipped += 1
+                continue
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                try:
+                    yield ts, float(temperature), float(humidity), light_status
+                except ValueError:
+                    self.skipped += 1
+
+    def _iter_entry(self, entry, start, end):
+        """產生單一分割檔中 [start, end] 範圍內的數據（依時間排序）"""
+        for attempt in range(2):
+            path = os.path.join(self.manifest.directory, entry['file'])
+            try:
+                if entry['compression'] == COMPRESSION_NONE and entry['sorted']:
+                    # 未壓縮且有排序：以二分搜尋直接找到範圍
+                    rows = read_csv_range(path, CSV_FIELDNAMES, start, end)
+                    yield from self._parse(rows, start, end)
+                else:
+                    with _open_text(path, entry['compression']) as f:
+                        rows = self._parse(csv.reader(f), start, end)
+                        yield from (rows if entry['sorted'] else sorted(rows, key=itemgetter(0)))
+                return
+            except FileNotFoundError:
+                # 讀取途中剛好被壓縮或刪除，依最新的 manifest 再試一次
+                entry = self.manifest.get(Manifest.key(entry['device'], entry['date']))
+                if entry is None:
+                    return
+
+    def iter_rows(self, start=None, end=None, device=None, reverse_days=False):
+        """
+        依日期逐天產生數據（同一天的各裝置依時間合併）
+
+        Yields:
+            list: 每天一個由舊到新的 (ts, 溫度, 濕度, 電燈狀態) 列表
+        """
+        days = {}
+        for entry in self.manifest.snapshot(start, end, device):
+            days.setdefault(entry['date'], []).append(entry)
+        for date in sorted(days, reverse=reverse_days):
+            yield list(self.iter_day(days[date], start, end))
+
+    def iter_day(self, entries, start, end):
+        """合併同一天各裝置的分割檔"""
+        streams = [self._iter_entry(entry, start, end) for entry in entries]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=itemgetter(0))
+
+    def iter_stream(self, start=None, end=None, device=None):
+        """逐筆產生 [start, end] 範圍內的數據（不會一次載入整天）"""
+        days = {}
+        for entry in self.manifest.snapshot(start, end, device):
+            days.setdefault(entry['date'], []).append(entry)
+        for date in sorted(days):
+            yield from self.iter_day(days[date], start, end)
@@ -0,0 +1,93 @@
+"""
+MQTT 訊息解碼（JSON 與精簡二進位格式）
+每則訊息依第一個位元組自動判斷格式；二進位格式的定義與編碼端在 pico/payload_codec.py，
+這裡直接載入同一個檔案，兩邊不會不一致
+"""
+
+import importlib.util
+import json
+import os
+import struct
+
+from ring_buffer import decode_light, encode_light, LIGHT_UNKNOWN
+
+# 以不同的模組名稱載入 Pico 端的編碼器（檔名與本模組相同）
+_PICO_CODEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pico', 'payload_codec.py')
+_spec = importlib.util.spec_from_file_location('pico_payload_codec', _PICO_CODEC_PATH)
+pico_codec = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(pico_codec)
+
+MAGIC = pico_codec.MAGIC
+MAGIC_BYTE = bytes([MAGIC])
+VERSION = pico_codec.VERSION
+HEADER = struct.Struct(pico_codec.HEADER_FORMAT)
+NO_TEMPERATURE = pico_codec.NO_TEMPERATURE
+NO_HUMIDITY = pico_codec.NO_HUMIDITY
+
+
+def decode_binary(payload):
+    """
+    解碼二進位格式
+
+    Returns:
+        tuple: (溫度, 濕度, 電燈狀態, 裝置名稱, msg_id)
+
+    Raises:
+        ValueError: 格式或版本錯誤
+    """
+    if len(payload) < HEADER.size:
+        raise ValueError("二進位封包長度不足")
+    magic, version, msg_id, temp, humi, light, name_len = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"不支援的二進位格式版本: {version}")
+    name = payload[HEADER.size:HEADER.size + name_len]
+    if len(name) != name_len:
+        raise ValueError("二進位封包的裝置名稱不完整")
+    return (
+        0.0 if temp == NO_TEMPERATURE else temp / 100,
+        0.0 if humi == NO_HUMIDITY else humi / 100,
+        decode_light(light),
+        name.decode('utf-8') or None,
+        msg_id
+    )
+
+
+def decode_json(payload):
+    """
+    解碼 JSON 格式（相容各範例使用的欄位名稱）
+
+    Returns:
+        tuple: (溫度, 濕度, 電燈狀態, 裝置名稱, msg_id)
+    """
+    data_dict = json.loads(payload)
+    return (
+        float(data_dict.get('temperature', data_dict.get('temp', 0))),
+        float(data_dict.get('humidity', data_dict.get('humi', 0))),
+        data_dict.get('light_status', data_dict.get('light', '未知')),
+        data_dict.get('device'),
+        data_dict.get('message_id', data_dict.get('msg_id'))
+    )
+
+
+def decode_payload(payload):
+    """
+    自動判斷格式並解碼
+
+    Returns:
+        tuple: (溫度, 濕度, 電燈狀態, 裝置名稱, msg_id)；沒有裝置名稱或 msg_id 時為 None
+    """
+    if payload[:1] == MAGIC_BYTE:
+        return decode_binary(payload)
+    return decode_json(payload)
+
+
+def encode_binary(temperature=None, humidity=None, light_status=None, device='', msg_id=0):
+    """
+    以二進位格式編碼（供測試與壓力測試工具使用，與 Pico 使用同一個編碼器）
+
+    Returns:
+        bytes: 編碼後的封包
+    """
+    light = encode_light(light_status)
+    return pico_codec.encode(temperature, humidity, None if light == LIGHT_UNKNOWN else bool(light),
+                             device, msg_id)
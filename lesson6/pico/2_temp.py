@@ -12,6 +12,7 @@ import machine
 import json
 import random
 import wifi_connect
+import payload_codec
 from secrets import MQTT_BROKER, MQTT_PORT
 
 # 嘗試匯入 MQTT 套件
@@ -29,6 +30,9 @@ except ImportError:
 # 設定
 TOPIC = "客廳/感測器"
 CLIENT_ID = "pico_temp_sensor"
+# 訊息格式: "json"（所有訂閱端都能讀取）或 "binary"（精簡二進位，封包較小，
+# 只有 lesson6/app_flask.py 能解碼，其他訂閱端如 mqtt_subscribe_test.py、streamlit_test.py 無法讀取）
+PAYLOAD_FORMAT = "json"
 
 # 初始化內建溫度感測器 (ADC 4)
 sensor_temp = machine.ADC(4)
@@ -71,17 +75,25 @@ def main():
             humi = round(random.uniform(50, 70), 1)
 
             # 準備傳送的資料
-            payload = {
-                "temperature": temp,
-                "humidity": humi,
-                "device": "Pico W (App 2)",
-                "msg_id": count
-            }
+            if PAYLOAD_FORMAT == "binary":
+                message = payload_codec.encode(
+                    temperature=temp,
+                    humidity=humi,
+                    device="Pico W (App 2)",
+                    msg_id=count
+                )
+            else:
+                payload = {
+                    "temperature": temp,
+                    "humidity": humi,
+                    "device": "Pico W (App 2)",
+                    "msg_id": count
+                }
+                message = json.dumps(payload)
 
             # 發送 MQTT 訊息
-            json_str = json.dumps(payload)
             print(f"發送: 溫度={temp}°C, 濕度={humi}%")
-            client.publish(TOPIC, json_str)
+            client.publish(TOPIC, message)
 
             count += 1
             time.sleep(5)  # 每 5 秒更新一次
@@ -10,6 +10,7 @@ import machine
 import json
 import random
 import wifi_connect
+import payload_codec
 from secrets import MQTT_BROKER, MQTT_PORT
 
 # 嘗試匯入 MQTT 套件
@@ -28,6 +29,9 @@ except ImportError:
 TOPIC = "客廳/感測器"
 CLIENT_ID = "pico_integrated"
 LED_PIN = "LED"
+# 訊息格式: "json"（所有訂閱端都能讀取）或 "binary"（精簡二進位，封包較小，
+# 只有 lesson6/app_flask.py 能解碼，其他訂閱端如 mqtt_subscribe_test.py、streamlit_test.py 無法讀取）
+PAYLOAD_FORMAT = "json"
 
 # 硬體初始化
 led = machine.Pin(LED_PIN, machine.Pin.OUT)
@@ -67,6 +71,7 @@ def main():
     last_led_time = 0
 
     start_time = time.time()
+    msg_id = 0
 
     try:
         while True:
@@ -90,12 +95,24 @@ def main():
                     "humidity": humi,
                     "light_status": "開" if is_on else "關",
                     "device": "Pico W (App 3)",
+                    "msg_id": msg_id,
                     "uptime": current_time - start_time
                 }
 
                 print(f"[{current_time}] 發送整合數據: {payload}")
-                client.publish(TOPIC, json.dumps(payload))
-
+                if PAYLOAD_FORMAT == "binary":
+                    # 二進位格式不含 uptime
+                    client.publish(TOPIC, payload_codec.encode(
+                        temperature=temp,
+                        humidity=humi,
+                        light_on=is_on,
+                        device=payload["device"],
+                        msg_id=msg_id
+                    ))
+                else:
+                    client.publish(TOPIC, json.dumps(payload))
+
+                msg_id += 1
                 last_publish_time = current_time
 
             # 短暫暫停避免 CPU 滿載，但不能太長以免錯過時間點
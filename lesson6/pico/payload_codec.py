@@ -0,0 +1,57 @@
+"""
+精簡二進位訊息格式（Pico 端編碼）
+與 JSON 相比封包更小、編碼更快，可減少 WiFi 傳輸時間
+伺服器端的解碼請見 lesson6/payload_codec.py，兩邊的格式必須一致
+
+格式 (little-endian):
+    magic (1 byte, 0xB5) | 版本 (1 byte) | msg_id (uint16)
+    | 溫度 x100 (int16) | 濕度 x100 (uint16) | 電燈 (int8: 1 開 / 0 關 / -1 未知)
+    | 裝置名稱長度 (uint8) | 裝置名稱 (UTF-8)
+"""
+
+import struct
+
+MAGIC = 0xB5
+VERSION = 1
+HEADER_FORMAT = "<BBHhHbB"
+
+# 沒有數值時使用的保留值
+NO_TEMPERATURE = -32768
+NO_HUMIDITY = 0xFFFF
+# 裝置名稱最多的位元組數（長度欄位為 uint8）
+MAX_NAME_BYTES = 255
+
+
+def encode_name(device):
+    """裝置名稱編碼成 UTF-8，超過 MAX_NAME_BYTES 時在字元邊界截斷"""
+    name = device.encode("utf-8")
+    if len(name) <= MAX_NAME_BYTES:
+        return name
+    cut = MAX_NAME_BYTES
+    # 0b10xxxxxx 是多位元組字元的後續位元組，往前退到字元開頭
+    while cut > 0 and name[cut] & 0xC0 == 0x80:
+        cut -= 1
+    return name[:cut]
+
+
+def encode(temperature=None, humidity=None, light_on=None, device="", msg_id=0):
+    """
+    編碼一筆感測器數據
+
+    Args:
+        temperature: 溫度 (°C)，None 表示沒有
+        humidity: 濕度 (%)，None 表示沒有
+        light_on: True / False，None 表示沒有
+        device: 裝置名稱
+        msg_id: 訊息編號（超過 65535 會從 0 重新開始）
+
+    Returns:
+        bytes: 編碼後的封包
+    """
+    name = encode_name(device)
+    temp = NO_TEMPERATURE if temperature is None else int(round(temperature * 100))
+    humi = NO_HUMIDITY if humidity is None else int(round(humidity * 100))
+    light = -1 if light_on is None else (1 if light_on else 0)
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, msg_id & 0xFFFF,
+                         temp, humi, light, len(name))
+    return header + name
@@ -0,0 +1,209 @@
+"""
+有界佇列的處理流水線（Pipeline）
+MQTT 回調只負責把訊息放進佇列，解析、儲存、推送各自由獨立的執行緒處理，
+佇列滿時依設定的策略處理：阻塞、丟棄最舊、或暫存到磁碟
+"""
+
+import os
+import pickle
+import queue
+import threading
+
+# 佇列滿時的處理策略
+POLICY_BLOCK = 'block'              # 等待空位（會讓上游停下來）
+POLICY_DROP_OLDEST = 'drop_oldest'  # 丟掉最舊的一筆
+POLICY_SPILL = 'spill'              # 暫存到磁碟，之後依序讀回
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SPILL)
+
+STOP = object()
+
+
+class BoundedQueue(queue.Queue):
+    """
+    有容量上限與統計的佇列
+
+    Args:
+        name: 佇列名稱（顯示於統計）
+        maxsize: 記憶體中最多保留的筆數
+        policy: 'block' / 'drop_oldest' / 'spill'
+        spill_path: policy 為 'spill' 時的暫存檔路徑
+    """
+
+    def __init__(self, name, maxsize, policy=POLICY_BLOCK, spill_path=None):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的佇列策略: {policy}")
+        if policy == POLICY_SPILL and not spill_path:
+            raise ValueError("spill 策略需要指定 spill_path")
+        super().__init__(maxsize)
+        self.name = name
+        self.policy = policy
+        self.spill_path = spill_path
+        # 最大積壓筆數（記憶體 + 暫存檔）
+        self.high_watermark = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._spill_file = None
+        self._spill_count = 0
+
+    # queue.Queue 的內部掛鉤，呼叫時已持有 self.mutex
+
+    def _qsize(self):
+        return len(self.queue) + self._spill_count
+
+    def _put(self, item):
+        self.queue.append(item)
+        self._update_watermark()
+
+    def _update_watermark(self):
+        self.high_watermark = max(self.high_watermark, len(self.queue) + self._spill_count)
+
+    def _get(self):
+        if self.queue:
+            return self.queue.popleft()
+        return self._unspill()
+
+    def put(self, item, block=True, timeout=None, force=False):
+        """
+        放入一筆數據
+
+        Args:
+            force: True 時不受容量限制（用於停止訊號）
+        """
+        if self.policy == POLICY_BLOCK and not force:
+            return super().put(item, block, timeout)
+        with self.not_full:
+            if not force and (self._spill_count or len(self.queue) >= self.maxsize > 0):
+                if self.policy == POLICY_DROP_OLDEST:
+                    self.queue.popleft()
+                    self.dropped += 1
+                else:
+                    # 已經開始暫存時，後面的數據也要進暫存檔才能維持順序
+                    self._spill(item)
+                    self.unfinished_tasks += 1
+                    self.not_empty.notify()
+                    return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _spill(self, item):
+        if self._spill_file is None:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            self._spill_file = open(self.spill_path, 'w+b')
+            self._spill_read = 0
+        self._spill_file.seek(0, os.SEEK_END)
+        pickle.dump(item, self._spill_file)
+        self._spill_count += 1
+        self.spilled += 1
+        self._update_watermark()
+
+    def _unspill(self):
+        self._spill_file.seek(self._spill_read)
+        item = pickle.load(self._spill_file)
+        self._spill_read = self._spill_file.tell()
+        self._spill_count -= 1
+        if self._spill_count == 0:
+            # 暫存檔讀完就清空，避免無限增長
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_read = 0
+        return item
+
+    def stats(self):
+        with self.mutex:
+            return {
+                'depth': self._qsize(),
+                'maxsize': self.maxsize,
+                'high_watermark': self.high_watermark,
+                'spilled_pending': self._spill_count,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'policy': self.policy
+            }
+
+
+class Stage:
+    """
+    流水線的一個處理階段（單一執行緒，維持數據順序）
+
+    Args:
+        name: 階段名稱
+        handler: 處理函式，回傳值會放入所有 outboxes（回傳 None 則不往下傳）
+        inbox: 輸入佇列
+        outboxes: 輸出佇列列表
+    """
+
+    def __init__(self, name, handler, inbox, outboxes=()):
+        self.name = name
+        self.handler = handler
+        self.inbox = inbox
+        self.outboxes = list(outboxes)
+        self.processed = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'stage-{name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """處理完佇列中剩餘的數據後停止"""
+        if self._thread.is_alive():
+            self._stopping.set()
+            self.inbox.put(STOP, force=True)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.inbox.get(timeout=0.1 if self._stopping.is_set() else None)
+            except queue.Empty:
+                break
+            if item is STOP:
+                # 停止訊號可能排在暫存檔的數據之前，等佇列清空才結束
+                if self.inbox.qsize() == 0:
+                    break
+                continue
+            try:
+                result = self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[{self.name}] 處理錯誤: {e}")
+                continue
+            if result is not None:
+                for outbox in self.outboxes:
+                    outbox.put(result)
+
+    def stats(self):
+        return {'processed': self.processed, 'errors': self.errors}
+
+
+class Pipeline:
+    """
+    依序串接的處理階段
+
+    Args:
+        stages: 由上游到下游排列的 Stage 列表
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def stop(self):
+        """由上游往下游依序停止，確保佇列中的數據都處理完"""
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        """各階段的佇列深度、高水位與處理筆數"""
+        return {
+            stage.name: {**stage.inbox.stats(), **stage.stats()}
+            for stage in self.stages
+        }
@@ -0,0 +1,180 @@
+"""
+執行中的效能分析工具
+取樣式 CPU 分析（所有執行緒）與 tracemalloc 記憶體配置比較；
+只在被呼叫時才執行，平常沒有任何額外成本
+
+CPU 分析的輸出為 collapsed stack 格式（每行「frame;frame;frame 次數」），
+可以用 flamegraph.pl 或 https://www.speedscope.app 開啟
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# 取樣間隔（秒）
+SAMPLE_INTERVAL = 0.005
+# tracemalloc 每筆配置保留的呼叫層數
+TRACE_FRAMES = 10
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """由外到內的呼叫堆疊字串"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class SamplingProfiler:
+    """
+    取樣式 CPU 分析
+
+    每隔 interval 秒讀取所有執行緒目前的呼叫堆疊（sys._current_frames），
+    統計每個堆疊出現的次數；被分析的程式不需要任何修改。
+    同一時間只能執行一個分析。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def profile(self, seconds, interval=SAMPLE_INTERVAL):
+        """
+        在目前的執行緒中取樣 seconds 秒
+
+        Returns:
+            str: collapsed stack 格式的結果（堆疊的根為執行緒名稱）
+
+        Raises:
+            RuntimeError: 已經有分析在執行
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已經有 CPU 分析在執行")
+        try:
+            counts = {}
+            own = threading.get_ident()
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = f"{names.get(ident, ident)};{_collapse(frame)}"
+                    counts[stack] = counts.get(stack, 0) + 1
+                time.sleep(interval)
+        finally:
+            self._lock.release()
+        return ''.join(f"{stack} {count}\n" for stack, count in
+                       sorted(counts.items(), key=lambda item: -item[1]))
+
+    def profile_to_file(self, seconds, directory, interval=SAMPLE_INTERVAL):
+        """
+        在背景執行緒分析並把結果存檔（供訊號處理使用）
+
+        Returns:
+            str: 輸出檔案路徑
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+
+        def run():
+            try:
+                result = self.profile(seconds, interval)
+            except RuntimeError as e:
+                print(f"⚠️  {e}")
+                return
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(result)
+            print(f"✅ CPU 分析已儲存: {path}")
+
+        threading.Thread(target=run, name='profiler', daemon=True).start()
+        return path
+
+
+class AllocationTracer:
+    """
+    tracemalloc 快照比較
+
+    第一次 snapshot() 時開始追蹤（追蹤期間每次配置記憶體都有額外成本），
+    之後每次 snapshot() 回傳與上一次快照的差異；stop() 停止追蹤並釋放快照。
+    """
+
+    def __init__(self, frames=TRACE_FRAMES):
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def snapshot(self, top=20, key_type='lineno'):
+        """
+        取得快照並與上一次比較
+
+        Args:
+            top: 回傳差異最大的前幾項
+            key_type: 'lineno' / 'filename' / 'traceback'
+
+        Returns:
+            dict: started（本次才開始追蹤）、current / peak 位元組數、
+                  diff（與上次快照相比增加最多的配置位置）
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._previous = None
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+            ])
+            previous, self._previous = self._previous, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        result = {'started': previous is None, 'current_bytes': current, 'peak_bytes': peak, 'diff': []}
+        if previous is not None:
+            for stat in snapshot.compare_to(previous, key_type)[:top]:
+                result['diff'].append({
+                    'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    'size_bytes': stat.size,
+                    'size_diff_bytes': stat.size_diff,
+                    'count': stat.count,
+                    'count_diff': stat.count_diff
+                })
+        return result
+
+    def stop(self):
+        with self._lock:
+            self._previous = None
+            tracemalloc.stop()
+
+    def snapshot_to_file(self, directory, top=50):
+        """
+        快照並把差異寫成文字檔（供訊號處理使用）
+
+        Returns:
+            str: 輸出檔案路徑
+        """
+        result = self.snapshot(top)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"tracemalloc-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"current={result['current_bytes']} peak={result['peak_bytes']}\n")
+            if result['started']:
+                f.write("開始追蹤，下次快照時輸出差異\n")
+            for stat in result['diff']:
+                f.write(f"{stat['size_diff_bytes']:+d} B ({stat['count_diff']:+d}) "
+                        f"{' <- '.join(stat['location'])}\n")
+        print(f"✅ 記憶體快照已儲存: {path}")
+        return path
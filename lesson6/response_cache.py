@@ -0,0 +1,108 @@
+"""
+預先序列化與壓縮的回應快取
+數據只在收到新訊息時改變，同一版本的回應只序列化一次，
+gzip / brotli 版本在第一次被要求時才壓縮，之後所有客戶端共用
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+
+# 嘗試導入 brotli（沒有時只提供 gzip）
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+ENCODING_IDENTITY = 'identity'
+ENCODING_GZIP = 'gzip'
+ENCODING_BROTLI = 'br'
+
+
+def _compress(body, encoding, level):
+    if encoding == ENCODING_GZIP:
+        return gzip.compress(body, compresslevel=level)
+    return brotli.compress(body, quality=level)
+
+
+class CachedBody:
+    """同一版本回應的原始內容與各種壓縮版本"""
+
+    __slots__ = ('version', 'variants')
+
+    def __init__(self, version, body):
+        self.version = version
+        self.variants = {ENCODING_IDENTITY: body}
+
+
+class ResponseCache:
+    """
+    依 (key, 版本) 快取序列化後的回應內容
+
+    Args:
+        max_entries: 最多保留的 key 數（超過時移除最久沒用到的）
+        min_compress_size: 小於此位元組數的內容不壓縮
+        gzip_level: gzip 壓縮等級
+        brotli_quality: brotli 壓縮品質
+    """
+
+    def __init__(self, max_entries=64, min_compress_size=512, gzip_level=6, brotli_quality=5):
+        self.max_entries = max_entries
+        self.min_compress_size = min_compress_size
+        self.levels = {ENCODING_GZIP: gzip_level, ENCODING_BROTLI: brotli_quality}
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encodings(self):
+        """可提供的壓縮格式（依偏好排序）"""
+        if HAS_BROTLI:
+            return [ENCODING_BROTLI, ENCODING_GZIP, ENCODING_IDENTITY]
+        return [ENCODING_GZIP, ENCODING_IDENTITY]
+
+    def get(self, key, version, serialize, encoding=ENCODING_IDENTITY):
+        """
+        取得回應內容，版本不同時重新序列化
+
+        Args:
+            key: 快取鍵（例如路徑 + 查詢參數）
+            version: 數據版本（例如 ETag），改變時舊內容失效
+            serialize: 無參數函式，回傳序列化後的 bytes
+            encoding: 'identity' / 'gzip' / 'br'
+
+        Returns:
+            tuple: (內容 bytes, 實際使用的 encoding)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is None:
+            # 序列化在鎖外進行，同時有兩個請求時最多多做一次
+            entry = CachedBody(version, serialize())
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        body = entry.variants[ENCODING_IDENTITY]
+        if encoding == ENCODING_IDENTITY or len(body) < self.min_compress_size:
+            return body, ENCODING_IDENTITY
+        compressed = entry.variants.get(encoding)
+        if compressed is None:
+            compressed = _compress(body, encoding, self.levels[encoding])
+            entry.variants[encoding] = compressed
+        return compressed, encoding
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,254 @@
+"""
+欄位式環形緩衝區（Columnar Ring Buffer）
+以固定容量的平行 array 欄位儲存歷史數據，取代 list of dict
+"""
+
+from array import array
+from datetime import datetime
+import threading
+
+# 嘗試導入 NumPy（用於欄位批次讀取）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 電燈狀態編碼（array 只能存數字）
+LIGHT_UNKNOWN = -1
+LIGHT_CODES = {'開': 1, 'on': 1, 'ON': 1, '關': 0, 'off': 0, 'OFF': 0}
+LIGHT_LABELS = {1: '開', 0: '關', LIGHT_UNKNOWN: '未知'}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def encode_light(light_status):
+    """電燈狀態文字 → 數字代碼"""
+    return LIGHT_CODES.get(light_status, LIGHT_UNKNOWN)
+
+
+def decode_light(code):
+    """數字代碼 → 電燈狀態文字"""
+    return LIGHT_LABELS.get(code, '未知')
+
+
+def format_timestamp(ts):
+    """epoch 秒數 → 時間戳記字串"""
+    return datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(text):
+    """時間戳記字串 → epoch 秒數"""
+    return datetime.strptime(text, TIMESTAMP_FORMAT).timestamp()
+
+
+def to_record(ts, temperature, humidity, light_status):
+    """組成 API 使用的 dict"""
+    return {
+        'timestamp': format_timestamp(ts),
+        'light_status': light_status,
+        'temperature': temperature,
+        'humidity': humidity
+    }
+
+
+class SensorRingBuffer:
+    """
+    固定容量的感測器歷史緩衝區
+
+    每個欄位都是預先配置好的 array，寫入只覆蓋最舊的位置，
+    因此 append 為 O(1)，每筆數據只佔 25 bytes。
+
+    Args:
+        capacity: 最多保留的筆數（可設到數百萬筆）
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("capacity 必須大於 0")
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))
+        self.temperature = array('d', bytes(8 * capacity))
+        self.humidity = array('d', bytes(8 * capacity))
+        self.light = array('b', bytes(capacity))
+        self._head = 0   # 下一筆要寫入的位置
+        self._size = 0
+        self.total = 0   # 累計寫入筆數，作為版本號與 cursor
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, ts, temperature, humidity, light_status):
+        """新增一筆數據，滿了就覆蓋最舊的一筆"""
+        with self.lock:
+            i = self._head
+            self.ts[i] = ts
+            self.temperature[i] = temperature
+            self.humidity[i] = humidity
+            self.light[i] = encode_light(light_status)
+            self._head = (i + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+            self.total += 1
+
+    def _row(self, i):
+        """依實體位置組成 API 使用的 dict"""
+        return to_record(self.ts[i], self.temperature[i], self.humidity[i],
+                         decode_light(self.light[i]))
+
+    def _physical(self, index):
+        """邏輯位置（0 = 最舊）→ 實體位置"""
+        return (self._head - self._size + index) % self.capacity
+
+    def rows(self, start=0, stop=None):
+        """
+        取得邏輯區間 [start, stop) 的數據
+
+        只走訪需要的位置，不會複製整個緩衝區。
+
+        Returns:
+            list: 由舊到新的 dict 列表
+        """
+        with self.lock:
+            if stop is None or stop > self._size:
+                stop = self._size
+            start = max(start, 0)
+            return [self._row(self._physical(i)) for i in range(start, stop)]
+
+    def _bisect(self, ts, right=False):
+        """
+        在時間排序的數據中二分搜尋（呼叫端需持有 lock）
+
+        Returns:
+            int: 第一筆時間 >= ts 的邏輯位置（right=True 時為 > ts）
+        """
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.ts[self._physical(mid)]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, start=None, end=None, limit=None):
+        """
+        查詢 [start, end] 時間範圍內的數據，成本為 O(log n + k)
+
+        Args:
+            start: 起始 epoch 秒數（None 表示不限）
+            end: 結束 epoch 秒數（None 表示不限）
+            limit: 最多回傳筆數；有 start 時從最舊的開始取，否則取最接近 end 的
+
+        Returns:
+            list: 由舊到新的 dict 列表
+        """
+        with self.lock:
+            lo = 0 if start is None else self._bisect(start)
+            hi = self._size if end is None else self._bisect(end, right=True)
+            if limit is not None and hi - lo > limit:
+                if start is None:
+                    lo = hi - limit
+                else:
+                    hi = lo + limit
+            return [self._row(self._physical(i)) for i in range(lo, hi)]
+
+    def _columns(self, lo, hi):
+        """複製邏輯區間 [lo, hi) 的四個欄位（呼叫端需持有 lock）"""
+        a = self._physical(lo)
+        count = max(hi - lo, 0)
+        # 區間可能跨過陣列結尾，分成兩段
+        first = min(count, self.capacity - a)
+        spans = [(a, a + first), (0, count - first)]
+        columns = []
+        for column in (self.ts, self.temperature, self.humidity, self.light):
+            if HAS_NUMPY:
+                view = np.frombuffer(column, dtype=column.typecode)
+                columns.append(np.concatenate([view[i:j] for i, j in spans]))
+            else:
+                columns.append(column[spans[0][0]:spans[0][1]] + column[spans[1][0]:spans[1][1]])
+        return tuple(columns)
+
+    def query_columns(self, start=None, end=None):
+        """
+        查詢 [start, end] 時間範圍內的數據，以欄位形式回傳
+
+        不會為每一筆數據建立 dict，適合大量數據的統計與降採樣。
+
+        Returns:
+            tuple: (ts, 溫度, 濕度, 電燈代碼)，有 NumPy 時為 ndarray，否則為 array
+        """
+        with self.lock:
+            lo = 0 if start is None else self._bisect(start)
+            hi = self._size if end is None else self._bisect(end, right=True)
+            return self._columns(lo, hi)
+
+    def since(self, seq, limit=None):
+        """
+        取得累計序號 seq 之後新增的數據（增量同步用）
+
+        Args:
+            seq: 上次同步時的 total
+            limit: 新增筆數超過此值時視為需要重新同步
+
+        Returns:
+            tuple: (由舊到新的 dict 列表, 目前的 total)；
+                   seq 已被覆蓋、超過 total 或超過 limit 時列表為 None
+        """
+        with self.lock:
+            count = self.total - seq
+            if count < 0 or count > self._size or (limit is not None and count > limit):
+                return None, self.total
+            return ([self._row(self._physical(i)) for i in range(self._size - count, self._size)],
+                    self.total)
+
+    def oldest_ts(self):
+        """最舊一筆的 epoch 秒數，沒有數據時回傳 None"""
+        with self.lock:
+            if self._size == 0:
+                return None
+            return self.ts[self._physical(0)]
+
+    def tail(self, n):
+        """取得最近 n 筆數據"""
+        with self.lock:
+            size = self._size
+        return self.rows(max(size - n, 0), size)
+
+    def latest(self):
+        """取得最新一筆數據，沒有數據時回傳 None"""
+        with self.lock:
+            if self._size == 0:
+                return None
+            return self._row((self._head - 1) % self.capacity)
+
+    def export_state(self):
+        """
+        依時間順序取出所有數據的原始內容（寫入快照用）
+
+        Returns:
+            tuple: ((ts, 溫度, 濕度, 電燈代碼) 四個 bytes, total)
+        """
+        with self.lock:
+            return tuple(column.tobytes() for column in self._columns(0, self._size)), self.total
+
+    def load_state(self, columns, total):
+        """
+        以快照內容取代目前的數據（超過容量時只保留最新的部分）
+
+        Args:
+            columns: 由舊到新的 (ts, 溫度, 濕度, 電燈代碼) 原始內容（bytes 或 memoryview）
+            total: 累計寫入筆數
+        """
+        count = len(columns[3])
+        keep = min(count, self.capacity)
+        with self.lock:
+            for target, data in zip((self.ts, self.temperature, self.humidity, self.light), columns):
+                values = array(target.typecode)
+                values.frombytes(data[(count - keep) * target.itemsize:])
+                target[0:keep] = values
+            self._head = keep % self.capacity
+            self._size = keep
+            self.total = total
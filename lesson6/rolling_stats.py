@@ -0,0 +1,332 @@
+"""
+串流統計（每台裝置、每個感測值）
+每收到一筆數據就以 O(1)（攤銷）更新統計，查詢時直接讀取結果，
+不需要重新掃描歷史數據:
+    - Welford 演算法：平均值與標準差（數值穩定，不需要保存數據）
+    - EWMA：指數加權移動平均
+    - 時間窗口內的平均值、最小值與最大值（單調佇列）
+    - P² 演算法：分位數估計（每個分位數只保存 5 個標記）
+"""
+
+import math
+import threading
+from bisect import bisect_right, insort
+from collections import deque
+
+# 預設追蹤的分位數
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+# P² 的前幾筆保存原始數據計算精確的分位數，之後才以這些數據在目標位置建立標記
+# （直接從前 5 筆開始時，標記需要很多筆數據才會移動到高 / 低分位數的位置）
+P2_EXACT_SAMPLES = 50
+METRICS = ('temperature', 'humidity')
+
+
+class Welford:
+    """累計筆數、平均值與變異數（Welford 線上演算法）"""
+
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def variance(self):
+        """樣本變異數（少於 2 筆時為 0）"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class SlidingWindow:
+    """
+    最近 seconds 秒（最多 max_samples 筆）的平均值、最小值與最大值
+
+    最小值與最大值各以一個單調佇列保存「之後不會被更小 / 更大的值取代」的數據，
+    佇列最前面就是答案；每筆數據最多進出佇列一次，更新為攤銷 O(1)。
+
+    Args:
+        seconds: 時間窗口（秒），以最新一筆數據的時間為準
+        max_samples: 窗口內最多保留的筆數
+    """
+
+    __slots__ = ('seconds', 'max_samples', '_values', '_min', '_max', '_sum', '_seq')
+
+    def __init__(self, seconds, max_samples):
+        self.seconds = seconds
+        self.max_samples = max_samples
+        self._values = deque()   # (序號, ts, 值)
+        self._min = deque()      # (序號, 值)，值遞增
+        self._max = deque()      # (序號, 值)，值遞減
+        self._sum = 0.0
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, ts, x):
+        seq = self._seq
+        self._seq += 1
+        self._values.append((seq, ts, x))
+        self._sum += x
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((seq, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((seq, x))
+
+        values = self._values
+        while len(values) > self.max_samples or ts - values[0][1] > self.seconds:
+            old_seq, _, old = values.popleft()
+            self._sum -= old
+            if self._min[0][0] == old_seq:
+                self._min.popleft()
+            if self._max[0][0] == old_seq:
+                self._max.popleft()
+
+    @property
+    def mean(self):
+        return self._sum / len(self._values) if self._values else None
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+
+class P2Quantile:
+    """
+    P² 分位數估計（Jain & Chlamtac, 1985）
+
+    以 5 個標記的高度與位置近似累積分布，每筆數據只調整標記，
+    記憶體固定，不需要保存或排序數據。第 2 個標記（中間）追蹤 q 分位數，
+    前 exact_samples 筆保存原始數據並回傳精確值，之後以這些數據在理想位置建立標記。
+
+    Args:
+        q: 分位數（0 ~ 1）
+        exact_samples: 保存原始數據的筆數（至少 5）
+    """
+
+    __slots__ = ('q', 'count', 'exact_samples', '_heights', '_positions', '_increments')
+
+    def __init__(self, q, exact_samples=P2_EXACT_SAMPLES):
+        self.q = q
+        self.count = 0
+        self.exact_samples = max(exact_samples, 5)
+        # 建立標記之前是排序好的原始數據
+        self._heights = []
+        self._positions = None
+        # 5 個標記每筆數據增加的理想位置（第 i 個標記的理想位置為 1 + (count - 1) * increment）
+        self._increments = (0, q / 2, q, (1 + q) / 2, 1)
+
+    def _init_markers(self):
+        """以排序好的原始數據在理想位置建立 5 個標記（位置需要嚴格遞增）"""
+        values = self._heights
+        n = len(values)
+        positions = [1 + round((n - 1) * increment) for increment in self._increments]
+        for i in range(1, 4):
+            positions[i] = max(positions[i], positions[i - 1] + 1)
+        for i in range(3, 0, -1):
+            positions[i] = min(positions[i], positions[i + 1] - 1)
+        self._heights = [values[p - 1] for p in positions]
+        self._positions = positions
+
+    def add(self, x):
+        self.count += 1
+        h = self._heights
+        if self._positions is None:
+            insort(h, x)
+            if self.count >= self.exact_samples:
+                self._init_markers()
+            return
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect_right(h, x) - 1
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+
+        # 中間三個標記偏離理想位置超過 1 時移動一格
+        for i in (1, 2, 3):
+            d = 1 + (self.count - 1) * self._increments[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+                height = h[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - s) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < height < h[i + 1]:
+                    # 拋物線內插超出相鄰標記時改用線性內插
+                    height = h[i] + s * (h[i + s] - h[i]) / (n[i + s] - n[i])
+                h[i] = height
+                n[i] += s
+
+    @property
+    def value(self):
+        """目前的估計值（沒有數據時為 None，建立標記之前為線性內插的精確值）"""
+        h = self._heights
+        if not h:
+            return None
+        if self._positions is None:
+            position = self.q * (len(h) - 1)
+            low = int(position)
+            high = min(low + 1, len(h) - 1)
+            return h[low] + (h[high] - h[low]) * (position - low)
+        return h[2]
+
+
+class RunningStats:
+    """
+    單一感測值的所有串流統計
+
+    Args:
+        window_seconds: 時間窗口（秒）
+        window_samples: 時間窗口內最多保留的筆數
+        ewma_alpha: EWMA 的權重（越大越偏重最新的數據）
+        quantiles: 要估計的分位數
+    """
+
+    __slots__ = ('totals', 'ewma', 'ewma_alpha', 'window', 'quantiles')
+
+    def __init__(self, window_seconds, window_samples, ewma_alpha, quantiles=DEFAULT_QUANTILES):
+        self.totals = Welford()
+        self.ewma = None
+        self.ewma_alpha = ewma_alpha
+        self.window = SlidingWindow(window_seconds, window_samples)
+        self.quantiles = [P2Quantile(q) for q in quantiles]
+
+    def add(self, ts, x):
+        if x != x:
+            # NaN 會讓所有統計失效
+            return
+        self.totals.add(x)
+        self.ewma = x if self.ewma is None else self.ewma + self.ewma_alpha * (x - self.ewma)
+        self.window.add(ts, x)
+        for estimator in self.quantiles:
+            estimator.add(x)
+
+    def summary(self):
+        totals, window = self.totals, self.window
+        return {
+            'count': totals.count,
+            'mean': totals.mean if totals.count else None,
+            'stddev': totals.stddev,
+            'min': totals.min,
+            'max': totals.max,
+            'ewma': self.ewma,
+            'quantiles': {f"p{estimator.q * 100:g}": estimator.value for estimator in self.quantiles},
+            'window': {
+                'seconds': window.seconds,
+                'count': len(window),
+                'mean': window.mean,
+                'min': window.min,
+                'max': window.max
+            }
+        }
+
+
+class SensorStats:
+    """一台裝置（或所有裝置合併）的溫度與濕度統計"""
+
+    def __init__(self, **options):
+        self.metrics = {name: RunningStats(**options) for name in METRICS}
+        self.last_ts = None
+        self._lock = threading.Lock()
+
+    def add(self, ts, temperature, humidity):
+        with self._lock:
+            self.metrics['temperature'].add(ts, temperature)
+            self.metrics['humidity'].add(ts, humidity)
+            self.last_ts = ts
+
+    def summary(self):
+        with self._lock:
+            result = {name: stats.summary() for name, stats in self.metrics.items()}
+            result['last_ts'] = self.last_ts
+        return result
+
+
+class StatsRegistry:
+    """
+    依裝置名稱保存串流統計，另外保存所有裝置合併的統計
+
+    Args:
+        window_seconds: 時間窗口（秒）
+        window_samples: 每台裝置時間窗口內最多保留的筆數
+        ewma_alpha: EWMA 的權重
+        quantiles: 要估計的分位數
+        overall_window_samples: 合併統計的時間窗口內最多保留的筆數（預設與 window_samples 相同）
+    """
+
+    def __init__(self, window_seconds, window_samples, ewma_alpha, quantiles=DEFAULT_QUANTILES,
+                 overall_window_samples=None):
+        self.options = {'window_seconds': window_seconds, 'window_samples': window_samples,
+                        'ewma_alpha': ewma_alpha, 'quantiles': quantiles}
+        self.overall = SensorStats(**{**self.options,
+                                      'window_samples': overall_window_samples or window_samples})
+        self.devices = {}
+        # 累計更新筆數，作為統計的版本號
+        self.updates = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def _device(self, name):
+        stats = self.devices.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.devices.setdefault(name, SensorStats(**self.options))
+        return stats
+
+    def update(self, device, ts, temperature, humidity):
+        """記錄一筆數據（同時更新裝置與合併的統計）"""
+        self.overall.add(ts, temperature, humidity)
+        self._device(device).add(ts, temperature, humidity)
+        self.updates += 1
+
+    def seed(self, device, columns):
+        """
+        以既有的歷史數據建立統計（啟動時使用）
+
+        Args:
+            device: 裝置名稱，None 表示只更新合併的統計
+            columns: 由舊到新的 (ts, 溫度, 濕度) 欄位（array 或 ndarray）
+        """
+        target = self.overall if device is None else self._device(device)
+        # 先轉成 Python float，逐筆走訪 ndarray 會慢很多
+        for ts, temperature, humidity in zip(*(column.tolist() for column in columns)):
+            target.add(ts, temperature, humidity)
+        self.updates += 1
+
+    def get(self, name):
+        """依名稱取得裝置的統計，不存在時回傳 None"""
+        stats = self.devices.get(name)
+        return stats and stats.summary()
+
+    def summaries(self):
+        """所有裝置的統計（依名稱排序）"""
+        return {name: self.devices[name].summary() for name in sorted(list(self.devices))}
@@ -0,0 +1,453 @@
+"""
+記憶體映射（mmap）的 append-only segment 儲存
+每天一個固定寬度的二進位 segment 檔，讀取時以 mmap 直接對應成 NumPy 陣列
+
+檔案格式:
+    標頭 64 bytes: magic, 版本, 每筆大小, 旗標, 筆數, 最早時間, 最晚時間
+    數據 每筆 25 bytes: 時間戳記 (float64), 溫度 (float64), 濕度 (float64), 電燈代碼 (int8)
+    電燈代碼 -1 / 0 / 1 為 '未知' / '關' / '開'，其他文字依第一次出現的順序編號為 2 ~ 127，
+    對照表存在同一資料夾的 lights.json（匯入匯出不會遺失原本的文字）
+
+使用方式:
+    python segment_store.py import sensor_data.csv segments
+    python segment_store.py export segments sensor_data_export.csv
+"""
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+from csv_reader import read_csv_all, CSV_FIELDNAMES
+from csv_writer import BatchWriter, sync_file, DURABILITY_FLUSH
+from ring_buffer import (encode_light, format_timestamp, parse_timestamp,
+                         LIGHT_LABELS, LIGHT_UNKNOWN)
+
+# 嘗試導入 NumPy（用於零複製讀取）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+MAGIC = b'PICOSEG1'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIQdd')
+HEADER_SIZE = 64
+RECORD = struct.Struct('<dddb')
+RECORD_SIZE = RECORD.size
+SEGMENT_SUFFIX = '.seg'
+
+# 標頭旗標：數據不是依時間排序（查詢時不能用二分搜尋）
+FLAG_UNSORTED = 0x1
+
+# 電燈文字對照表的檔名與可用的代碼範圍（-1 / 0 / 1 保留給 '未知' / '關' / '開'）
+LIGHT_DICTIONARY = 'lights.json'
+FIRST_LIGHT_CODE = 2
+MAX_LIGHT_CODE = 127
+
+if HAS_NUMPY:
+    RECORD_DTYPE = np.dtype([
+        ('ts', '<f8'),
+        ('temperature', '<f8'),
+        ('humidity', '<f8'),
+        ('light', 'i1')
+    ])
+
+
+def segment_name(ts):
+    """依數據時間決定 segment 檔名（每天一個）"""
+    return datetime.fromtimestamp(ts).strftime('%Y%m%d') + SEGMENT_SUFFIX
+
+
+class SegmentHeader:
+    """segment 標頭：筆數與時間範圍"""
+
+    def __init__(self, count=0, ts_min=float('inf'), ts_max=float('-inf'), flags=0):
+        self.count = count
+        self.ts_min = ts_min
+        self.ts_max = ts_max
+        self.flags = flags
+
+    @classmethod
+    def unpack(cls, data):
+        magic, version, record_size, flags, count, ts_min, ts_max = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError("不是有效的 segment 檔案")
+        return cls(count, ts_min, ts_max, flags)
+
+    def pack(self):
+        data = HEADER.pack(MAGIC, VERSION, RECORD_SIZE, self.flags,
+                           self.count, self.ts_min, self.ts_max)
+        return data.ljust(HEADER_SIZE, b'\0')
+
+    def add(self, ts):
+        """登記一筆新數據"""
+        if self.count and ts < self.ts_max:
+            self.flags |= FLAG_UNSORTED
+        self.count += 1
+        self.ts_min = min(self.ts_min, ts)
+        self.ts_max = max(self.ts_max, ts)
+
+    def overlaps(self, start, end):
+        """時間範圍是否與 [start, end] 重疊"""
+        return (self.count > 0
+                and (start is None or self.ts_max >= start)
+                and (end is None or self.ts_min <= end))
+
+
+class LightCodes:
+    """
+    電燈狀態文字 ↔ int8 代碼的對照表
+
+    '未知' / '關' / '開' 使用與環形緩衝區相同的 -1 / 0 / 1，其他文字（例如 'ON'）
+    第一次出現時配發新代碼並立即寫入 lights.json，之後才寫入使用該代碼的數據。
+
+    Args:
+        directory: segment 檔案所在資料夾
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LIGHT_DICTIONARY)
+        self.labels = dict(LIGHT_LABELS)
+        self.codes = {label: code for code, label in LIGHT_LABELS.items()}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """對照表檔案被（其他寫入端）更新時重新讀取"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding='utf-8') as f:
+            extra = json.load(f)
+        with self._lock:
+            for label, code in extra.items():
+                self.labels[code] = label
+                self.codes[label] = code
+            self._mtime = mtime
+
+    def encode(self, light_status):
+        """
+        文字 → 代碼
+
+        Raises:
+            ValueError: 不同的文字超過 int8 可用的代碼數
+        """
+        if light_status is None:
+            return LIGHT_UNKNOWN
+        code = self.codes.get(light_status)
+        if code is not None:
+            return code
+        with self._lock:
+            code = self.codes.get(light_status)
+            if code is not None:
+                return code
+            code = max(max(self.labels), FIRST_LIGHT_CODE - 1) + 1
+            if code > MAX_LIGHT_CODE:
+                raise ValueError(f"電燈狀態的種類超過 {MAX_LIGHT_CODE - FIRST_LIGHT_CODE + 1} 種，"
+                                 f"無法儲存: {light_status!r}")
+            extra = {label: c for c, label in self.labels.items() if c >= FIRST_LIGHT_CODE}
+            extra[light_status] = code
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(extra, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.labels[code] = light_status
+            self.codes[light_status] = code
+            self._mtime = os.stat(self.path).st_mtime_ns
+        return code
+
+    def decode(self, code):
+        """代碼 → 原本的文字"""
+        label = self.labels.get(code)
+        if label is None:
+            self.reload()
+            label = self.labels.get(code, LIGHT_LABELS[LIGHT_UNKNOWN])
+        return label
+
+    def canonical(self, codes):
+        """
+        把 NumPy 代碼陣列中的自訂代碼換成環形緩衝區使用的 -1 / 0 / 1（'ON' → 1）
+
+        沒有自訂代碼時直接回傳原陣列
+        """
+        if not len(codes) or codes.max() < FIRST_LIGHT_CODE:
+            return codes
+        self.reload()
+        table = np.full(MAX_LIGHT_CODE + 1, LIGHT_UNKNOWN, dtype=codes.dtype)
+        for code, label in self.labels.items():
+            if code >= 0:
+                table[code] = encode_light(label)
+        return np.where(codes >= 0, table[np.maximum(codes, 0)], codes)
+
+
+def read_header(path):
+    """只讀取 segment 標頭"""
+    with open(path, 'rb') as f:
+        return SegmentHeader.unpack(f.read(HEADER_SIZE))
+
+
+class SegmentWriter(BatchWriter):
+    """
+    segment 背景寫入執行緒
+
+    數據只會附加到檔尾；標頭的筆數在每批提交時才更新，
+    因此當機後重新開啟時，超出標頭筆數的未提交數據會被截掉。
+
+    Args:
+        directory: segment 檔案所在資料夾
+        其餘參數同 BatchWriter
+    """
+
+    thread_name = 'segment-writer'
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.lights = LightCodes(directory)
+        self._file = None
+        self._name = None
+        self._header = None
+
+    def write(self, row):
+        """
+        放入一筆數據（在呼叫端把電燈狀態轉成代碼，新的文字會先寫入對照表）
+
+        Raises:
+            ValueError: 電燈狀態的種類超過可用的代碼數
+        """
+        ts, temperature, humidity, light_status = row
+        super().write((ts, temperature, humidity, self.lights.encode(light_status)))
+
+    def _switch(self, name):
+        """切換到另一天的 segment 檔"""
+        if self._file is not None:
+            self._commit()
+            self._file.close()
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            f = open(path, 'r+b')
+            header = SegmentHeader.unpack(f.read(HEADER_SIZE))
+            f.truncate(HEADER_SIZE + header.count * RECORD_SIZE)
+        else:
+            f = open(path, 'w+b')
+            header = SegmentHeader()
+            f.write(header.pack())
+        f.seek(0, os.SEEK_END)
+        self._file, self._name, self._header = f, name, header
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _write_batch(self, batch):
+        for ts, temperature, humidity, light in batch:
+            name = segment_name(ts)
+            if name != self._name:
+                self._switch(name)
+            self._file.write(RECORD.pack(ts, temperature, humidity, light))
+            self._header.add(ts)
+
+    def _commit(self):
+        if self._file is None:
+            return
+        # 先讓數據落地，再更新標頭的筆數
+        sync_file(self._file, self.durability)
+        self._file.seek(0)
+        self._file.write(self._header.pack())
+        self._file.seek(0, os.SEEK_END)
+        sync_file(self._file, self.durability)
+
+    def _close(self):
+        if self._file is not None:
+            self._commit()
+            self._file.close()
+            self._file = None
+
+
+class SegmentStore:
+    """
+    segment 讀取端
+
+    讀取時先看標頭的時間範圍，不重疊的 segment 直接略過；
+    重疊的 segment 以 mmap 對應，NumPy 陣列直接指向 mmap 的記憶體，不會複製。
+
+    Args:
+        directory: segment 檔案所在資料夾
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lights = LightCodes(directory)
+
+    def decode_light(self, code):
+        """電燈代碼 → 原本的文字"""
+        return self.lights.decode(code)
+
+    def segments(self):
+        """
+        列出所有 segment 與其標頭
+
+        Returns:
+            list: 依日期排序的 (路徑, SegmentHeader)
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(SEGMENT_SUFFIX):
+                path = os.path.join(self.directory, name)
+                result.append((path, read_header(path)))
+        return result
+
+    def _map(self, path, header):
+        """以 mmap 開啟 segment，回傳已提交部分的 NumPy 結構化陣列"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        count = min(header.count, (len(mm) - HEADER_SIZE) // RECORD_SIZE)
+        return np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+
+    def _read(self, path, header):
+        """沒有 NumPy 時逐筆解碼（會複製數據）"""
+        with open(path, 'rb') as f:
+            f.seek(HEADER_SIZE)
+            data = f.read(header.count * RECORD_SIZE)
+        return list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD_SIZE]))
+
+    def query(self, start=None, end=None):
+        """
+        查詢 [start, end] 時間範圍內的數據
+
+        Args:
+            start: 起始 epoch 秒數（None 表示不限）
+            end: 結束 epoch 秒數（None 表示不限）
+
+        Returns:
+            list: 每個重疊 segment 一個 NumPy 結構化陣列（mmap 視圖）；
+                  沒有 NumPy 時為 (ts, 溫度, 濕度, 電燈代碼) tuple 的列表
+        """
+        if not HAS_NUMPY:
+            rows = []
+            for path, header in self.segments():
+                if header.overlaps(start, end):
+                    rows.extend(r for r in self._read(path, header)
+                                if (start is None or r[0] >= start)
+                                and (end is None or r[0] <= end))
+            return [rows]
+
+        views = []
+        for path, header in self.segments():
+            if not header.overlaps(start, end):
+                continue
+            records = self._map(path, header)
+            ts = records['ts']
+            if header.flags & FLAG_UNSORTED:
+                mask = np.ones(len(records), dtype=bool)
+                if start is not None:
+                    mask &= ts >= start
+                if end is not None:
+                    mask &= ts <= end
+                records = records[mask]
+            else:
+                lo = 0 if start is None else np.searchsorted(ts, start, side='left')
+                hi = len(ts) if end is None else np.searchsorted(ts, end, side='right')
+                records = records[lo:hi]
+            if len(records):
+                views.append(records)
+        return views
+
+    def tail(self, n):
+        """
+        讀取最近 n 筆數據
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈代碼) tuple
+        """
+        if n <= 0:
+            return []
+        rows = []
+        for path, header in reversed(self.segments()):
+            if header.count == 0:
+                continue
+            if HAS_NUMPY:
+                records = self._map(path, header)[-(n - len(rows)):]
+                chunk = records.tolist()
+            else:
+                chunk = self._read(path, header)[-(n - len(rows)):]
+            rows[:0] = chunk
+            if len(rows) >= n:
+                break
+        return rows
+
+
+def iter_rows(views):
+    """把 query() 的結果展開成 (ts, 溫度, 濕度, 電燈代碼) tuple"""
+    for view in views:
+        yield from (view.tolist() if HAS_NUMPY else view)
+
+
+def import_csv(csv_path, directory, durability=DURABILITY_FLUSH):
+    """
+    把 CSV 檔案匯入 segment 儲存
+
+    Returns:
+        int: 匯入筆數
+    """
+    writer = SegmentWriter(directory, batch_rows=10000, durability=durability).start()
+    for timestamp, light_status, temperature, humidity in read_csv_all(csv_path, CSV_FIELDNAMES):
+        writer.write((parse_timestamp(timestamp), float(temperature), float(humidity), light_status))
+    writer.close(timeout=None)
+    return writer.rows_written
+
+
+def export_csv(directory, csv_path, start=None, end=None):
+    """
+    把 segment 儲存匯出成 CSV 檔案（與 sensor_data.csv 相同格式）
+
+    Returns:
+        int: 匯出筆數
+    """
+    count = 0
+    store = SegmentStore(directory)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        for ts, temperature, humidity, light in iter_rows(store.query(start, end)):
+            writer.writerow([format_timestamp(ts), store.decode_light(light), temperature, humidity])
+            count += 1
+    return count
+
+
+def main():
+    """命令列：CSV 與 segment 互相轉換"""
+    parser = argparse.ArgumentParser(description="segment 儲存的 CSV 匯入 / 匯出工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="CSV → segment")
+    p_import.add_argument('csv_path')
+    p_import.add_argument('directory')
+    p_export = sub.add_parser('export', help="segment → CSV")
+    p_export.add_argument('directory')
+    p_export.add_argument('csv_path')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        count = import_csv(args.csv_path, args.directory)
+        print(f"✅ 已匯入 {count} 筆數據到 {args.directory}")
+    else:
+        count = export_csv(args.directory, args.csv_path)
+        print(f"✅ 已匯出 {count} 筆數據到 {args.csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+熱啟動快照（warm-restart snapshot）
+正常關閉時把記憶體中的歷史數據與裝置狀態存成一個二進位檔，
+下次啟動時以 mmap 直接複製回環形緩衝區，不需要重新解析 CSV
+
+檔案格式:
+    標頭: magic, 版本, 索引長度, CRC32（索引 + 數據）
+    索引: JSON（儲存時間、儲存引擎簽章、每個環形緩衝區的筆數與位置）
+    數據: 每個環形緩衝區依序存放 ts / 溫度 / 濕度（float64）與電燈代碼（int8）四個欄位
+
+儲存引擎的檔案（含 SQLite 的 -wal 與 CSV 的預寫日誌）在快照之後被改動過時，
+快照視為過期，改由儲存引擎重新載入。快照載入後就會刪除，只能使用一次：
+之後的數據只寫入儲存引擎，當機重新啟動時不會載入舊的快照。
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+MAGIC = b'PICOSNAP'
+VERSION = 1
+HEADER = struct.Struct('<8sHII')
+# 每筆數據的位元組數（ts、溫度、濕度各 8 bytes，電燈代碼 1 byte）
+ROW_SIZE = 25
+
+
+def storage_signature(paths):
+    """
+    儲存引擎檔案的簽章（大小與修改時間），用來確認快照之後數據沒有被改動
+
+    Args:
+        paths: 檔案或資料夾列表（資料夾時包含其中所有檔案）
+
+    Returns:
+        list: 每個路徑一個簽章，不存在或空的檔案為 None
+    """
+    return [_signature(path) for path in paths]
+
+
+def _signature(path):
+    if os.path.isdir(path):
+        entries = []
+        for root, _, files in os.walk(path):
+            for name in files:
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                entries.append([os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns])
+        return sorted(entries)
+    if os.path.exists(path):
+        stat = os.stat(path)
+        # 空檔案與不存在相同（清空的 -wal 或預寫日誌中沒有待重做的數據）
+        return [stat.st_size, stat.st_mtime_ns] if stat.st_size else None
+    return None
+
+
+def save_snapshot(path, history, devices, signature):
+    """
+    儲存快照（先寫入暫存檔再取代，寫到一半中斷不會留下損壞的檔案）
+
+    Args:
+        path: 快照檔案路徑
+        history: 所有裝置合併的 SensorRingBuffer
+        devices: DeviceRegistry
+        signature: 儲存引擎目前的簽章（storage_signature）
+    """
+    rings = [(None, None, 0, history)]
+    rings += [(name, state.topic, state.messages, state.history)
+              for name, state in list(devices.devices.items())]
+    index, chunks, offset = [], [], 0
+    for name, topic, messages, ring in rings:
+        columns, total = ring.export_state()
+        rows = len(columns[3])
+        index.append({'device': name, 'topic': topic, 'messages': messages,
+                      'rows': rows, 'total': total, 'offset': offset})
+        chunks.extend(columns)
+        offset += rows * ROW_SIZE
+
+    meta = json.dumps({'saved_at': time.time(), 'signature': signature, 'rings': index},
+                      ensure_ascii=False).encode('utf-8')
+    crc = zlib.crc32(meta)
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(meta), crc))
+        f.write(meta)
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _restore_ring(view, offset, rows, ring, total):
+    ts_end = offset + rows * 8
+    temperature_end = ts_end + rows * 8
+    humidity_end = temperature_end + rows * 8
+    ring.load_state((view[offset:ts_end], view[ts_end:temperature_end],
+                     view[temperature_end:humidity_end], view[humidity_end:humidity_end + rows]),
+                    total)
+
+
+def load_snapshot(path, history, devices, signature):
+    """
+    載入快照到環形緩衝區與裝置索引
+
+    先檢查完整性與簽章，全部通過後才會修改 history / devices；
+    不論是否載入，讀取後都會刪除快照檔案。
+
+    Returns:
+        bool: 是否已載入（檔案不存在或已過期時為 False）
+
+    Raises:
+        ValueError: 快照檔案損壞或版本不符
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        return _load(path, history, devices, signature)
+    finally:
+        os.remove(path)
+
+
+def _load(path, history, devices, signature):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if len(mm) < HEADER.size:
+            raise ValueError("快照檔案不完整")
+        magic, version, meta_size, crc = HEADER.unpack_from(mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("不是有效的快照檔案")
+        with memoryview(mm) as view:
+            if zlib.crc32(view[HEADER.size:]) != crc:
+                raise ValueError("快照檔案 CRC 錯誤")
+            meta = json.loads(bytes(view[HEADER.size:HEADER.size + meta_size]).decode('utf-8'))
+            # JSON 會把 tuple 轉成 list，兩邊都以 JSON 的形式比較
+            if meta['signature'] != json.loads(json.dumps(signature)):
+                return False
+            data_size = len(mm) - HEADER.size - meta_size
+            for ring in meta['rings']:
+                if ring['offset'] + ring['rows'] * ROW_SIZE > data_size:
+                    raise ValueError("快照檔案長度不符")
+            with view[HEADER.size + meta_size:] as data:
+                for ring in meta['rings']:
+                    if ring['device'] is None:
+                        target = history
+                    else:
+                        target = devices.restore(ring['device'], ring['topic'],
+                                                 ring['messages']).history
+                    _restore_ring(data, ring['offset'], ring['rows'], target, ring['total'])
+    return True
@@ -0,0 +1,180 @@
+"""
+SQLite 儲存引擎（WAL 模式）
+寫入由背景執行緒以批次交易完成，讀取使用各執行緒自己的唯讀連線；
+WAL 模式下讀取不會阻塞寫入，寫入也不會阻塞讀取
+
+資料表:
+    readings(ts, device, temperature, humidity, light)
+    索引 (device, ts) 與 (ts) 都包含所有欄位（covering index），查詢不需要回表
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+
+from csv_writer import BatchWriter, DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC
+from ring_buffer import encode_light
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    ts REAL NOT NULL,
+    device TEXT NOT NULL DEFAULT '',
+    temperature REAL NOT NULL,
+    humidity REAL NOT NULL,
+    light INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_readings_device_ts
+    ON readings (device, ts, temperature, humidity, light);
+CREATE INDEX IF NOT EXISTS idx_readings_ts
+    ON readings (ts, temperature, humidity, light);
+"""
+
+INSERT_SQL = "INSERT INTO readings (ts, device, temperature, humidity, light) VALUES (?, ?, ?, ?, ?)"
+
+# durability 對應的 synchronous 設定
+SYNCHRONOUS = {
+    DURABILITY_NONE: 'OFF',
+    DURABILITY_FLUSH: 'NORMAL',
+    DURABILITY_FSYNC: 'FULL'
+}
+
+
+def create_schema(path):
+    """建立資料庫（如果不存在）並切換到 WAL 模式"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
+
+
+def range_sql(columns, start, end, device, limit, newest):
+    """
+    組成時間範圍查詢
+
+    只會產生少數幾種固定的 SQL 字串，sqlite3 模組會快取編譯好的語句（prepared statement）
+
+    Returns:
+        tuple: (SQL, 參數)
+    """
+    where, params = [], []
+    if device is not None:
+        where.append("device = ?")
+        params.append(device)
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts <= ?")
+        params.append(end)
+    sql = f"SELECT {columns} FROM readings"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts DESC" if newest else " ORDER BY ts"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+class SqliteWriter(BatchWriter):
+    """
+    SQLite 背景寫入執行緒
+
+    每批數據以 executemany 寫入同一個交易，依 batch_rows / batch_seconds 提交
+
+    Args:
+        path: 資料庫檔案路徑
+        其餘參數同 BatchWriter（durability 對應 PRAGMA synchronous）
+    """
+
+    thread_name = 'sqlite-writer'
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn = None
+
+    def _open(self):
+        # 連線只在寫入執行緒中使用
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[self.durability]}")
+        self._in_transaction = False
+
+    def _write_batch(self, batch):
+        if not self._in_transaction:
+            self._conn.execute("BEGIN")
+            self._in_transaction = True
+        self._conn.executemany(INSERT_SQL, [
+            (ts, device or '', temperature, humidity, encode_light(light_status))
+            for ts, temperature, humidity, light_status, device in batch
+        ])
+
+    def _commit(self):
+        if self._in_transaction:
+            self._conn.execute("COMMIT")
+            self._in_transaction = False
+
+    def _close(self):
+        self._commit()
+        # 把 WAL 寫回資料庫並清空，下次啟動時不需要重做（熱啟動快照的簽章也才會一致）
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.close()
+
+
+class SqliteReader:
+    """
+    SQLite 查詢（每個執行緒一個唯讀連線）
+
+    Args:
+        path: 資料庫檔案路徑
+    """
+
+    def __init__(self, path):
+        self._uri = Path(path).absolute().as_uri() + '?mode=ro'
+        self._local = threading.local()
+
+    def _connection(self):
+        """目前執行緒的唯讀連線（WAL 模式下不會阻塞寫入）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self._uri, uri=True)
+        return conn
+
+    def query(self, start=None, end=None, limit=None, newest=False, device=None):
+        """
+        查詢 [start, end] 時間範圍內的數據（以 (device, ts) 或 (ts) 索引定位）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈代碼)
+        """
+        newest = newest and limit is not None
+        sql, params = range_sql("ts, temperature, humidity, light",
+                                start, end, device, limit, newest)
+        rows = self._connection().execute(sql, params).fetchall()
+        if newest:
+            rows.reverse()
+        return rows
+
+    def iter_chunks(self, start=None, end=None, chunk_rows=10000):
+        """
+        分批產生 [start, end] 時間範圍內的數據
+
+        使用獨立的唯讀連線，匯出途中不會影響其他查詢。
+
+        Yields:
+            list: 每批最多 chunk_rows 筆 (ts, 溫度, 濕度, 電燈代碼)
+        """
+        sql, params = range_sql("ts, temperature, humidity, light", start, end, None, None, False)
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            conn.close()
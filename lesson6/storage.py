@@ -0,0 +1,417 @@
+"""
+可抽換的數據儲存引擎
+app_flask.py 透過同一組介面寫入與載入數據，實際存放方式可選 CSV、segment、依日期分割或 SQLite
+"""
+
+import os
+from collections import deque
+from itertools import islice
+
+from csv_reader import read_csv_tail, read_csv_all, read_csv_range, iter_csv_range, CSV_FIELDNAMES
+from csv_writer import CsvBatchWriter
+from ring_buffer import encode_light, decode_light, format_timestamp, parse_timestamp
+from partition_store import Manifest, PartitionWriter, PartitionStore
+from segment_store import SegmentWriter, SegmentStore, HAS_NUMPY
+from sqlite_store import SqliteWriter, SqliteReader, create_schema
+
+
+if HAS_NUMPY:
+    import numpy as np
+
+
+def rows_to_columns(rows):
+    """
+    (ts, 溫度, 濕度, 電燈狀態) 列表 → 欄位
+
+    Returns:
+        tuple: (ts, 溫度, 濕度, 電燈代碼)，有 NumPy 時為 ndarray，否則為 list
+    """
+    ts = [row[0] for row in rows]
+    temperature = [row[1] for row in rows]
+    humidity = [row[2] for row in rows]
+    light = [encode_light(row[3]) for row in rows]
+    if HAS_NUMPY:
+        return (np.array(ts, dtype=float), np.array(temperature, dtype=float),
+                np.array(humidity, dtype=float), np.array(light, dtype=np.int8))
+    return ts, temperature, humidity, light
+
+
+class CsvStorage:
+    """
+    CSV 儲存引擎（sensor_data.csv）
+
+    Args:
+        path: CSV 檔案路徑
+        wal_path: 預寫日誌檔案路徑（None 表示不使用）
+        **writer_options: 傳給 CsvBatchWriter 的批次設定
+    """
+
+    name = 'csv'
+    # query 是否支援 device 參數（只查詢單一裝置）
+    device_queries = False
+
+    def __init__(self, path, wal_path=None, **writer_options):
+        self.path = path
+        # 數據所在的所有檔案（熱啟動快照以這些檔案的簽章判斷是否過期）
+        self.data_paths = [path] + ([wal_path] if wal_path else [])
+        self.writer = CsvBatchWriter(path, CSV_FIELDNAMES, wal_path=wal_path, **writer_options)
+        self.skipped = 0
+        # 上次沒有正常關閉時，先以預寫日誌修復 CSV 再讀取
+        self.recovered = self.writer.recover()
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def append(self, ts, temperature, humidity, light_status, device=None):
+        """寫入一筆數據（交給背景執行緒，不區分裝置）"""
+        self.writer.write({
+            '時間戳記': format_timestamp(ts),
+            '電燈狀態': light_status,
+            '溫度': temperature,
+            '濕度': humidity
+        })
+
+    def load_recent(self, n, full_scan=False):
+        """
+        載入最近 n 筆數據
+
+        Args:
+            full_scan: True 時讀取並檢查整個檔案（只保留最後 n 筆）
+
+        Yields:
+            tuple: (ts, 溫度, 濕度, 電燈狀態)，格式錯誤的數據會略過並計入 skipped
+        """
+        if full_scan:
+            return deque(self._parse(read_csv_all(self.path, CSV_FIELDNAMES)), maxlen=n)
+        return self._parse(read_csv_tail(self.path, n, CSV_FIELDNAMES))
+
+    def query(self, start=None, end=None, limit=None, newest=False):
+        """
+        查詢 [start, end] 時間範圍內的數據（依時間二分搜尋檔案位置）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        if not os.path.exists(self.path):
+            return []
+        return list(self._parse(read_csv_range(
+            self.path, CSV_FIELDNAMES, start, end, limit, newest)))
+
+    def query_columns(self, start=None, end=None):
+        """查詢 [start, end] 時間範圍內的數據，以欄位形式回傳"""
+        return rows_to_columns(self.query(start, end))
+
+    def iter_chunks(self, start=None, end=None, chunk_rows=10000):
+        """
+        分批產生 [start, end] 時間範圍內的數據（用於匯出）
+
+        Yields:
+            list: 每批最多 chunk_rows 筆 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        if not os.path.exists(self.path):
+            return
+        for rows in iter_csv_range(self.path, CSV_FIELDNAMES, start, end, chunk_rows):
+            yield list(self._parse(rows))
+
+    def _parse(self, rows):
+        for row in rows:
+            try:
+                timestamp, light_status, temperature, humidity = row
+                yield parse_timestamp(timestamp), float(temperature), float(humidity), light_status
+            except ValueError:
+                self.skipped += 1
+
+    def close(self):
+        self.writer.close()
+
+
+class SegmentStorage:
+    """
+    segment 儲存引擎（每天一個 mmap 二進位檔）
+
+    Args:
+        directory: segment 檔案所在資料夾
+        **writer_options: 傳給 SegmentWriter 的批次設定
+    """
+
+    name = 'segment'
+    device_queries = False
+
+    def __init__(self, directory, **writer_options):
+        self.path = directory
+        self.data_paths = [directory]
+        self.writer = SegmentWriter(directory, **writer_options)
+        self.store = SegmentStore(directory)
+        self.skipped = 0
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def append(self, ts, temperature, humidity, light_status, device=None):
+        """寫入一筆數據（交給背景執行緒，不區分裝置）"""
+        self.writer.write((ts, temperature, humidity, light_status))
+
+    def load_recent(self, n, full_scan=False):
+        """
+        載入最近 n 筆數據（segment 不需要完整掃描，full_scan 會被忽略）
+
+        Yields:
+            tuple: (ts, 溫度, 濕度, 電燈狀態)
+        """
+        for ts, temperature, humidity, light in self.store.tail(n):
+            yield ts, temperature, humidity, self.store.decode_light(light)
+
+    def query(self, start=None, end=None, limit=None, newest=False):
+        """
+        查詢 [start, end] 時間範圍內的數據
+
+        segment 標頭的時間範圍就是稀疏索引，不重疊的 segment 不會被開啟；
+        重疊的 segment 內再以二分搜尋找到範圍。
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        views = self.store.query(start, end)
+        if limit is not None:
+            # 只留下需要的那一端，避免把整個範圍轉成 Python 物件
+            picked = []
+            remaining = limit
+            for view in (reversed(views) if newest else views):
+                if remaining <= 0:
+                    break
+                part = view[-remaining:] if newest else view[:remaining]
+                picked.append(part)
+                remaining -= len(part)
+            views = list(reversed(picked)) if newest else picked
+        rows = []
+        for view in views:
+            for ts, temperature, humidity, light in (view.tolist() if HAS_NUMPY else view):
+                rows.append((ts, temperature, humidity, self.store.decode_light(light)))
+        return rows
+
+    def query_columns(self, start=None, end=None):
+        """
+        查詢 [start, end] 時間範圍內的數據，以欄位形式回傳
+
+        直接從 mmap 視圖取出欄位，不經過 Python tuple。
+        """
+        views = self.store.query(start, end)
+        if not HAS_NUMPY:
+            return rows_to_columns([(ts, t, h, self.store.decode_light(light))
+                                    for view in views for ts, t, h, light in view])
+        if not views:
+            return rows_to_columns([])
+        ts, temperature, humidity, light = (np.concatenate([view[name] for view in views])
+                                            for name in ('ts', 'temperature', 'humidity', 'light'))
+        return ts, temperature, humidity, self.store.lights.canonical(light)
+
+    def iter_chunks(self, start=None, end=None, chunk_rows=10000):
+        """
+        分批產生 [start, end] 時間範圍內的數據（用於匯出）
+
+        Yields:
+            list: 每批最多 chunk_rows 筆 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        for view in self.store.query(start, end):
+            for i in range(0, len(view), chunk_rows):
+                part = view[i:i + chunk_rows]
+                yield [(ts, temperature, humidity, self.store.decode_light(light))
+                       for ts, temperature, humidity, light in (part.tolist() if HAS_NUMPY else part)]
+
+    def close(self):
+        self.writer.close()
+
+
+class PartitionedStorage:
+    """
+    依日期與裝置分割的儲存引擎（每台裝置每天一個 CSV，舊的分割檔壓縮、過期的刪除）
+
+    Args:
+        directory: 分割檔所在資料夾
+        compress_after_days / retention_days / compression: 見 PartitionWriter
+        **writer_options: 傳給 PartitionWriter 的批次設定
+    """
+
+    name = 'partitioned'
+    device_queries = True
+
+    def __init__(self, directory, compress_after_days=2, retention_days=90,
+                 compression='gzip', **writer_options):
+        self.path = directory
+        self.data_paths = [directory]
+        self.manifest = Manifest(directory)
+        self.writer = PartitionWriter(self.manifest, compress_after_days, retention_days,
+                                      compression, **writer_options)
+        self.store = PartitionStore(self.manifest)
+
+    @property
+    def skipped(self):
+        return self.store.skipped
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def append(self, ts, temperature, humidity, light_status, device=None):
+        """寫入一筆數據（交給背景執行緒，依裝置與日期分割）"""
+        self.writer.write((ts, temperature, humidity, light_status, device))
+
+    def _newest(self, n, start=None, end=None, device=None):
+        """由最新的一天往回讀，直到湊滿 n 筆"""
+        rows = []
+        for day in self.store.iter_rows(start, end, device, reverse_days=True):
+            rows = day + rows
+            if len(rows) >= n:
+                break
+        return rows[max(len(rows) - n, 0):]
+
+    def load_recent(self, n, full_scan=False):
+        """
+        載入最近 n 筆數據（只讀取需要的分割檔，full_scan 會被忽略）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        return self._newest(n)
+
+    def query(self, start=None, end=None, limit=None, newest=False, device=None):
+        """
+        查詢 [start, end] 時間範圍內的數據
+
+        只開啟 manifest 中時間範圍重疊的分割檔，同一天的各裝置依時間合併。
+
+        Args:
+            device: 只查詢此裝置（None 表示所有裝置）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        if limit is not None and newest:
+            return self._newest(limit, start, end, device)
+        rows = self.store.iter_stream(start, end, device)
+        return list(rows if limit is None else islice(rows, limit))
+
+    def query_columns(self, start=None, end=None):
+        """查詢 [start, end] 時間範圍內的數據，以欄位形式回傳"""
+        return rows_to_columns(self.query(start, end))
+
+    def iter_chunks(self, start=None, end=None, chunk_rows=10000):
+        """
+        分批產生 [start, end] 時間範圍內的數據（用於匯出）
+
+        Yields:
+            list: 每批最多 chunk_rows 筆 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        rows = self.store.iter_stream(start, end)
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.writer.close()
+
+
+class SqliteStorage:
+    """
+    SQLite 儲存引擎（WAL 模式，讀取不會阻塞寫入）
+
+    Args:
+        path: 資料庫檔案路徑
+        **writer_options: 傳給 SqliteWriter 的批次設定
+    """
+
+    name = 'sqlite'
+    # 單一裝置的查詢使用 (device, ts) 索引
+    device_queries = True
+
+    def __init__(self, path, **writer_options):
+        self.path = path
+        # 尚未 checkpoint 的數據在 -wal 檔中
+        self.data_paths = [path, path + '-wal']
+        self.skipped = 0
+        create_schema(path)
+        self.writer = SqliteWriter(path, **writer_options)
+        self.reader = SqliteReader(path)
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def append(self, ts, temperature, humidity, light_status, device=None):
+        """寫入一筆數據（交給背景執行緒）"""
+        self.writer.write((ts, temperature, humidity, light_status, device))
+
+    def load_recent(self, n, full_scan=False):
+        """
+        載入最近 n 筆數據（以索引直接取最後 n 筆，full_scan 會被忽略）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        return self.query(limit=n, newest=True)
+
+    def query(self, start=None, end=None, limit=None, newest=False, device=None):
+        """
+        查詢 [start, end] 時間範圍內的數據
+
+        Args:
+            device: 只查詢此裝置（None 表示所有裝置）
+
+        Returns:
+            list: 由舊到新的 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        return [(ts, temperature, humidity, decode_light(light))
+                for ts, temperature, humidity, light
+                in self.reader.query(start, end, limit, newest, device)]
+
+    def query_columns(self, start=None, end=None):
+        """查詢 [start, end] 時間範圍內的數據，以欄位形式回傳（電燈直接使用代碼）"""
+        rows = self.reader.query(start, end)
+        if HAS_NUMPY:
+            data = np.array(rows, dtype=float).reshape(-1, 4)
+            return data[:, 0], data[:, 1], data[:, 2], data[:, 3].astype(np.int8)
+        return tuple(list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+
+    def iter_chunks(self, start=None, end=None, chunk_rows=10000):
+        """
+        分批產生 [start, end] 時間範圍內的數據（用於匯出）
+
+        Yields:
+            list: 每批最多 chunk_rows 筆 (ts, 溫度, 濕度, 電燈狀態)
+        """
+        for rows in self.reader.iter_chunks(start, end, chunk_rows):
+            yield [(ts, temperature, humidity, decode_light(light))
+                   for ts, temperature, humidity, light in rows]
+
+    def close(self):
+        self.writer.close()
+
+
+def create_storage(engine, csv_path, segment_dir, partition_dir=None, partition_options=None,
+                   sqlite_path=None, wal_path=None, **writer_options):
+    """
+    依名稱建立儲存引擎
+
+    Args:
+        engine: 'csv' / 'segment' / 'partitioned' / 'sqlite'
+        csv_path: CSV 檔案路徑
+        segment_dir: segment 資料夾
+        partition_dir: 分割檔資料夾
+        partition_options: compress_after_days / retention_days / compression
+        sqlite_path: SQLite 資料庫檔案路徑
+        wal_path: CSV 引擎的預寫日誌檔案路徑（None 表示不使用）
+        **writer_options: batch_rows / batch_seconds / durability / on_batch
+    """
+    if engine == CsvStorage.name:
+        return CsvStorage(csv_path, wal_path=wal_path, **writer_options)
+    if engine == SegmentStorage.name:
+        return SegmentStorage(segment_dir, **writer_options)
+    if engine == PartitionedStorage.name:
+        return PartitionedStorage(partition_dir, **(partition_options or {}), **writer_options)
+    if engine == SqliteStorage.name:
+        return SqliteStorage(sqlite_path, **writer_options)
+    raise ValueError(f"未知的儲存引擎: {engine}")
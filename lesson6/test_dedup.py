@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+測試 dedup.py 的 QoS 1 重複訊息過濾（lru 與 bloom 兩種模式）
+
+執行方式:
+    uv run python test_dedup.py
+    uv run pytest test_dedup.py
+"""
+
+from dedup import create_dedup, DEDUP_MODES
+
+WINDOW = 10
+
+
+def filters():
+    return [create_dedup(mode, 10000, WINDOW) for mode in DEDUP_MODES]
+
+
+def send(dedup, ids, ts, step=0.1, device='pico'):
+    """依序送出 ids，回傳每一則是否被判斷為重複"""
+    return [dedup.seen(device, msg_id, ts + i * step) for i, msg_id in enumerate(ids)]
+
+
+def test_redelivered_batch():
+    """1..5 之後重送 3、4、5，全部是重複訊息"""
+    for dedup in filters():
+        assert send(dedup, range(1, 6), 0) == [False] * 5
+        assert send(dedup, [3, 4, 5], 1) == [True] * 3
+        assert dedup.stats()['resets'] == 0
+
+
+def test_out_of_order_redelivery():
+    """較早的訊息在更新的訊息之後重送，仍然是重複訊息，之後的新訊息照常接受"""
+    for dedup in filters():
+        send(dedup, range(1, 101), 0, step=0.05)
+        assert send(dedup, [2, 50, 99], 6) == [True] * 3
+        assert send(dedup, [101, 102], 7) == [False, False]
+
+
+def test_devices_are_independent():
+    """不同裝置的相同 msg_id 不會互相影響"""
+    for dedup in filters():
+        send(dedup, range(1, 6), 0, device='a')
+        assert send(dedup, range(1, 6), 0, device='b') == [False] * 5
+
+
+def test_window_expiry():
+    """超過時間窗口後相同的 msg_id 視為新的訊息（測試腳本重新執行）"""
+    for dedup in filters():
+        send(dedup, range(1, 6), 0)
+        assert send(dedup, range(1, 6), WINDOW + 1) == [False] * 5
+
+
+def test_restart():
+    """重新開機從 1 開始：舊的 key 還在時間窗口內也不會把新的訊息當成重複"""
+    for dedup in filters():
+        send(dedup, range(1, 201), 0)            # 0 ~ 19.9 秒
+        # 編號 1 已經過期，100 ~ 150 還在時間窗口內
+        assert send(dedup, range(1, 151), 20, step=0.01) == [False] * 150
+        assert dedup.stats()['resets'] == 1
+
+
+def test_wraparound():
+    """二進位格式的 16 位元編號歸零"""
+    for dedup in filters():
+        send(dedup, range(65500, 65536), 0)
+        assert send(dedup, [0, 1, 2], 4) == [False] * 3
+        assert send(dedup, [1], 4.5) == [True]
+        assert dedup.stats()['resets'] == 1
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試 QoS 1 重複訊息過濾")
+    print("=" * 70)
+    for test in (test_redelivered_batch, test_out_of_order_redelivery, test_devices_are_independent,
+                 test_window_expiry, test_restart, test_wraparound):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+測試 payload_codec.py 的訊息解碼（二進位格式來回編解碼、JSON 相容欄位、錯誤封包）
+
+執行方式:
+    uv run python test_payload_codec.py
+    uv run pytest test_payload_codec.py
+"""
+
+import json
+
+from payload_codec import (decode_binary, decode_payload, encode_binary, pico_codec,
+                           HEADER, VERSION)
+
+
+def test_binary_round_trip():
+    """溫度（含負數）、濕度、電燈狀態、裝置名稱與 msg_id 編碼後解回原值"""
+    for temperature, humidity, light in ((23.45, 61.2, '開'), (-5.5, 0.0, '關'), (40.0, 99.99, 'off')):
+        payload = encode_binary(temperature, humidity, light, 'pico-客廳', 42)
+        assert payload[:1] == bytes([pico_codec.MAGIC])
+        decoded = decode_payload(payload)
+        assert decoded == (temperature, humidity, '開' if light == '開' else '關', 'pico-客廳', 42)
+
+
+def test_missing_values():
+    """沒有數值時為 0.0、電燈狀態未知、沒有裝置名稱時為 None"""
+    assert decode_payload(encode_binary()) == (0.0, 0.0, '未知', None, 0)
+    assert decode_payload(encode_binary(20.0, None, '不明')) == (20.0, 0.0, '未知', None, 0)
+
+
+def test_msg_id_wraps():
+    """msg_id 只保留 16 位元，超過 65535 從 0 重新開始"""
+    assert decode_payload(encode_binary(msg_id=65535))[4] == 65535
+    assert decode_payload(encode_binary(msg_id=65536 + 7))[4] == 7
+
+
+def test_long_name_truncated_at_char_boundary():
+    """裝置名稱超過 255 位元組時在 UTF-8 字元邊界截斷，仍然可以解碼"""
+    name = '溫' * 100                      # 300 位元組
+    encoded = pico_codec.encode_name(name)
+    assert len(encoded) <= pico_codec.MAX_NAME_BYTES
+    assert encoded.decode('utf-8') == '溫' * 85
+    assert decode_payload(encode_binary(device=name))[3] == '溫' * 85
+
+
+def test_json_aliases():
+    """JSON 格式相容 temp / humi / light / message_id 等欄位名稱"""
+    payload = json.dumps({'temperature': 25.5, 'humidity': 60, 'light_status': '開',
+                          'device': 'pico', 'msg_id': 3}).encode()
+    assert decode_payload(payload) == (25.5, 60.0, '開', 'pico', 3)
+    payload = json.dumps({'temp': 21, 'humi': 55.5, 'light': '關', 'message_id': 9}).encode()
+    assert decode_payload(payload) == (21.0, 55.5, '關', None, 9)
+    assert decode_payload(b'{}') == (0.0, 0.0, '未知', None, None)
+
+
+def test_invalid_binary():
+    """版本不符、長度不足、裝置名稱不完整時拋出 ValueError"""
+    payload = encode_binary(20.0, 50.0, '開', 'pico', 1)
+    bad_version = payload[:1] + bytes([VERSION + 1]) + payload[2:]
+    for bad in (payload[:HEADER.size - 1], bad_version, payload[:-1]):
+        try:
+            decode_binary(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"應該拋出 ValueError: {bad!r}")
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試訊息編解碼")
+    print("=" * 70)
+    for test in (test_binary_round_trip, test_missing_values, test_msg_id_wraps,
+                 test_long_name_truncated_at_char_boundary, test_json_aliases, test_invalid_binary):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
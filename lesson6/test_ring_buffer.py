@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+測試 ring_buffer.py 的環形緩衝區（覆蓋最舊的數據、時間範圍查詢、增量同步）
+
+執行方式:
+    uv run python test_ring_buffer.py
+    uv run pytest test_ring_buffer.py
+"""
+
+from ring_buffer import SensorRingBuffer, parse_timestamp
+
+BASE = parse_timestamp('2025-01-01 12:00:00')
+
+
+def filled(capacity, count):
+    """寫入 count 筆（每筆間隔 1 秒，溫度等於序號）"""
+    ring = SensorRingBuffer(capacity)
+    for i in range(count):
+        ring.append(BASE + i, float(i), 50.0, '開' if i % 2 else '關')
+    return ring
+
+
+def temperatures(rows):
+    return [row['temperature'] for row in rows]
+
+
+def test_wraparound():
+    """超過容量時覆蓋最舊的數據，順序仍然由舊到新"""
+    ring = filled(5, 12)
+    assert len(ring) == 5
+    assert ring.total == 12
+    assert temperatures(ring.rows()) == [7, 8, 9, 10, 11]
+    assert ring.oldest_ts() == BASE + 7
+    assert ring.latest()['temperature'] == 11
+    assert temperatures(ring.tail(2)) == [10, 11]
+
+
+def test_query_across_wrap():
+    """時間範圍查詢（包含兩端）跨過陣列結尾時結果正確"""
+    ring = filled(5, 12)
+    assert temperatures(ring.query(BASE + 8, BASE + 10)) == [8, 9, 10]
+    assert temperatures(ring.query(BASE + 8)) == [8, 9, 10, 11]
+    assert temperatures(ring.query(None, BASE + 9)) == [7, 8, 9]
+    # 有 start 時取最舊的 limit 筆，沒有 start 時取最新的
+    assert temperatures(ring.query(BASE + 7, limit=2)) == [7, 8]
+    assert temperatures(ring.query(limit=2)) == [10, 11]
+    assert ring.query(BASE + 100) == []
+    ts, temperature, humidity, light = ring.query_columns(BASE + 8, BASE + 10)
+    assert list(temperature) == [8, 9, 10]
+    assert list(light) == [0, 1, 0]
+
+
+def test_since():
+    """增量同步：回傳 cursor 之後新增的數據，cursor 已被覆蓋或不合理時要求重新同步"""
+    ring = filled(5, 12)
+    rows, total = ring.since(10)
+    assert temperatures(rows) == [10, 11] and total == 12
+    assert ring.since(12) == ([], 12)
+    assert ring.since(6) == (None, 12)            # 第 6 筆已被覆蓋
+    assert ring.since(13) == (None, 12)           # 比目前的 total 還新（伺服器重新啟動）
+    assert ring.since(8, limit=3) == (None, 12)   # 新增筆數超過 limit
+
+
+def test_state_round_trip():
+    """export_state / load_state（熱啟動快照）保留順序與 total，超過容量時只留最新的"""
+    ring = filled(5, 12)
+    columns, total = ring.export_state()
+    copy = SensorRingBuffer(5)
+    copy.load_state(columns, total)
+    assert copy.rows() == ring.rows() and copy.total == 12
+    smaller = SensorRingBuffer(3)
+    smaller.load_state(columns, total)
+    assert temperatures(smaller.rows()) == [9, 10, 11]
+    smaller.append(BASE + 12, 12.0, 50.0, '開')
+    assert temperatures(smaller.rows()) == [10, 11, 12]
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試環形緩衝區")
+    print("=" * 70)
+    for test in (test_wraparound, test_query_across_wrap, test_since, test_state_round_trip):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+測試 rolling_stats.py 的 P² 分位數估計
+與 statistics.quantiles（線性內插，method='inclusive'）的結果比較
+
+執行方式:
+    uv run python test_rolling_stats.py
+    uv run pytest test_rolling_stats.py
+"""
+
+import random
+import statistics
+
+from rolling_stats import P2Quantile, DEFAULT_QUANTILES
+
+# 大量數據時估計值與精確值的誤差上限（佔數據範圍的比例）
+TOLERANCE = 0.01
+
+
+def exact_quantile(data, q):
+    """statistics.quantiles 的 q 分位數（q 為 0.01 的倍數）"""
+    return statistics.quantiles(data, n=100, method='inclusive')[round(q * 100) - 1]
+
+
+def estimate(data, q):
+    estimator = P2Quantile(q)
+    for x in data:
+        estimator.add(x)
+    return estimator.value
+
+
+def test_small_sample_is_exact():
+    """數據少時回傳精確值，p95 / p99 不會停在中位數"""
+    data = [20, 21, 22, 23, 24]
+    for q in DEFAULT_QUANTILES:
+        assert abs(estimate(data, q) - exact_quantile(data, q)) < 1e-9
+    assert estimate(data, 0.5) < estimate(data, 0.95) < estimate(data, 0.99)
+
+
+def test_known_distributions():
+    """常態、均勻與指數分布各 20000 筆，估計值與精確值的誤差在 TOLERANCE 以內"""
+    rng = random.Random(2025)
+    distributions = {
+        'normal': [rng.gauss(25, 3) for _ in range(20000)],
+        'uniform': [rng.uniform(0, 100) for _ in range(20000)],
+        'exponential': [rng.expovariate(0.5) for _ in range(20000)]
+    }
+    for name, data in distributions.items():
+        span = max(data) - min(data)
+        for q in DEFAULT_QUANTILES:
+            error = abs(estimate(data, q) - exact_quantile(data, q)) / span
+            assert error < TOLERANCE, f"{name} p{q * 100:g} 誤差 {error:.4f}"
+
+
+def test_sorted_input():
+    """由小到大依序輸入（溫度持續上升）時仍然接近精確值"""
+    data = [20 + i * 0.01 for i in range(5000)]
+    span = data[-1] - data[0]
+    for q in DEFAULT_QUANTILES:
+        assert abs(estimate(data, q) - exact_quantile(data, q)) / span < TOLERANCE
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試 P² 分位數估計")
+    print("=" * 70)
+    for test in (test_small_sample_is_exact, test_known_distributions, test_sorted_input):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
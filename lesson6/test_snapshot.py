@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+測試 snapshot.py 的熱啟動快照（來回儲存載入、簽章不符時不載入、損壞檔案、只能使用一次）
+
+執行方式:
+    uv run python test_snapshot.py
+    uv run pytest test_snapshot.py
+"""
+
+import os
+import tempfile
+
+from devices import DeviceRegistry
+from ring_buffer import SensorRingBuffer, parse_timestamp
+from snapshot import save_snapshot, load_snapshot, storage_signature, HEADER
+
+BASE = parse_timestamp('2025-01-01 12:00:00')
+CAPACITY = 20
+
+
+def filled():
+    """合併的歷史數據 30 筆（超過容量）、兩台裝置各 15 筆"""
+    history = SensorRingBuffer(CAPACITY)
+    devices = DeviceRegistry(CAPACITY)
+    for i in range(30):
+        name = 'pico-a' if i % 2 else 'pico-b'
+        history.append(BASE + i, float(i), 50.0, '開')
+        devices.update(name, f'{name}/sensor', BASE + i, float(i), 50.0, '開')
+    return history, devices
+
+
+def data_file(directory):
+    path = os.path.join(directory, 'sensor_data.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('時間戳記,電燈狀態,溫度,濕度\n2025-01-01 12:00:00,開,20.0,50.0\n')
+    return path
+
+
+def test_round_trip():
+    """儲存後載入的歷史數據、total 與裝置狀態和原本相同，載入後快照被刪除"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.bin')
+        signature = storage_signature([data_file(directory)])
+        history, devices = filled()
+        save_snapshot(path, history, devices, signature)
+
+        restored, restored_devices = SensorRingBuffer(CAPACITY), DeviceRegistry(CAPACITY)
+        assert load_snapshot(path, restored, restored_devices, signature)
+        assert restored.rows() == history.rows() and restored.total == 30
+        assert sorted(restored_devices.names()) == ['pico-a', 'pico-b']
+        for name in ('pico-a', 'pico-b'):
+            original, copy = devices.get(name), restored_devices.get(name)
+            assert copy.history.rows() == original.history.rows()
+            assert (copy.topic, copy.messages) == (original.topic, original.messages)
+        assert not os.path.exists(path)
+        # 只能使用一次
+        assert not load_snapshot(path, restored, restored_devices, signature)
+
+
+def test_signature_mismatch():
+    """快照之後數據檔案被改動過（簽章不符）時不載入、不修改記憶體中的數據"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.bin')
+        csv_path = data_file(directory)
+        history, devices = filled()
+        save_snapshot(path, history, devices, storage_signature([csv_path]))
+        with open(csv_path, 'a', encoding='utf-8') as f:
+            f.write('2025-01-01 12:00:01,關,21.0,50.0\n')
+
+        restored, restored_devices = SensorRingBuffer(CAPACITY), DeviceRegistry(CAPACITY)
+        assert not load_snapshot(path, restored, restored_devices, storage_signature([csv_path]))
+        assert len(restored) == 0 and len(restored_devices) == 0
+        assert not os.path.exists(path)
+
+
+def test_corrupt_snapshot():
+    """內容損壞（CRC 不符）或長度不足時拋出 ValueError，檔案仍然被刪除"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.bin')
+        history, devices = filled()
+        for corrupt in ('crc', 'short'):
+            save_snapshot(path, history, devices, None)
+            with open(path, 'r+b') as f:
+                if corrupt == 'crc':
+                    f.seek(-1, os.SEEK_END)
+                    f.write(b'\xff')
+                else:
+                    f.truncate(HEADER.size - 1)
+            restored = SensorRingBuffer(CAPACITY)
+            try:
+                load_snapshot(path, restored, DeviceRegistry(CAPACITY), None)
+            except ValueError:
+                assert len(restored) == 0
+                assert not os.path.exists(path)
+                continue
+            raise AssertionError(f"應該拋出 ValueError: {corrupt}")
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試熱啟動快照")
+    print("=" * 70)
+    for test in (test_round_trip, test_signature_mismatch, test_corrupt_snapshot):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+測試 storage.py 的四種儲存引擎（csv / segment / partitioned / sqlite）
+寫入同一組數據後，時間範圍查詢、最新 N 筆、分批匯出與重新開啟的結果都必須一致
+
+執行方式:
+    uv run python test_storage.py
+    uv run pytest test_storage.py
+"""
+
+import os
+import tempfile
+
+from ring_buffer import parse_timestamp
+from storage import create_storage
+
+ENGINES = ('csv', 'segment', 'partitioned', 'sqlite')
+# 跨過午夜，partitioned 引擎會分成兩天的分割檔
+BASE = int(parse_timestamp('2025-01-01 23:59:30'))
+COUNT = 60
+DEVICES = ('pico-a', 'pico-b')
+
+
+def open_storage(engine, directory):
+    return create_storage(
+        engine,
+        csv_path=os.path.join(directory, 'sensor_data.csv'),
+        segment_dir=os.path.join(directory, 'segments'),
+        partition_dir=os.path.join(directory, 'partitions'),
+        # 測試數據的日期較舊，不壓縮也不刪除
+        partition_options={'compress_after_days': 0, 'retention_days': 0},
+        sqlite_path=os.path.join(directory, 'sensor_data.db'),
+        wal_path=os.path.join(directory, 'sensor_data.wal'),
+        batch_rows=7
+    )
+
+
+def filled(engine, directory):
+    """寫入 COUNT 筆（每秒一筆，兩台裝置輪流，溫度等於序號）後關閉再重新開啟"""
+    storage = open_storage(engine, directory).start()
+    for i in range(COUNT):
+        storage.append(BASE + i, float(i), 50.0, '開' if i % 2 else '關', DEVICES[i % 2])
+    storage.close()
+    return open_storage(engine, directory)
+
+
+def temperatures(rows):
+    return [row[1] for row in rows]
+
+
+def each_engine(check):
+    for engine in ENGINES:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = filled(engine, directory)
+            try:
+                check(storage)
+            finally:
+                storage.close()
+
+
+def test_range_query():
+    """時間範圍查詢包含兩端，跨過午夜的結果由舊到新"""
+    def check(storage):
+        rows = storage.query(BASE + 25, BASE + 35)
+        assert temperatures(rows) == [float(i) for i in range(25, 36)], storage.name
+        assert rows[0] == (BASE + 25, 25.0, 50.0, '開')
+        assert len(storage.query()) == COUNT
+        assert storage.query(BASE + COUNT) == []
+    each_engine(check)
+
+
+def test_limit_and_newest():
+    """limit 預設取最舊的筆數，newest=True 時取最新的筆數（仍然由舊到新）"""
+    def check(storage):
+        assert temperatures(storage.query(BASE + 10, limit=3)) == [10.0, 11.0, 12.0], storage.name
+        assert temperatures(storage.query(None, BASE + 40, limit=3, newest=True)) == [38.0, 39.0, 40.0]
+        assert temperatures(storage.load_recent(4)) == [56.0, 57.0, 58.0, 59.0]
+    each_engine(check)
+
+
+def test_device_query():
+    """支援 device_queries 的引擎只回傳指定裝置的數據"""
+    def check(storage):
+        if not storage.device_queries:
+            return
+        rows = storage.query(BASE + 20, BASE + 40, device='pico-b')
+        assert temperatures(rows) == [float(i) for i in range(21, 40, 2)], storage.name
+        rows = storage.query(limit=2, newest=True, device='pico-a')
+        assert temperatures(rows) == [56.0, 58.0]
+    each_engine(check)
+
+
+def test_iter_chunks():
+    """分批匯出的每批不超過 chunk_rows 筆，合起來與範圍查詢相同"""
+    def check(storage):
+        chunks = [chunk for chunk in storage.iter_chunks(BASE + 5, BASE + 50, chunk_rows=8) if chunk]
+        assert all(len(chunk) <= 8 for chunk in chunks), storage.name
+        assert [row for chunk in chunks for row in chunk] == storage.query(BASE + 5, BASE + 50)
+    each_engine(check)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試儲存引擎")
+    print("=" * 70)
+    for test in (test_range_query, test_limit_and_newest, test_device_query, test_iter_chunks):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+測試 wal.py 的預寫日誌與 CSV 引擎的斷電修復（csv_writer.CsvBatchWriter.recover）
+
+執行方式:
+    uv run python test_wal.py
+    uv run pytest test_wal.py
+"""
+
+import os
+import tempfile
+
+from csv_reader import read_csv_range, CSV_FIELDNAMES
+from csv_writer import CsvBatchWriter
+from wal import WriteAheadLog, FILE_HEADER, RECORD_HEADER
+
+
+def row(i):
+    return {'時間戳記': f'2025-01-01 12:00:{i:02d}', '電燈狀態': '開',
+            '溫度': 20.0 + i, '濕度': 50.0}
+
+
+def test_recover_records():
+    """正常寫入的紀錄全部讀回，checkpoint 之後日誌清空"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test.wal')
+        wal = WriteAheadLog(path)
+        assert wal.recover() == (None, [])
+        wal.checkpoint(0)
+        wal.append(b'first')
+        wal.append(b'second')
+        wal.sync()
+        wal.close()
+
+        wal = WriteAheadLog(path)
+        assert wal.recover() == (0, [b'first', b'second'])
+        wal.checkpoint(123)
+        wal.close()
+        assert WriteAheadLog(path).recover() == (123, [])
+
+
+def test_torn_and_corrupt_records():
+    """寫到一半的紀錄與 CRC 不符的紀錄連同之後的內容一起截斷"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test.wal')
+        wal = WriteAheadLog(path)
+        wal.recover()
+        wal.checkpoint(0)
+        for payload in (b'a' * 10, b'b' * 10, b'c' * 10):
+            wal.append(payload)
+        wal.sync()
+        wal.close()
+        full_size = os.path.getsize(path)
+
+        # 最後一筆只寫了一半
+        with open(path, 'r+b') as f:
+            f.truncate(full_size - 4)
+        wal = WriteAheadLog(path)
+        assert wal.recover()[1] == [b'a' * 10, b'b' * 10]
+        assert wal.truncated == RECORD_HEADER.size + 10 - 4
+        wal.close()
+
+        # 第一筆的內容損壞（CRC 不符）：之後的紀錄都不能相信
+        with open(path, 'r+b') as f:
+            f.seek(FILE_HEADER.size + RECORD_HEADER.size)
+            f.write(b'x')
+        wal = WriteAheadLog(path)
+        assert wal.recover()[1] == []
+        wal.close()
+        assert os.path.getsize(path) == FILE_HEADER.size
+
+
+def test_csv_recovery():
+    """CSV 截斷到 checkpoint（去掉斷電留下的半行），再重做日誌中完整的數據"""
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'sensor_data.csv')
+        wal_path = os.path.join(directory, 'sensor_data.wal')
+        writer = CsvBatchWriter(csv_path, CSV_FIELDNAMES, wal_path=wal_path)
+        assert writer.recover() == 0
+        writer.wal.close()
+
+        # 模擬斷電：兩批已寫入日誌並同步，CSV 只留下半行
+        wal = WriteAheadLog(wal_path)
+        wal.recover()
+        wal.append(writer._encode([row(0), row(1)]))
+        wal.append(writer._encode([row(2)]))
+        wal.sync()
+        wal.close()
+        with open(csv_path, 'ab') as f:
+            f.write(writer._encode([row(0)])[:12])
+
+        writer = CsvBatchWriter(csv_path, CSV_FIELDNAMES, wal_path=wal_path)
+        assert writer.recover() == 3
+        writer.wal.close()
+        rows = read_csv_range(csv_path, CSV_FIELDNAMES)
+        assert [r[2] for r in rows] == ['20.0', '21.0', '22.0']
+
+        # 修復後日誌已 checkpoint，再次啟動不會重做
+        writer = CsvBatchWriter(csv_path, CSV_FIELDNAMES, wal_path=wal_path)
+        assert writer.recover() == 0
+        writer.wal.close()
+        assert len(read_csv_range(csv_path, CSV_FIELDNAMES)) == 3
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("🧪 測試預寫日誌")
+    print("=" * 70)
+    for test in (test_recover_records, test_torn_and_corrupt_records, test_csv_recovery):
+        test()
+        print(f"✅ {test.__name__}: {test.__doc__}")
+    print("\n🎉 全部通過！")
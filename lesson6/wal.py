@@ -0,0 +1,132 @@
+"""
+預寫日誌（Write-Ahead Log）
+每批數據先附加到日誌並以一次 fsync 同步，主檔案只需要 flush；
+定期 checkpoint 時才 fsync 主檔案並清空日誌。斷電後以日誌中完整的紀錄重做，
+寫到一半的紀錄（長度不足或 CRC 不符）連同之後的內容一起截斷
+
+檔案格式:
+    標頭 16 bytes: magic 'PICOWAL1', checkpoint（主檔案已同步到儲存裝置的位元組數）
+    紀錄: 長度 (uint32), CRC32 (uint32), 內容
+"""
+
+import os
+import struct
+import zlib
+
+MAGIC = b'PICOWAL1'
+FILE_HEADER = struct.Struct('<8sQ')
+RECORD_HEADER = struct.Struct('<II')
+# 單筆紀錄的最大長度（超過視為損壞）
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+
+
+def _fsync_directory(path):
+    """讓檔案改名（os.replace）也同步到儲存裝置"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    長度前綴 + CRC32 的預寫日誌
+
+    使用順序: recover() → append() / sync() → checkpoint() → close()
+
+    Args:
+        path: 日誌檔案路徑
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoint_position = None
+        self.truncated = 0
+        self._file = None
+
+    @property
+    def size(self):
+        """日誌目前的位元組數"""
+        return self._file.tell() if self._file else 0
+
+    def recover(self):
+        """
+        讀取日誌中所有完整的紀錄，截斷損壞的尾端並開啟以供附加
+
+        Returns:
+            tuple: (checkpoint 位置（沒有日誌檔時為 None）, 紀錄內容 bytes 的列表)
+        """
+        records = []
+        if not os.path.exists(self.path):
+            return None, records
+        with open(self.path, 'r+b') as f:
+            header = f.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size:
+                # 建立日誌時就斷電，沒有任何紀錄
+                return None, records
+            magic, checkpoint = FILE_HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"不是有效的預寫日誌: {self.path}")
+            valid_end = f.tell()
+            while True:
+                record_header = f.read(RECORD_HEADER.size)
+                if len(record_header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(record_header)
+                if length > MAX_RECORD_SIZE:
+                    break
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                records.append(payload)
+                valid_end = f.tell()
+            file_end = f.seek(0, os.SEEK_END)
+            if file_end > valid_end:
+                self.truncated = file_end - valid_end
+                f.truncate(valid_end)
+                f.flush()
+                os.fsync(f.fileno())
+        self.checkpoint_position = checkpoint
+        self._file = open(self.path, 'ab')
+        return checkpoint, records
+
+    def append(self, payload):
+        """附加一筆紀錄（寫入緩衝，sync 時才同步）"""
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+
+    def sync(self, fsync=True):
+        """把已附加的紀錄交給作業系統（fsync=True 時同步到儲存裝置）"""
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    def checkpoint(self, position):
+        """
+        主檔案已同步到 position 位元組，清空日誌
+
+        先寫好只有標頭的新檔案再以 os.replace 取代，任何時間點斷電
+        都只會看到舊的日誌（可重做）或新的空日誌。
+
+        Args:
+            position: 主檔案目前（已 fsync）的位元組數
+        """
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(MAGIC, position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_directory(self.path)
+        self.checkpoint_position = position
+        self._file = open(self.path, 'ab')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None